@@ -0,0 +1,122 @@
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from src.core.database import PaymentDatabase
+from src.core.models import Payment
+
+# Usage: python bench_database.py [sizes...]   e.g. python bench_database.py 100000 1000000
+DEFAULT_SIZES = [100_000, 1_000_000]
+USERS = 5_000
+STATUSES = ["success", "cancelled_by_user", "failed_initialization", "cancelled", "pending"]
+
+
+def make_payments(count):
+    """Builds synthetic payment records shaped like the ones the bot writes."""
+    rnd = random.Random(42)
+    start = datetime.now() - timedelta(days=365)
+    payments = []
+    for i in range(count):
+        created = (start + timedelta(seconds=i * 30)).isoformat()
+        # Keep the pending set realistic: only the newest records are still pending
+        status = "pending" if i > count - 50 else rnd.choice(STATUSES[:-1])
+        payments.append({
+            "id": f"pay_{i}_{rnd.randrange(USERS)}",
+            "user_id": rnd.randrange(USERS),
+            "status": status,
+            "url": f"https://sociabuzz.com/payment/x/{i}",
+            "method": rnd.choice(["qris", "gopay", "bca"]),
+            "amount": rnd.randrange(1_000, 500_000),
+            "message": "Support",
+            "donor_name": "Supporter",
+            "created_at": created,
+            "updated_at": created,
+            "details": {}
+        })
+    return payments
+
+
+def make_database(payments):
+    """Creates a PaymentDatabase over the given records without touching the disk."""
+    path = os.path.join(tempfile.mkdtemp(), "bench_history.json")
+    db = PaymentDatabase(path)
+    db.data["payments"] = [Payment.from_dict(p) for p in payments]
+    db._rebuild_indexes()
+    return db
+
+
+# --- Linear scans, as PaymentDatabase worked before the indexes ---
+
+def linear_get_payment(payments, payment_id):
+    for p in payments:
+        if p["id"] == payment_id:
+            return p
+    return None
+
+
+def linear_get_user_history(payments, user_id, limit=10):
+    user_payments = [p for p in payments if p["user_id"] == user_id]
+    user_payments.sort(key=lambda x: x["created_at"], reverse=True)
+    return user_payments[:limit]
+
+
+def linear_history_page(payments, user_id, page, page_size=10):
+    # The bot used to load the whole history and slice one page out of it
+    history = linear_get_user_history(payments, user_id, limit=1000)
+    return history[(page - 1) * page_size:page * page_size]
+
+
+def linear_get_user_success_total(payments, user_id):
+    total = 0
+    for p in payments:
+        if p["user_id"] == user_id and p["status"] == "success":
+            total += float(p["amount"])
+    return total
+
+
+def linear_get_pending(payments):
+    return [p for p in payments if p["status"] == "pending"]
+
+
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(size):
+    print(f"\n=== {size:,} payments ===")
+    payments = make_payments(size)
+
+    start = time.perf_counter()
+    db = make_database(payments)
+    print(f"Index build: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    rnd = random.Random(7)
+    sample = rnd.choice(payments)
+    user_id = sample["user_id"]
+    cursor = db.get_user_history_page(user_id)["next_cursor"]
+
+    cases = [
+        ("get_payment", lambda: linear_get_payment(payments, sample["id"]), lambda: db.get_payment(sample["id"])),
+        ("get_user_history", lambda: linear_get_user_history(payments, user_id), lambda: db.get_user_history(user_id)),
+        ("history page 2", lambda: linear_history_page(payments, user_id, 2), lambda: db.get_user_history_page(user_id, cursor)),
+        ("get_user_success_total", lambda: linear_get_user_success_total(payments, user_id), lambda: db.get_user_success_total(user_id)),
+        ("pending scan", lambda: linear_get_pending(payments), lambda: db.get_pending_payments()),
+    ]
+
+    print(f"{'operation':<24} {'linear (ms)':>12} {'indexed (ms)':>13} {'speedup':>10}")
+    for name, linear, indexed in cases:
+        linear_ms = timeit(linear, 3)
+        indexed_ms = timeit(indexed, 200)
+        speedup = linear_ms / indexed_ms if indexed_ms else float("inf")
+        print(f"{name:<24} {linear_ms:>12.3f} {indexed_ms:>13.4f} {speedup:>9.0f}x")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    for size in sizes:
+        run(size)
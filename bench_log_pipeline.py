@@ -0,0 +1,77 @@
+import contextlib
+import logging
+import os
+import sys
+import tempfile
+import time
+from src.core.log_pipeline import LogPipeline, get_logger
+
+# Usage: python bench_log_pipeline.py [checks]
+# Caller-side cost of the per-check status log line, as the payment monitor pays it:
+#   print          the old [DEBUG_FLOW] print, to a line-buffered file like a console or
+#                  PYTHONUNBUFFERED stdout (one write per line)
+#   file handler   the old APIDebugger logger: synchronous FileHandler, f-string message
+#   disabled       LogPipeline with the category off
+#   sampled        LogPipeline, category on, 1 in 10 debug records kept
+#   full           LogPipeline, category on, every record queued
+# "drain" is the time the writer thread still needed after the last call.
+DEFAULT_ARGS = [100000]
+
+
+def bench_print(checks, tmp):
+    with open(os.path.join(tmp, "stdout.txt"), "w", buffering=1, encoding="utf-8") as out, \
+            contextlib.redirect_stdout(out):
+        start = time.perf_counter()
+        for i in range(checks):
+            print(f"[DEBUG_FLOW] [API] Checking status... ID=tok-{i} (Token), Method=gopay")
+        return time.perf_counter() - start, 0.0
+
+
+def bench_file_handler(checks, tmp):
+    logger = logging.getLogger("bench_file_handler")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = logging.FileHandler(os.path.join(tmp, "api_debug.log"), encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    start = time.perf_counter()
+    for i in range(checks):
+        logger.debug(f"Checking status... ID=tok-{i} (Token), Method=gopay")
+    elapsed = time.perf_counter() - start
+    logger.removeHandler(handler)
+    handler.close()
+    return elapsed, 0.0
+
+
+def bench_pipeline(checks, tmp, root, categories, sample_rates):
+    pipeline = LogPipeline(os.path.join(tmp, f"{root}.jsonl"), categories=categories, sample_rates=sample_rates,
+                           queue_size=checks + 1, root=root).start()
+    log = get_logger("status", root)
+    start = time.perf_counter()
+    for i in range(checks):
+        log.debug("check by %s id=%s method=%s", "Token", f"tok-{i}", "gopay")
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    pipeline.stop()
+    return elapsed, time.perf_counter() - start
+
+
+def main(checks):
+    print(f"{checks} status check log lines")
+    print(f"{'variant':<14} {'per call':>10} {'total':>9} {'drain':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        variants = [
+            ("print", lambda: bench_print(checks, tmp)),
+            ("file handler", lambda: bench_file_handler(checks, tmp)),
+            ("disabled", lambda: bench_pipeline(checks, tmp, "bench_disabled", (), None)),
+            ("sampled", lambda: bench_pipeline(checks, tmp, "bench_sampled", ("status",), {"status": 0.1})),
+            ("full", lambda: bench_pipeline(checks, tmp, "bench_full", ("status",), None)),
+        ]
+        for name, run in variants:
+            elapsed, drain = run()
+            print(f"{name:<14} {elapsed / checks * 1e6:>8.2f}us {elapsed:>8.3f}s {drain:>8.3f}s")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]] + DEFAULT_ARGS[len(sys.argv) - 1:]
+    main(*args)
@@ -0,0 +1,41 @@
+import gc
+import sys
+import tracemalloc
+from bench_database import make_payments
+from src.core.models import Payment
+from src.core.serializer import dumps_json, loads_json
+
+# Usage: python bench_memory.py [count]   e.g. python bench_memory.py 1000000
+DEFAULT_COUNT = 1_000_000
+
+
+def traced_bytes():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def run(count):
+    print(f"=== {count:,} payments ===")
+    # Start from serialized bytes so both representations own freshly parsed strings, as after a load
+    payload = dumps_json({"payments": make_payments(count)})
+    gc.collect()
+
+    tracemalloc.start()
+    baseline = traced_bytes()
+    records = loads_json(payload)["payments"]
+    dict_bytes = traced_bytes() - baseline
+
+    payments = [Payment.from_dict(r) for r in records]
+    del records
+    payment_bytes = traced_bytes() - baseline
+    tracemalloc.stop()
+
+    print(f"{'representation':<16} {'total (MB)':>11} {'bytes/record':>13}")
+    print(f"{'dict':<16} {dict_bytes / 1024 / 1024:>11.1f} {dict_bytes / count:>13.0f}")
+    print(f"{'Payment':<16} {payment_bytes / 1024 / 1024:>11.1f} {payment_bytes / count:>13.0f}")
+    print(f"Payment objects alone: {sys.getsizeof(payments[0])} bytes, details dict: {sys.getsizeof(payments[0].details)} bytes")
+    print(f"Saved {(1 - payment_bytes / dict_bytes) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT)
@@ -0,0 +1,76 @@
+import asyncio
+import statistics
+import sys
+import time
+import requests
+from src.core.http_client import aclose_clients, get_async_client
+from src.core.midtrans import MidtransStatusClient
+from stub_snap_server import StubSnapServer
+
+# Usage: python bench_midtrans_status.py [payments] [rounds] [status latency ms] [pay latency ms]
+# Simulates the payment monitor polling Midtrans-backed payments against the local stub Snap
+# server: the old POST /pay probe versus MidtransStatusClient. A third of the payments settles
+# after the first round and a third expires after the second. The latencies are the stub's
+# simulated server time; with 0 only the client and transport cost is measured.
+DEFAULT_ARGS = [30, 10, 0, 0]
+
+
+async def legacy_check(client, base_url, token):
+    """The request check_payment_status used to send: a charge for the e-wallet."""
+    response = await client.post(f"{base_url}/snap/v1/transactions/{token}/pay", json={"payment_type": "gopay"},
+                                 headers={"Accept": "application/json"})
+    data = response.json() if response.status_code == 200 else None
+    return data.get("transaction_status") if data else None
+
+
+async def status_check(midtrans, token):
+    result = await midtrans.get_status(token)
+    return result["status"] if result else None
+
+
+async def simulate(stub, name, check, payments, rounds):
+    tokens = [f"bench-{name}-{i}" for i in range(payments)]
+    for token in tokens:
+        stub.set_status(token, "pending")
+    latencies = []
+    for round_no in range(rounds):
+        if round_no == 1:
+            for token in tokens[:payments // 3]:
+                stub.set_status(token, "settlement")
+        if round_no == 2:
+            for token in tokens[payments // 3:2 * payments // 3]:
+                stub.set_status(token, "expire")
+
+        async def timed(token):
+            start = time.perf_counter()
+            await check(token)
+            latencies.append(time.perf_counter() - start)
+        # The monitor checks five payments at a time
+        for i in range(0, payments, 5):
+            await asyncio.gather(*(timed(token) for token in tokens[i:i + 5]))
+    return latencies
+
+
+async def main(payments, rounds, status_ms, pay_ms):
+    stub = StubSnapServer(status_latency=status_ms / 1000, pay_latency=pay_ms / 1000).start()
+    session = requests.Session()
+    client = get_async_client(session)
+    midtrans = MidtransStatusClient(session, base_url=stub.base_url)
+    print(f"=== {payments} payments x {rounds} monitor rounds, stub latency status={status_ms}ms pay={pay_ms}ms ===")
+    print(f"{'probe':<10} {'requests':>9} {'mean (ms)':>10} {'p95 (ms)':>9} {'total (s)':>10}")
+    for name, check in (("legacy", lambda t: legacy_check(client, stub.base_url, t)),
+                        ("status", lambda t: status_check(midtrans, t))):
+        before = dict(stub.requests)
+        start = time.perf_counter()
+        latencies = await simulate(stub, name, check, payments, rounds)
+        total = time.perf_counter() - start
+        sent = sum(stub.requests.values()) - sum(before.values())
+        p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1]
+        print(f"{name:<10} {sent:>9} {statistics.mean(latencies) * 1000:>10.2f} {p95 * 1000:>9.2f} {total:>10.2f}")
+    await aclose_clients()
+    stub.stop()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]] + DEFAULT_ARGS[len(sys.argv) - 1:]
+    asyncio.run(main(*args))
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import time
+from bench_database import make_payments
+from src.core.database import PaymentDatabase
+from src.core.serializer import SERIALIZERS, decode, encode, msgpack, orjson
+
+# Usage: python bench_serializer.py [sizes...]   e.g. python bench_serializer.py 10000 100000
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def available_formats():
+    formats = ["json", "json-compact"]
+    if msgpack is not None:
+        formats.append("msgpack")
+    else:
+        print("msgpack is not installed, skipping it (pip install msgpack)")
+    return [name for name in formats if name in SERIALIZERS]
+
+
+def run(size, directory):
+    print(f"\n=== {size:,} payments ===")
+    data = {"payments": make_payments(size), "user_settings": {}, "global_settings": {}, "archived_stats": {}}
+
+    print(f"{'format':<14} {'size (MB)':>10} {'save (ms)':>10} {'load (ms)':>10} {'open db (ms)':>13}")
+    for name in available_formats():
+        path = os.path.join(directory, f"bench_{name}.db")
+
+        start = time.perf_counter()
+        with open(path, 'wb') as f:
+            f.write(encode(data, name))
+        save_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            decode(f.read())
+        load_ms = (time.perf_counter() - start) * 1000
+
+        # Cold start as the bot sees it: parse plus index rebuild
+        start = time.perf_counter()
+        PaymentDatabase(path, serializer=name)
+        open_ms = (time.perf_counter() - start) * 1000
+
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"{name:<14} {size_mb:>10.1f} {save_ms:>10.0f} {load_ms:>10.0f} {open_ms:>13.0f}")
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    print(f"orjson: {'yes' if orjson is not None else 'no'}, msgpack: {'yes' if msgpack is not None else 'no'}")
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    directory = tempfile.mkdtemp()
+    for size in sizes:
+        run(size, directory)
@@ -0,0 +1,86 @@
+import sys
+import time
+from src.core.status_classifier import (
+    FALSE_POSITIVE_TRIGGERS, PENDING_MARKERS, SUCCESS_MARKERS, default_classifier
+)
+from test_status_classifier import load_corpus
+
+# Usage: python bench_status_classifier.py [filler KB...]   e.g. python bench_status_classifier.py 0 100 500
+# Each corpus page is also measured with that much markup added, half before its content (inline
+# CSS, navigation) and half after it (footer scripts), as on real payment pages.
+# "streamed" is the monitor's path: the page arrives in chunks and reading stops at the verdict.
+# The classifier is not faster per page than the legacy first-hit scan (it has to find the earliest
+# marker); "KB read" shows what the stream saves by stopping early.
+DEFAULT_FILLER_KB = [0, 100]
+CHUNK_CHARS = 16 * 1024
+FILLER_LINE = '<div class="row"><a href="https://sociabuzz.com/explore">Explore</a><span>kreator</span></div>\n'
+
+
+def legacy_classify(text):
+    """The keyword scan check_payment_status used before the classifier, for comparison."""
+    text_content = text.lower()
+    match_strong = next((x for x in SUCCESS_MARKERS if x in text_content), None)
+    if match_strong:
+        idx = text_content.find(match_strong)
+        preceding_text = text_content[max(0, idx - 20):idx]
+        if not any(trigger in preceding_text for trigger in FALSE_POSITIVE_TRIGGERS):
+            return "settlement", match_strong
+    match_pending = next((x for x in PENDING_MARKERS if x in text_content), None)
+    if match_pending:
+        return "pending", match_pending
+    return "unknown", None
+
+
+def compiled_classify(text):
+    verdict = default_classifier.classify(text)
+    return verdict.status, verdict.marker
+
+
+def streamed_classify(text):
+    status, marker, _ = streamed_read(text)
+    return status, marker
+
+
+def streamed_read(text):
+    """(status, marker, characters read before the verdict) for a page read in CHUNK_CHARS chunks."""
+    stream = default_classifier.stream()
+    for i in range(0, len(text), CHUNK_CHARS):
+        verdict = stream.feed(text[i:i + CHUNK_CHARS])
+        if verdict:
+            return verdict.status, verdict.marker, min(i + CHUNK_CHARS, len(text))
+    verdict = stream.finish()
+    return verdict.status, verdict.marker, len(text)
+
+
+def inflate(text, filler_kb):
+    if not filler_kb:
+        return text
+    filler = FILLER_LINE * (filler_kb * 1024 // len(FILLER_LINE) // 2)
+    head, body = text.find("<main"), text.rfind("</body>")
+    if head == -1 or body == -1:
+        return filler + text + filler
+    return text[:head] + filler + text[head:body] + filler + text[body:]
+
+
+def run(filler_kb):
+    pages = [(name, inflate(text, filler_kb), label) for name, text, label in load_corpus()]
+    repeat = max(20, 20_000 // (filler_kb + 1))
+    print(f"\n=== {len(pages)} corpus pages + {filler_kb} KB filler, {repeat} rounds ===")
+    page_kb = sum(len(text) for _, text, _ in pages) / len(pages) / 1024
+    read_kb = sum(streamed_read(text)[2] for _, text, _ in pages) / len(pages) / 1024
+    print(f"{'engine':<10} {'us/page':>10} {'accuracy':>10} {'KB read':>10}")
+    for engine, classify in (("legacy", legacy_classify), ("compiled", compiled_classify), ("streamed", streamed_classify)):
+        correct = sum(classify(text) == (label["status"], label["marker"]) for _, text, label in pages)
+        read = read_kb if engine == "streamed" else page_kb
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for _, text, _ in pages:
+                classify(text)
+        per_page = (time.perf_counter() - start) / (repeat * len(pages)) * 1e6
+        print(f"{engine:<10} {per_page:>10.1f} {correct:>6}/{len(pages)} {read:>10.1f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_FILLER_KB
+    for size in sizes:
+        run(size)
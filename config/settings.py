@@ -11,6 +11,46 @@ class Config:
     SOCIABUZZ_PASSWORD = os.getenv("SOCIABUZZ_PASSWORD")
     REQUIRED_CHANNEL_USERNAME = os.getenv("REQUIRED_CHANNEL_USERNAME")
 
+    # Payment database storage ("json", "journal" or "sqlite")
+    DB_ENGINE = os.getenv("DB_ENGINE", "json").lower()
+    DB_JSON_FILE = os.getenv("DB_JSON_FILE", "payment_history.json")
+    DB_SQLITE_FILE = os.getenv("DB_SQLITE_FILE", "payment_history.db")
+    # Journal size that triggers a snapshot rewrite in "journal" mode
+    DB_JOURNAL_COMPACT_BYTES = int(os.getenv("DB_JOURNAL_COMPACT_BYTES", 1024 * 1024))
+    # Batch JSON store writes for this many milliseconds (0 = write on every change)
+    DB_WRITE_BEHIND_MS = int(os.getenv("DB_WRITE_BEHIND_MS", 50))
+    # Move finished payments older than this many days to the archive (0 = keep everything hot)
+    DB_ARCHIVE_AFTER_DAYS = int(os.getenv("DB_ARCHIVE_AFTER_DAYS", 0))
+    DB_ARCHIVE_DIR = os.getenv("DB_ARCHIVE_DIR", "payment_archive")
+    # Snapshot format of the JSON store: "json" (pretty, legacy), "json-compact" or "msgpack" (pip install msgpack)
+    DB_FORMAT = os.getenv("DB_FORMAT", "json").lower()
+    # Lock the JSON store so the bot, the CLI and other workers can use it at the same time.
+    # Opt-in: it turns write-behind off, every change is then written and fsynced on the spot
+    DB_MULTI_PROCESS = os.getenv("DB_MULTI_PROCESS", "false").lower() == "true"
+    # User/global bot settings, kept apart from the payment history (JSON engines only)
+    DB_SETTINGS_FILE = os.getenv("DB_SETTINGS_FILE", "bot_settings.json")
+    # A repeated payment method selection within this many seconds reuses the first result
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 600))
+    # A payment status check result is reused for this many seconds (repeated "Cek Status" presses)
+    STATUS_CACHE_TTL_SECONDS = int(os.getenv("STATUS_CACHE_TTL_SECONDS", 5))
+    # How long a scraped SociaBuzz CSRF token is reused before fetching the page again
+    CSRF_TOKEN_TTL_SECONDS = int(os.getenv("CSRF_TOKEN_TTL_SECONDS", 900))
+    # Keep-alive connections opened to SociaBuzz and Midtrans at bot startup (0 = off)
+    HTTP_PREWARM_CONNECTIONS = int(os.getenv("HTTP_PREWARM_CONNECTIONS", 2))
+    # Upstream request rate limits overriding http_client.RATE_LIMITS, as comma-separated
+    # host.kind=requests_per_second:burst entries, e.g. "sociabuzz.read=2:6,sociabuzz.write=0.5:2"
+    HTTP_RATE_LIMITS = os.getenv("HTTP_RATE_LIMITS", "")
+    # API traffic log (JSON lines), rotated into gzip files at LOG_MAX_BYTES
+    LOG_FILE = os.getenv("LOG_FILE", "api_debug.jsonl")
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 5 * 1024 * 1024))
+    LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", 5))
+    # Log categories written to LOG_FILE (http, status, payment, bot); /debug toggles http
+    LOG_CATEGORIES = [c.strip() for c in os.getenv("LOG_CATEGORIES", "status,payment,bot").split(",") if c.strip()]
+    # Share of each category's debug records kept, e.g. "status=0.1" keeps every 10th status check
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "status=0.1")
+    # Also print log records to stdout
+    LOG_CONSOLE = os.getenv("LOG_CONSOLE", "false").lower() == "true"
+
     @staticmethod
     def validate():
         if not Config.TELEGRAM_BOT_TOKEN or Config.TELEGRAM_BOT_TOKEN == "your_telegram_bot_token_here":
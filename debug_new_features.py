@@ -15,7 +15,7 @@ async def debug_new_features():
     api = APIManager(auth.session)
     
     # Check session
-    if not auth.check_session():
+    if not await auth.check_session_async():
         print("❌ Not logged in. Please login first.")
         return
 
@@ -46,38 +46,40 @@ async def debug_new_features():
     print("⚠️ Skipping real payment creation to avoid spamming.")
     print("🔍 Verifying 'select_payment_method' logic locally...")
     
-    # Mock _get_csrf_token to bypass 404 error
-    api._get_csrf_token = lambda url: "mock_csrf_token_payment"
+    # Mock the CSRF lookup to bypass 404 error
+    async def mock_csrf(url):
+        return "mock_csrf_token_payment"
+    api._get_csrf_token_async = mock_csrf
     
     # We will inspect the internal config map of the class instance if possible, 
     # or just call it and catch the error to see the payload.
     
     # Let's use a mock method to print what it WOULD send.
-    original_post = api.session.post
-    
-    def mock_post(url, data=None, json=None, **kwargs):
+    async def mock_post(page_url, url, payload, as_json=False, **kwargs):
+        payload["sb_token_csrf"] = await api._get_csrf_token_async(page_url)
         print(f"   [MOCK POST] URL: {url}")
-        if json:
-            print(f"   [MOCK POST] JSON: {json}")
-        if data:
-            print(f"   [MOCK POST] DATA: {data}")
+        if as_json:
+            print(f"   [MOCK POST] JSON: {payload}")
+        else:
+            print(f"   [MOCK POST] DATA: {payload}")
             
         class MockResponse:
             status_code = 200
             text = "{}"
+            url = ""
             def json(self): return {}
             
         return MockResponse()
     
-    api.session.post = mock_post
+    api._post_with_csrf_async = mock_post
     
     # Test Bank Mandiri
     print("\n👉 Testing 'mandiri' selection...")
-    api.select_payment_method("https://sociabuzz.com/payment/123", "mandiri")
+    await api.select_payment_method_async("https://sociabuzz.com/payment/123", "mandiri")
     
     # Test Bank BNC
     print("\n👉 Testing 'bnc' selection...")
-    api.select_payment_method("https://sociabuzz.com/payment/123", "bnc")
+    await api.select_payment_method_async("https://sociabuzz.com/payment/123", "bnc")
     
     # 2. Test Withdrawal Payload Format
     print("\n--------------------------------")
@@ -89,7 +91,7 @@ async def debug_new_features():
     # We need to mock _get_csrf_token too because withdraw_funds calls it
     # api._get_csrf_token = lambda url: "mock_csrf_token" # Already mocked above
     
-    api.withdraw_funds("dana", 50000)
+    await api.withdraw_funds_async("dana", 50000)
     
     print("\n--------------------------------")
     print("✅ Debug Complete.")
@@ -8,15 +8,20 @@ import time
 import logging 
 import http.server
 import socketserver
+import shutil
 import requests
 from colorama import init, Fore, Style
 from src.core.auth import AuthManager
+from src.core.http_client import circuit_stats, limiter_stats, pool_stats, response_cache
+from src.core.log_pipeline import log_stats
 
 # Configure logging to silence httpx
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 from src.core.api import APIManager
 from src.core.transactions import TransactionManager
+from src.core.database import (PaymentDatabase, SQLitePaymentDatabase, create_database, parse_export_filters,
+                               write_export, EXPORT_FORMATS)
 from src.bot.telegram_bot import SocialBuzzBot
 from config.settings import Config
 
@@ -32,10 +37,21 @@ def start_health_server():
     
     class HealthCheckHandler(http.server.SimpleHTTPRequestHandler):
         def do_GET(self):
+            if self.path == "/status":
+                # Upstream circuit breakers, rate limiter waits, connection pool usage, polled-page
+                # cache hits and log pipeline counters, for diagnosing slow payments
+                body = json.dumps({"circuits": circuit_stats(), "rate_limits": limiter_stats(),
+                                   "http_pools": pool_stats(), "http_cache": dict(response_cache.stats),
+                                   "logging": log_stats()},
+                                  indent=2).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                body = b"OK"
+                content_type = 'text/plain'
             self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
+            self.send_header('Content-type', content_type)
             self.end_headers()
-            self.wfile.write(b"OK")
+            self.wfile.write(body)
         
         def log_message(self, format, *args):
             pass  # Silence logs
@@ -337,10 +353,112 @@ def run_interactive_menu():
         else:
             print(f"{Fore.RED}Invalid choice. Please try again.")
 
+def import_json_to_sqlite():
+    """One-shot import of the JSON payment history into the SQLite database."""
+    if not os.path.exists(Config.DB_JSON_FILE):
+        print(f"{Fore.RED}{Config.DB_JSON_FILE} not found. Nothing to import.")
+        return
+
+    print(f"{Fore.CYAN}Importing {Config.DB_JSON_FILE} into {Config.DB_SQLITE_FILE}...")
+    db = SQLitePaymentDatabase(Config.DB_SQLITE_FILE)
+    try:
+        count = db.import_from_json(Config.DB_JSON_FILE)
+        print(f"{Fore.GREEN}Imported {count} payments. Set DB_ENGINE=sqlite in .env to use it.")
+    finally:
+        db.close()
+
+def rebuild_user_stats(verify_only=False):
+    """Verifies (and optionally rebuilds) the per-user success rollups from raw payment records."""
+    db = create_database()
+    try:
+        mismatches = db.verify_user_stats()
+        if not mismatches:
+            print(f"{Fore.GREEN}User stats are consistent with the payment records.")
+        else:
+            print(f"{Fore.YELLOW}{len(mismatches)} user(s) have stale stats:")
+            for item in mismatches[:20]:
+                print(f"  {item['user_id']}: stored={item['actual']} expected={item['expected']}")
+
+        if not verify_only:
+            count = db.rebuild_user_stats()
+            print(f"{Fore.GREEN}Rebuilt stats for {count} user(s).")
+    finally:
+        db.close()
+
+def archive_payments(days=None):
+    """Moves finished payments older than the given number of days into the archive."""
+    db = create_database()
+    try:
+        if not hasattr(db, "archive_terminal"):
+            print(f"{Fore.YELLOW}Archiving is only available for the JSON storage engines.")
+            return
+        days = days if days is not None else (Config.DB_ARCHIVE_AFTER_DAYS or 30)
+        count = db.archive_terminal(older_than_days=days)
+    finally:
+        db.close()
+    print(f"{Fore.GREEN}Archived {count} payment(s) older than {days} day(s) into {db.archive.directory}/.")
+
+def convert_database(target_format):
+    """Rewrites the JSON payment store in another snapshot format, keeping a .bak copy of the old file."""
+    if Config.DB_ENGINE == "sqlite":
+        print(f"{Fore.YELLOW}DB_ENGINE=sqlite does not use snapshot formats.")
+        return
+    try:
+        db = PaymentDatabase(Config.DB_JSON_FILE, journal=Config.DB_ENGINE == "journal",
+                             archive_dir=Config.DB_ARCHIVE_DIR, shared=True, serializer=target_format,
+                             settings_filename=Config.DB_SETTINGS_FILE)
+    except ValueError as e:
+        print(f"{Fore.RED}{e}")
+        return
+
+    old_size = os.path.getsize(Config.DB_JSON_FILE) if os.path.exists(Config.DB_JSON_FILE) else 0
+    if old_size:
+        shutil.copy2(Config.DB_JSON_FILE, f"{Config.DB_JSON_FILE}.bak")
+    db.save_snapshot()
+    db.close()
+    new_size = os.path.getsize(Config.DB_JSON_FILE)
+    print(f"{Fore.GREEN}Converted {len(db.data['payments'])} payments to {target_format}: {old_size:,} -> {new_size:,} bytes.")
+    print(f"{Fore.GREEN}Set DB_FORMAT={target_format} in .env so new writes keep this format.")
+
+def export_payments(args):
+    """
+    Streams the payment history (archive included) to a CSV or JSON Lines file.
+    Usage: --export [csv|jsonl] [output file] [user=ID] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [status=STATUS]
+    """
+    positional = [a for a in args if "=" not in a]
+    fmt = positional[0] if positional else "csv"
+    if fmt not in EXPORT_FORMATS:
+        print(f"{Fore.RED}Unknown export format '{fmt}', expected one of: {', '.join(EXPORT_FORMATS)}")
+        return
+    output = positional[1] if len(positional) > 1 else f"payment_export_{time.strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    try:
+        filters = parse_export_filters([a for a in args if "=" in a])
+    except ValueError as e:
+        print(f"{Fore.RED}{e}")
+        return
+
+    db = create_database()
+    try:
+        with open(output, 'wb') as f:
+            count = write_export(db.iter_payments(**filters), f, fmt)
+    finally:
+        db.close()
+    print(f"{Fore.GREEN}Exported {count} payment(s) to {output} ({os.path.getsize(output):,} bytes).")
+
 def main():
     # Check for arguments to run interactive mode
     if len(sys.argv) > 1 and sys.argv[1] in ['--menu', '-m', 'interactive']:
         run_interactive_menu()
+    elif len(sys.argv) > 1 and sys.argv[1] == '--import-json':
+        import_json_to_sqlite()
+    elif len(sys.argv) > 1 and sys.argv[1] == '--archive':
+        archive_payments(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    elif len(sys.argv) > 1 and sys.argv[1] in ['--rebuild-stats', '--verify-stats']:
+        rebuild_user_stats(verify_only=sys.argv[1] == '--verify-stats')
+    elif len(sys.argv) > 1 and sys.argv[1] == '--convert-db':
+        convert_database(sys.argv[2] if len(sys.argv) > 2 else "msgpack")
+    elif len(sys.argv) > 1 and sys.argv[1] == '--export':
+        export_payments(sys.argv[2:])
     else:
         run_telegram_bot()
 
@@ -358,7 +476,7 @@ def debug_settings_menu():
         print("1. Open Browser for API Monitoring (Sniffing Mode)")
         print("2. Back to Main Menu")
         print("-" * 50)
-        print(f"{Fore.WHITE}Note: API Logging is enabled by default in 'api_debug.log'.")
+        print(f"{Fore.WHITE}Note: API traffic is logged as JSON lines to '{Config.LOG_FILE}'.")
         
         choice = input(f"{Fore.YELLOW}Enter your choice (1-2): ")
         
@@ -6,6 +6,9 @@ from PIL import Image
 import json
 import os
 import re
+import itertools
+import shutil
+import tempfile
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest
@@ -13,7 +16,12 @@ from telegram.ext import Application, ApplicationBuilder, ContextTypes, CommandH
 from src.core.auth import AuthManager
 from src.core.api import APIManager
 from src.core.transactions import TransactionManager
-from src.core.database import PaymentDatabase
+from src.core.database import create_database, parse_export_filters, write_export, EXPORT_FORMATS
+from src.core.idempotency import IdempotencyCache
+from src.core.status_service import StatusService
+from src.core.http_client import aclose_clients, breakers, prewarm
+from src.core.log_pipeline import get_logger
+from src.core.midtrans import SNAP_METHODS, is_snap_token
 from config.settings import Config
 
 # Enable logging
@@ -21,14 +29,26 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
+# Payment flow logs, written by the API log pipeline (see log_pipeline)
+bot_log = get_logger("bot")
+status_log = get_logger("status")
 
 class SocialBuzzBot:
+    # Bot API uploads are capped at 50 MB, larger exports are sent as several files
+    EXPORT_PART_BYTES = 45 * 1024 * 1024
+    # Seconds the "Cek Status" button waits for a SociaBuzz rate limit permit
+    STATUS_PERMIT_TIMEOUT = 3
+
     def __init__(self):
         self.auth = AuthManager()
         self.api = APIManager(self.auth) # Pass AuthManager directly
         self.tm = TransactionManager(self.auth)
-        self.db = PaymentDatabase()
+        self.db = create_database()
         self.monitoring_task = None
+        # (user_id, order_id, method) -> in-flight/finished method selection, see process_payment_selection
+        self.selections = IdempotencyCache(ttl_seconds=Config.IDEMPOTENCY_TTL_SECONDS)
+        # Status checks of the monitor and the "Cek Status" button, deduplicated and cached
+        self.status = StatusService(self.api, ttl_seconds=Config.STATUS_CACHE_TTL_SECONDS)
         
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Delete user's /start message to keep chat clean
@@ -54,7 +74,7 @@ class SocialBuzzBot:
 
     async def _check_single_payment(self, app, payment):
         try:
-            print(f"[DEBUG_FLOW] 🔍 Monitoring payment {payment['id']} ({payment.get('method')})...")
+            status_log.debug("monitoring payment %s (%s)", payment['id'], payment.get('method'))
             method = payment.get('method')
             status_info = None
             
@@ -78,7 +98,7 @@ class SocialBuzzBot:
             
             # Check status for ALL methods (gopay, ovo, qris, banks, etc.)
             # passing both token and url ensures best chance of checking
-            status_info = self.api.check_payment_status(token, method, url)
+            status_info = await self.status.check(token, method, url)
             
             if status_info:
                 status_code = status_info.get('status_code')
@@ -90,6 +110,8 @@ class SocialBuzzBot:
                     
                     # Update DB (merged automatically now)
                     self.db.update_payment_status(payment['id'], "success", status_info)
+                    # Make sure the success is on disk before we tell the user
+                    await self.db.flush()
                     
                     user_id = payment['user_id']
                     
@@ -170,13 +192,18 @@ class SocialBuzzBot:
         except Exception as e:
             print(f"Error checking payment {payment['id']}: {e}")
 
+    @staticmethod
+    def _has_snap_token(payment):
+        """True if the payment's status can be read from Midtrans Snap instead of SociaBuzz."""
+        token = (payment.get('details') or {}).get('token')
+        return payment.get('method') in SNAP_METHODS and is_snap_token(token)
+
     async def monitor_pending_payments(self, app):
         """Background task to check status of pending payments."""
         print("🚀 Background Payment Monitoring Started...")
         
         # Limit concurrency to avoid overloading the system/API
-        # Since we use run_in_executor with default thread pool, 
-        # we shouldn't queue too many tasks at once.
+        # (status checks share one connection pool, no need to queue them all at once)
         semaphore = asyncio.Semaphore(5) 
 
         async def protected_check(payment):
@@ -188,6 +215,14 @@ class SocialBuzzBot:
                 # Reload pending payments every loop to get fresh data
                 pending_payments = self.db.get_pending_payments()
                 
+                # Payments without a Snap token are only checked on SociaBuzz; while it is failing,
+                # skip them this round instead of sending requests that would only fail fast
+                if pending_payments and breakers["sociabuzz"].is_open():
+                    snap_payments = [p for p in pending_payments if self._has_snap_token(p)]
+                    print(f"[DEBUG_MONITOR] SociaBuzz circuit open, skipping "
+                          f"{len(pending_payments) - len(snap_payments)} pending payments this round")
+                    pending_payments = snap_payments
+
                 if pending_payments:
                     print(f"[DEBUG_MONITOR] Checking {len(pending_payments)} pending payments...")
                     
@@ -470,11 +505,7 @@ class SocialBuzzBot:
                 await query.edit_message_text(f"⏳ Memproses pencairan Rp{amount:,} via {method_code.upper()}...".replace(",", "."))
                 
                 # Execute Withdrawal
-                loop = asyncio.get_running_loop()
-                result = await loop.run_in_executor(
-                    None, 
-                    lambda: self.api.withdraw_funds(method_code, amount)
-                )
+                result = await self.api.withdraw_funds_async(method_code, amount)
                 
                 if result.get('status') == 'success':
                     await query.edit_message_text(
@@ -512,7 +543,7 @@ class SocialBuzzBot:
             # Extract method (e.g. pay_gopay, pay_sahabat_sampoerna)
             method = query.data[4:] # Remove 'pay_' prefix
             
-            print(f"[DEBUG_FLOW] 👆 User selected payment method: {method}")
+            bot_log.info("payment method selected", extra={"user_id": query.from_user.id, "method": method})
 
             # Restricted methods (Under Development)
             # User request: OVO, Dana, Ewalet Lainnya Kecuali Gopay Dan Qris
@@ -776,11 +807,8 @@ class SocialBuzzBot:
         if not url and token and len(token) > 30 and '-' in token:
              url = f"https://sociabuzz.com/payment/x/{token}"
         
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(
-            None, 
-            lambda: self.api.check_payment_status(token, method=method, payment_url=url)
-        )
+        # Someone is waiting on this one: rather report no result than queue behind the monitor
+        result = await self.status.check(token, method, url, permit_timeout=self.STATUS_PERMIT_TIMEOUT)
         
         if result:
             status = result.get('status', 'unknown')
@@ -826,7 +854,7 @@ class SocialBuzzBot:
             
             # If BCA and VA not in active, try to fetch it
             if status == "pending" and method == "bca" and not va_number and token and not token.startswith('pay_'):
-                 va_number = await loop.run_in_executor(None, lambda: self.api._get_bca_va_from_snap(token))
+                 va_number = await self.api._get_bca_va_from_snap_async(token)
                  # Save it for next time
                  if va_number and active:
                      active['va_number'] = va_number
@@ -1004,22 +1032,28 @@ class SocialBuzzBot:
         except:
             order_id = f"pay_{int(time.time())}_{user_id}"
 
-        # Save as "initializing" or "pending" immediately so we don't lose it
-        payment_id = self.db.add_payment(
-            user_id=user_id,
-            payment_url=payment_url,
-            method=method,
-            amount=amount,
-            message=msg_content,
-            donor_name=donor,
-            order_id=order_id
-        )
-        
-        # Fetch payment details (token, qr code, etc)
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(
-            None, 
-            lambda: self.api.select_payment_method(payment_url, method)
+        async def select_method():
+            # Save as "initializing" or "pending" immediately so we don't lose it
+            payment_id = self.db.add_payment(
+                user_id=user_id,
+                payment_url=payment_url,
+                method=method,
+                amount=amount,
+                message=msg_content,
+                donor_name=donor,
+                order_id=order_id
+            )
+
+            # Fetch payment details (token, qr code, etc)
+            result = await self.api.select_payment_method_async(payment_url, method)
+            return payment_id, result
+
+        # A double tap on the same button reuses the running (or finished) selection instead of
+        # posting to SociaBuzz again; failed selections are not kept so the user can retry
+        payment_id, result = await self.selections.run(
+            (user_id, order_id, method),
+            select_method,
+            cache_if=lambda r: bool(r[1]) and not r[1].get("error") and r[1].get('status') is not False
         )
         
         # Handle API Error or Failure
@@ -1088,6 +1122,9 @@ class SocialBuzzBot:
                 details['loading_message_id'] = loading_message_id
 
             self.db.update_payment_status(payment_id, "pending", details)
+            # Persist the pending record before handing out payment instructions,
+            # otherwise a restart could lose the payment the monitor has to confirm
+            await self.db.flush()
             
             # ... (Rest of existing UI logic)
             
@@ -1378,7 +1415,7 @@ class SocialBuzzBot:
                 # Try to fetch VA number if we have a token
                 va_number = None
                 if token:
-                    va_number = self.api._get_bca_va_from_snap(token)
+                    va_number = await self.api._get_bca_va_from_snap_async(token)
                 
                 # If we got VA number, display it like other banks
                 if va_number:
@@ -1466,7 +1503,7 @@ class SocialBuzzBot:
              await query.edit_message_text(f"❌ Gagal memproses metode pembayaran.\nDetail: {error_msg}")
 
     async def check_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        is_logged_in = self.auth.check_session()
+        is_logged_in = await self.auth.check_session_async()
         status_text = "✅ *Terhubung*" if is_logged_in else "❌ *Tidak Terhubung*"
         
         details = (
@@ -1508,10 +1545,12 @@ class SocialBuzzBot:
         
         if not data:
             # Fallback to direct fetch if possible
-            if self.auth.check_session():
-                 balance = self.tm.get_balance_info()
-                 history = self.tm.get_history()
-                 pending = self.tm.get_pending_transactions()
+            if await self.auth.check_session_async():
+                 balance, history, pending = await asyncio.gather(
+                     self.tm.get_balance_info_async(),
+                     self.tm.get_history_async(),
+                     self.tm.get_pending_transactions_async()
+                 )
                  data = {
                      "balance_info": balance,
                      "history": history,
@@ -1663,17 +1702,16 @@ class SocialBuzzBot:
         user = update.effective_user
         user_id = user.id
         
-        # Get page number from callback data
-        page = 1
+        # Get page cursor from callback data (an unknown/old numeric value falls back to the first page)
+        cursor = None
         if query.data.startswith('user_transactions_page_'):
-            try:
-                page = int(query.data.split('_')[-1])
-            except ValueError:
-                page = 1
+            cursor = query.data[len('user_transactions_page_'):]
         
-        # Fetch user history from DB
-        # Fetching up to 1000 for pagination
-        history_list = self.db.get_user_history(user_id, limit=1000)
+        # Fetch only the requested page from DB
+        items_per_page = 10
+        history_page = self.db.get_user_history_page(user_id, cursor, items_per_page)
+        current_page_items = history_page["payments"]
+        start_idx = history_page["offset"]
         
         # Calculate totals
         total_spent = self.db.get_user_success_total(user_id)
@@ -1690,19 +1728,11 @@ class SocialBuzzBot:
         )
         
         # Pagination Logic
-        items_per_page = 10
-        total_items = len(history_list)
+        total_items = history_page["total"]
         total_pages = (total_items + items_per_page - 1) // items_per_page
+        page = start_idx // items_per_page + 1
         
-        # Ensure page is within bounds
-        if page < 1: page = 1
-        if page > total_pages and total_pages > 0: page = total_pages
-        
-        start_idx = (page - 1) * items_per_page
-        end_idx = start_idx + items_per_page
-        current_page_items = history_list[start_idx:end_idx]
-        
-        if not history_list:
+        if not current_page_items:
             text += "_Belum ada riwayat transaksi._\n"
         else:
             for i, p in enumerate(current_page_items):
@@ -1738,10 +1768,10 @@ class SocialBuzzBot:
         keyboard = []
         if total_pages > 1:
             nav_buttons = []
-            if page > 1:
-                nav_buttons.append(InlineKeyboardButton("⬅️ Sebelumnya", callback_data=f'user_transactions_page_{page-1}'))
-            if page < total_pages:
-                nav_buttons.append(InlineKeyboardButton("Selanjutnya ➡️", callback_data=f'user_transactions_page_{page+1}'))
+            if history_page["prev_cursor"]:
+                nav_buttons.append(InlineKeyboardButton("⬅️ Sebelumnya", callback_data=f'user_transactions_page_{history_page["prev_cursor"]}'))
+            if history_page["next_cursor"]:
+                nav_buttons.append(InlineKeyboardButton("Selanjutnya ➡️", callback_data=f'user_transactions_page_{history_page["next_cursor"]}'))
             keyboard.append(nav_buttons)
             
         keyboard.append([InlineKeyboardButton("🔙 Kembali", callback_data='back_to_menu')])
@@ -2030,7 +2060,7 @@ class SocialBuzzBot:
             await update.message.reply_text("❌ Mohon masukkan angka yang valid.")
 
     async def create_payment_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        print(f"\n[DEBUG_FLOW] 🚀 Command /pay received from user {update.effective_user.id}")
+        bot_log.info("/pay received", extra={"user_id": update.effective_user.id})
         
         # Check for existing active payment
         if 'active_payment' in context.user_data:
@@ -2084,15 +2114,14 @@ class SocialBuzzBot:
                     pass
             
         if amount is None or username is None:
-             print(f"[DEBUG_FLOW] ❌ Invalid /pay format. Args: {args}")
+             bot_log.info("/pay invalid format", extra={"argv": list(args)})
              if default_target:
                  await update.message.reply_text("Format salah.\n\nDengan default target:\n/pay <jumlah> [pesan]\n\nManual:\n/pay <username> <jumlah> [pesan]")
              else:
                  await update.message.reply_text("Penggunaan: /pay <username> <jumlah> [pesan]\nJumlah harus berupa angka.")
              return
 
-        print(f"[DEBUG_FLOW] ✅ Payment request valid: Username={username}, Amount={amount}, Message={message}")
-        print(f"[DEBUG_FLOW] 🔄 Calling API create_support_payment...")
+        bot_log.info("/pay valid, creating payment", extra={"username": username, "amount": amount, "note": message})
 
         await self._execute_payment_creation(update, context, username, amount, message)
 
@@ -2100,13 +2129,8 @@ class SocialBuzzBot:
         # loading_msg = await update.message.reply_text(f"⏳ Membuat link pembayaran untuk {username} (Rp{amount})...")
         loading_message_id = None
         
-        # We need to run blocking code in a separate thread
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(
-            None, 
-            lambda: self.api.create_support_payment(
-                username, amount, message, "supporter@example.com", "Supporter"
-            )
+        result = await self.api.create_support_payment_async(
+            username, amount, message, "supporter@example.com", "Supporter"
         )
         
         # Check for different response structures
@@ -2234,7 +2258,57 @@ class SocialBuzzBot:
         self.api.set_debug_mode(new_status)
         
         status_text = "AKTIF" if new_status else "NON-AKTIF"
-        await update.message.reply_text(f"🛠️ Debug Mode: *{status_text}*\nLog disimpan di `api_debug.log`.", parse_mode='Markdown')
+        await update.message.reply_text(f"🛠️ Debug Mode: *{status_text}*\nLog disimpan di `{Config.LOG_FILE}`.", parse_mode='Markdown')
+
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/export [csv|jsonl] [user=ID] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [status=STATUS]"""
+        # Holds every user's payments, so unlike the other admin commands it needs the admin ID set
+        if not Config.TELEGRAM_ADMIN_ID or str(update.effective_user.id) != str(Config.TELEGRAM_ADMIN_ID):
+            return
+
+        args = context.args or []
+        fmt = args[0].lower() if args and args[0].lower() in EXPORT_FORMATS else "csv"
+        try:
+            filters = parse_export_filters([a for a in args if "=" in a])
+        except ValueError as e:
+            await update.message.reply_text(
+                f"❌ {e}\nContoh: /export csv user=123 from=2026-01-01 to=2026-01-31 status=success"
+            )
+            return
+
+        status_message = await update.message.reply_text("⏳ Menyiapkan export...")
+        directory = tempfile.mkdtemp(prefix="payment_export_")
+        rows = self.db.iter_payments(**filters)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        total = 0
+        part = 1
+        try:
+            while True:
+                # Peek so an empty tail never becomes an empty extra file
+                first = await asyncio.to_thread(next, rows, None)
+                if first is None and part > 1:
+                    break
+                path = os.path.join(directory, f"payments_{stamp}_{part}.{fmt}")
+                with open(path, 'wb') as f:
+                    # Rows are generated and written off the event loop, one file part at a time
+                    count = await asyncio.to_thread(
+                        write_export, itertools.chain([first] if first else [], rows), f, fmt, self.EXPORT_PART_BYTES
+                    )
+                total += count
+                with open(path, 'rb') as f:
+                    await update.message.reply_document(document=f, filename=os.path.basename(path))
+                os.remove(path)
+                if first is None:
+                    break
+                part += 1
+        except Exception as e:
+            logging.error(f"Export failed: {e}")
+            await status_message.edit_text(f"❌ Export gagal: {e}")
+            return
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        await status_message.edit_text(f"✅ Export selesai: {total} transaksi.")
 
     async def check_channel_membership(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         required_channel = Config.REQUIRED_CHANNEL_USERNAME
@@ -2321,6 +2395,9 @@ class SocialBuzzBot:
     async def post_init(self, application: Application):
         """Post-initialization hook to start background tasks."""
         self.monitoring_task = asyncio.create_task(self.monitor_pending_payments(application))
+        if Config.HTTP_PREWARM_CONNECTIONS:
+            # Open the TLS connections now instead of on the first user's payment
+            asyncio.create_task(prewarm(self.auth.session, Config.HTTP_PREWARM_CONNECTIONS))
 
     async def post_shutdown(self, application: Application):
         """Post-shutdown hook to stop background tasks."""
@@ -2333,6 +2410,11 @@ class SocialBuzzBot:
                 pass
             print("✅ Background monitoring task stopped.")
 
+        # Write out anything still buffered by the database
+        await self.db.flush()
+        self.db.close()
+        await aclose_clients()
+
     def run(self):
         if not Config.validate():
             print("Please configure your .env file first.")
@@ -2344,6 +2426,7 @@ class SocialBuzzBot:
         application.add_handler(CommandHandler('pay', self.create_payment_command))
         application.add_handler(CommandHandler('settings', self.settings_command))
         application.add_handler(CommandHandler('debug', self.debug_command))
+        application.add_handler(CommandHandler('export', self.export_command))
         application.add_handler(CallbackQueryHandler(self.button_handler))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text_input))
         application.add_error_handler(self.error_handler)
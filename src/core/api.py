@@ -1,13 +1,43 @@
+import asyncio
 import json
 import re
 import logging
 import datetime
+import threading
+import time
+import httpx
 from colorama import init, Fore, Style
+from config.settings import Config
+from . import log_pipeline
+from .http_client import get_async_client, response_cache, run_sync
+from .midtrans import SNAP_METHODS, MidtransStatusClient, is_snap_token
+from .resilience import retry_async
+from .status_classifier import default_classifier
 
 # Initialize colorama
 init(autoreset=True)
 
+# Where SociaBuzz pages carry the CSRF token, most common first
+CSRF_PATTERNS = (
+    # <input type="hidden" name="sb_token_csrf" value="...">
+    re.compile(r'name="sb_token_csrf" value="([^"]+)"'),
+    # var sb_token_csrf = '...';
+    re.compile(r"var sb_token_csrf = ['\"]([^'\"]+)['\"]"),
+    # csrf_token meta tag (common in Laravel/modern apps)
+    re.compile(r'<meta name="csrf-token" content="([^"]+)">'),
+)
+# Error texts of a rejected CSRF token (CodeIgniter / Laravel wording)
+CSRF_REJECTION_MARKERS = ("the action you have requested is not allowed", "csrf token mismatch",
+                          "invalid csrf", "page expired")
+# API traffic logs, see log_pipeline
+http_log = log_pipeline.get_logger("http")
+status_log = log_pipeline.get_logger("status")
+payment_log = log_pipeline.get_logger("payment")
+
 class APIManager:
+    # Cached CSRF tokens (one per page), expired entries are dropped when this is reached
+    CSRF_CACHE_SIZE = 256
+
     def __init__(self, session_or_auth):
         if hasattr(session_or_auth, 'session'):
             self.auth = session_or_auth
@@ -18,55 +48,113 @@ class APIManager:
         
         self.base_url = "https://sociabuzz.com"
         self.debug_mode = False # Default to False (non-active)
+        # page url -> (expires_at, token), see _get_csrf_token
+        self._csrf_cache = {}
+        self._csrf_lock = threading.Lock()
+        # creator username -> "main" or "queue", the page that had the token last time
+        self._csrf_source = {}
+        # Payment page scraping totals, see _record_scrape
+        self.scrape_stats = {"checks": 0, "bytes_read": 0, "bytes_saved": 0}
+        # Read-only Snap status lookups for check_payment_status
+        self.midtrans = MidtransStatusClient(self.session)
         self._setup_logging()
 
+    @property
+    def async_client(self):
+        """Pooled httpx client sharing self.session's cookies (see http_client.get_async_client)."""
+        return get_async_client(self.session)
+
     def set_debug_mode(self, enabled: bool):
         self.debug_mode = enabled
-        if enabled:
-            self.logger.setLevel(logging.DEBUG)
-        else:
-            self.logger.setLevel(logging.CRITICAL) # Silence logs effectively
+        # Request/response bodies are logged only in debug mode
+        log_pipeline.set_category("http", enabled)
 
     def _setup_logging(self):
-        self.logger = logging.getLogger("APIDebugger")
-        self.logger.setLevel(logging.DEBUG)
-        
-        # File handler
-        fh = logging.FileHandler("api_debug.log", encoding='utf-8')
-        fh.setLevel(logging.DEBUG)
-        
-        # Formatter
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        fh.setFormatter(formatter)
-        
-        # Add handler if not exists
-        if not self.logger.handlers:
-            self.logger.addHandler(fh)
+        log_pipeline.configure(path=Config.LOG_FILE, max_bytes=Config.LOG_MAX_BYTES, backups=Config.LOG_BACKUPS,
+                               categories=Config.LOG_CATEGORIES,
+                               sample_rates=log_pipeline.parse_sample_rates(Config.LOG_SAMPLE_RATES),
+                               console=Config.LOG_CONSOLE)
 
     def _log_request(self, method, url, **kwargs):
-        if not self.debug_mode: return
-        self.logger.debug(f"REQUEST {method} {url}")
-        if 'params' in kwargs:
-            self.logger.debug(f"Params: {kwargs['params']}")
-        if 'json' in kwargs:
-            self.logger.debug(f"JSON: {kwargs['json']}")
-        if 'data' in kwargs:
-            self.logger.debug(f"Data: {kwargs['data']}")
+        if not http_log.isEnabledFor(logging.DEBUG):
+            return
+        # Copies: the record is written later, by the log thread
+        fields = {key: dict(kwargs[key]) if isinstance(kwargs[key], dict) else kwargs[key]
+                  for key in ("params", "json", "data") if key in kwargs}
+        http_log.debug("request", extra=dict(fields, method=method, url=str(url)))
 
     def _log_response(self, response):
-        if not self.debug_mode: return
+        if not http_log.isEnabledFor(logging.DEBUG):
+            return
         try:
-            self.logger.debug(f"RESPONSE {response.status_code} {response.url}")
-            self.logger.debug(f"Content (prefix): {response.text[:500]}")
-        except:
-            self.logger.debug("RESPONSE (Error reading content)")
+            http_log.debug("response", extra={"status": response.status_code, "url": str(response.url),
+                                              "body": response.text[:500]})
+        except Exception:
+            http_log.debug("response (error reading content)", extra={"url": str(response.url)})
+
+    async def _get_csrf_token_async(self, url):
+        """Returns the sb_token_csrf for url's page, from the cache while it is fresh."""
+        now = time.monotonic()
+        with self._csrf_lock:
+            cached = self._csrf_cache.get(url)
+            if cached and cached[0] > now:
+                return cached[1]
+
+        token = await self._fetch_csrf_token_async(url)
+        if token:
+            with self._csrf_lock:
+                if len(self._csrf_cache) >= self.CSRF_CACHE_SIZE:
+                    # One entry per payment page adds up, drop the expired ones first
+                    self._csrf_cache = {k: v for k, v in self._csrf_cache.items() if v[0] > now}
+                    while len(self._csrf_cache) >= self.CSRF_CACHE_SIZE:
+                        self._csrf_cache.pop(next(iter(self._csrf_cache)))
+                self._csrf_cache[url] = (now + Config.CSRF_TOKEN_TTL_SECONDS, token)
+        return token
+
+    def _invalidate_csrf(self, url=None):
+        """Forgets the cached token of one page, or all of them (e.g. after a relogin)."""
+        with self._csrf_lock:
+            if url is None:
+                self._csrf_cache.clear()
+            else:
+                self._csrf_cache.pop(url, None)
+
+    @staticmethod
+    def _extract_csrf(html):
+        for pattern in CSRF_PATTERNS:
+            match = pattern.search(html)
+            if match:
+                return match.group(1)
+        return None
+
+    async def _fetch_queue_csrf_async(self, username):
+        queue_url = f"{self.base_url}/{username}/donate/queue?type=donate&currency=IDR"
+        print(f"{Fore.CYAN}Checking {queue_url} for the CSRF token...")
+        queue_response = await self.async_client.get(queue_url, timeout=15)
+        if queue_response.status_code == 200:
+            match = CSRF_PATTERNS[0].search(queue_response.text)
+            if match:
+                print(f"{Fore.GREEN}Found CSRF token in queue response.")
+                return match.group(1)
+        return None
 
-    def _get_csrf_token(self, url):
+    async def _fetch_csrf_token_async(self, url):
         """Fetches the page and extracts the sb_token_csrf."""
         try:
+            # Extract username from url (e.g. https://sociabuzz.com/bimaikhsan/tribe -> bimaikhsan)
+            username_match = re.search(r'sociabuzz\.com/([^/]+)/tribe', url)
+            username = username_match.group(1) if username_match else None
+
+            # Creators whose tribe page never carries the token: go straight to the queue page
+            if username and self._csrf_source.get(username) == "queue":
+                token = await self._fetch_queue_csrf_async(username)
+                if token:
+                    return token
+                self._csrf_source.pop(username, None)
+
             print(f"{Fore.CYAN}Connecting to {url}...")
             self._log_request("GET", url)
-            response = self.session.get(url, timeout=15)
+            response = await self.async_client.get(url, timeout=15)
             self._log_response(response)
             
             if response.status_code == 404:
@@ -77,35 +165,19 @@ class APIManager:
                 print(f"{Fore.RED}Error: HTTP {response.status_code}")
                 return None
 
-            # Pattern 1: <input type="hidden" name="sb_token_csrf" value="...">
-            match = re.search(r'name="sb_token_csrf" value="([^"]+)"', response.text)
-            if match:
-                return match.group(1)
-            
-            # Pattern 2: var sb_token_csrf = '...';
-            match = re.search(r"var sb_token_csrf = ['\"]([^'\"]+)['\"]", response.text)
-            if match:
-                return match.group(1)
-            
-            # Pattern 3: csrf_token meta tag (common in Laravel/modern apps)
-            match = re.search(r'<meta name="csrf-token" content="([^"]+)">', response.text)
-            if match:
-                return match.group(1)
+            token = self._extract_csrf(response.text)
+            if token:
+                if username:
+                    self._csrf_source[username] = "main"
+                return token
             
             # If not found on main page, try the donate/queue endpoint
-            # Extract username from url (e.g. https://sociabuzz.com/bimaikhsan/tribe -> bimaikhsan)
-            username_match = re.search(r'sociabuzz\.com/([^/]+)/tribe', url)
-            if username_match:
-                username = username_match.group(1)
-                queue_url = f"{self.base_url}/{username}/donate/queue?type=donate&currency=IDR"
-                print(f"{Fore.CYAN}Token not found on main page. Checking {queue_url}...")
-                
-                queue_response = self.session.get(queue_url, timeout=15)
-                if queue_response.status_code == 200:
-                    match = re.search(r'name="sb_token_csrf" value="([^"]+)"', queue_response.text)
-                    if match:
-                        print(f"{Fore.GREEN}Found CSRF token in queue response.")
-                        return match.group(1)
+            if username:
+                print(f"{Fore.CYAN}Token not found on main page.")
+                token = await self._fetch_queue_csrf_async(username)
+                if token:
+                    self._csrf_source[username] = "queue"
+                    return token
                 
             # Check for common error texts if token is missing
             if "Page Not Found" in response.text or "Halaman Tidak Ditemukan" in response.text:
@@ -120,6 +192,40 @@ class APIManager:
             print(f"{Fore.RED}Error fetching CSRF token: {e}")
             return None
 
+    @staticmethod
+    def _is_csrf_rejection(response):
+        """True when a POST was refused because of a stale CSRF token or an expired session."""
+        if response.status_code in (403, 419):
+            return True
+        if "/login" in str(response.url):
+            return True
+        # Not a bare "csrf": every SociaBuzz page (including successful responses) has the token field
+        head = response.text[:2000].lower()
+        return any(marker in head for marker in CSRF_REJECTION_MARKERS)
+
+    async def _post_with_csrf_async(self, page_url, endpoint, payload, as_json=False, **kwargs):
+        """
+        POSTs payload with page_url's CSRF token. If SociaBuzz rejects the token (or the
+        session), the cached token is dropped and the POST retried once with a fresh one.
+        Returns the response, or None when no token can be obtained.
+        """
+        for attempt in range(2):
+            csrf_token = await self._get_csrf_token_async(page_url)
+            if not csrf_token:
+                return None
+            payload["sb_token_csrf"] = csrf_token
+            request_kwargs = dict(kwargs, **{"json" if as_json else "data": payload})
+            self._log_request("POST", endpoint, **request_kwargs)
+            response = await self.async_client.post(endpoint, **request_kwargs)
+            self._log_response(response)
+            if self._is_csrf_rejection(response):
+                # Never keep a token SociaBuzz refused, even when the retry is used up
+                self._invalidate_csrf(page_url)
+                if attempt == 0:
+                    print(f"{Fore.YELLOW}CSRF token rejected by {endpoint}, refreshing it and retrying once...")
+                    continue
+            return response
+
     def get_all_data(self):
         """
         Attempts to retrieve dashboard data or transaction history.
@@ -142,22 +248,29 @@ class APIManager:
         return data
 
     def create_support_payment(self, username, amount, message, email, fullname):
+        """Blocking wrapper of create_support_payment_async for the CLI."""
+        return run_sync(self.create_support_payment_async(username, amount, message, email, fullname))
+
+    async def create_support_payment_async(self, username, amount, message, email, fullname):
         """Creates a Tribe/Support payment link."""
-        print(f"[DEBUG_FLOW] [API] create_support_payment called for {username}, amount={amount}")
+        payment_log.info("create_support_payment", extra={"username": username, "amount": amount})
         # 1. Get CSRF Token from the support page
         support_page_url = f"{self.base_url}/{username}/tribe"
         print(f"{Fore.CYAN}Fetching CSRF token from {support_page_url}...")
-        csrf_token = self._get_csrf_token(support_page_url)
+        csrf_token = await self._get_csrf_token_async(support_page_url)
         
         # Auto-login fallback if token not found (session expired)
         if not csrf_token and self.auth:
             print(f"{Fore.YELLOW}[Auth] CSRF token missing. Checking session validity...")
-            is_valid = self.auth.check_session()
+            is_valid = await self.auth.check_session_async()
             if not is_valid:
                 print(f"{Fore.YELLOW}[Auth] Session invalid. Attempting auto-login...")
-                if self.auth.login_headless():
+                # Selenium login blocks for up to a minute, keep it off the event loop
+                if await asyncio.to_thread(self.auth.login_headless):
                     print(f"{Fore.GREEN}[Auth] Relogin success! Retrying CSRF fetch...")
-                    csrf_token = self._get_csrf_token(support_page_url)
+                    # Tokens cached under the old session are useless now
+                    self._invalidate_csrf()
+                    csrf_token = await self._get_csrf_token_async(support_page_url)
         
         if not csrf_token:
             print(f"{Fore.RED}Failed to get CSRF token.")
@@ -170,7 +283,6 @@ class APIManager:
         formatted_amount = f"{amount:,}"
         
         payload = {
-            "sb_token_csrf": csrf_token,
             "currency": "IDR",
             "amount": formatted_amount,
             "qty": "1",
@@ -196,14 +308,15 @@ class APIManager:
 
         print(f"{Fore.YELLOW}Creating support payment for Rp{amount}...")
         try:
-            self._log_request("POST", endpoint, data=payload, headers=headers)
-            response = self.session.post(endpoint, data=payload, headers=headers)
-            self._log_response(response)
+            response = await self._post_with_csrf_async(support_page_url, endpoint, payload, headers=headers)
+            if response is None:
+                print(f"{Fore.RED}Failed to get CSRF token.")
+                return None
             
             # Typically returns JSON with redirect URL
             try:
                 data = response.json()
-                print(f"[DEBUG_FLOW] [API] create_support_payment success. Data: {data}")
+                payment_log.info("create_support_payment success", extra={"data": json.dumps(data, default=str)[:1000]})
                 return data
             except:
                 print(f"{Fore.RED}Failed to parse JSON response. Response text:")
@@ -215,16 +328,20 @@ class APIManager:
             return None
 
     def select_payment_method(self, payment_url, method="gopay"):
+        """Blocking wrapper of select_payment_method_async for the CLI."""
+        return run_sync(self.select_payment_method_async(payment_url, method))
+
+    async def select_payment_method_async(self, payment_url, method="gopay"):
         """Selects the payment method (gopay/qris) for a pending payment."""
-        print(f"[DEBUG_FLOW] [API] select_payment_method called. URL={payment_url}, Method={method}")
+        payment_log.info("select_payment_method", extra={"url": payment_url, "method": method})
         # 1. Get CSRF Token from the payment page
         print(f"{Fore.CYAN}Fetching CSRF token from {payment_url}...")
-        csrf_token = self._get_csrf_token(payment_url)
+        csrf_token = await self._get_csrf_token_async(payment_url)
         
         if not csrf_token:
              print(f"{Fore.RED}Failed to get CSRF token.")
              # Dump partial content for debug
-             print(f"Debug Content: {self.session.get(payment_url).text[:500]}") 
+             print(f"Debug Content: {(await self.async_client.get(payment_url)).text[:500]}") 
              return {"error": "Failed to retrieve CSRF token from payment page."}
              
         # Extract order_id from URL
@@ -257,7 +374,6 @@ class APIManager:
         api_method = config.get("api_code", method)
 
         payload = {
-            "sb_token_csrf": csrf_token,
             "order_id": order_id,
             "final_currency": "IDR",
             "currency_def": "IDR",
@@ -275,9 +391,9 @@ class APIManager:
         
         print(f"{Fore.YELLOW}Selecting payment method: {method}...")
         try:
-            self._log_request("POST", endpoint, json=payload, headers=headers)
-            response = self.session.post(endpoint, json=payload, headers=headers)
-            self._log_response(response)
+            response = await self._post_with_csrf_async(payment_url, endpoint, payload, as_json=True, headers=headers)
+            if response is None:
+                return {"error": "Failed to retrieve CSRF token from payment page."}
             
             # Handle potential redirects (e.g. DANA redirects to m.dana.id)
             # or non-JSON responses (HTML pages)
@@ -290,7 +406,7 @@ class APIManager:
                 if response.url != endpoint:
                      return {
                          "data": {
-                             "redirect_url": response.url,
+                             "redirect_url": str(response.url),
                              # No token available in this case, but we have the URL
                          }
                      }
@@ -300,7 +416,7 @@ class APIManager:
             # Check if it's a E-Wallet/Midtrans response that needs further processing
             if method in ['gopay', 'ovo', 'dana', 'linkaja', 'shopeepay'] and result and 'data' in result and 'token' in result['data']:
                 midtrans_token = result['data']['token']
-                print(f"[DEBUG_FLOW] [API] Midtrans token obtained: {midtrans_token}")
+                payment_log.info("midtrans token obtained", extra={"method": method, "token": midtrans_token})
                 
                 # Only fetch deep link for GoPay/ShopeePay where we know it helps to get QR/App link
                 # For others (OVO, DANA), the standard redirect URL is usually sufficient or requires web interaction
@@ -309,7 +425,7 @@ class APIManager:
                     if self.debug_mode:
                         print(f"{Fore.CYAN}Midtrans token found for {method}: {midtrans_token}. Fetching deep link...")
                     
-                    midtrans_data = self._get_midtrans_deep_link(midtrans_token, method)
+                    midtrans_data = await self._get_midtrans_deep_link_async(midtrans_token, method)
                     if midtrans_data:
                         # Merge midtrans data into result
                         result['data']['midtrans_details'] = midtrans_data
@@ -335,15 +451,15 @@ class APIManager:
                      else:
                          result['qr_string'] = found_qr
                 
-                print(f"[DEBUG_FLOW] [API] QRIS Extraction. Found: {found_qr[:20] if found_qr else 'None'}")
+                payment_log.info("qris extraction", extra={"qr_prefix": found_qr[:20] if found_qr else None})
             
-            print(f"[DEBUG_FLOW] [API] Payment method selection result: {str(result)[:100]}...")
+            payment_log.info("select_payment_method result", extra={"method": method, "result": str(result)[:500]})
             return result
         except Exception as e:
             print(f"{Fore.RED}Error selecting payment method: {e}")
             return {"error": str(e)}
 
-    def _get_midtrans_deep_link(self, token, method="gopay"):
+    async def _get_midtrans_deep_link_async(self, token, method="gopay"):
         """Fetches the actual GoPay deep link/QR from Midtrans Snap API."""
         try:
             # Endpoint to "charge" or get payment details
@@ -367,10 +483,8 @@ class APIManager:
                 "payment_type": payment_type
             }
             
-            # We use a fresh requests call here to avoid session cookie conflicts if any,
-            # but using self.session is also fine if headers are set correctly.
-            # Using self.session might carry over SociaBuzz cookies which is unnecessary but harmless.
-            response = self.session.post(api_url, json=payload, headers=headers)
+            # The shared client carries SociaBuzz cookies too, which is unnecessary but harmless
+            response = await self.async_client.post(api_url, json=payload, headers=headers)
             
             if response.status_code == 200:
                 return response.json()
@@ -387,7 +501,7 @@ class APIManager:
             print(f"{Fore.RED}Error fetching Midtrans deep link: {e}")
             return None
 
-    def _get_bca_va_from_snap(self, token):
+    async def _get_bca_va_from_snap_async(self, token):
         """Fetches the BCA VA number from Midtrans Snap API."""
         try:
             # Endpoint to get payment details for BCA
@@ -405,7 +519,7 @@ class APIManager:
                 "payment_type": "bca_va" # Specific for BCA Virtual Account
             }
             
-            response = self.session.post(api_url, json=payload, headers=headers)
+            response = await self.async_client.post(api_url, json=payload, headers=headers)
             
             if response.status_code == 200:
                 result = response.json()
@@ -419,6 +533,10 @@ class APIManager:
             return None
 
     def withdraw_funds(self, method_code: str, amount: int) -> dict:
+        """Blocking wrapper of withdraw_funds_async for the CLI."""
+        return run_sync(self.withdraw_funds_async(method_code, amount))
+
+    async def withdraw_funds_async(self, method_code: str, amount: int) -> dict:
         """
         Withdraw funds to the specified method (e.g., 'dana', 'gopay', 'bank').
         Amount should be an integer (e.g., 10000).
@@ -426,7 +544,7 @@ class APIManager:
         try:
             # 1. Get CSRF Token from Transaction Page
             trans_url = f"{self.base_url}/proaccount/transaction"
-            csrf_token = self._get_csrf_token(trans_url)
+            csrf_token = await self._get_csrf_token_async(trans_url)
             
             if not csrf_token:
                 return {"status": "error", "message": "Gagal mengambil token CSRF. Silakan coba lagi."}
@@ -437,17 +555,15 @@ class APIManager:
             
             # 3. Prepare POST Data
             payload = {
-                "sb_token_csrf": csrf_token,
                 "amount": formatted_amount
             }
             
             # 4. Send Request
             target_url = f"{self.base_url}/proaccount/transaction/sendwithdrawalauto/{method_code.lower()}"
             print(f"{Fore.CYAN}Sending withdrawal request to {target_url}...")
-            self._log_request("POST", target_url, data=payload)
-            
-            response = self.session.post(target_url, data=payload, timeout=30)
-            self._log_response(response)
+            response = await self._post_with_csrf_async(trans_url, target_url, payload, timeout=30)
+            if response is None:
+                return {"status": "error", "message": "Gagal mengambil token CSRF. Silakan coba lagi."}
             
             # 5. Parse Response
             # We assume it returns JSON or we check status code
@@ -472,28 +588,37 @@ class APIManager:
             return {"status": "error", "message": str(e)}
 
 
-    def check_payment_status(self, payment_id, method, payment_url):
-        """Checks the status of a payment using its token or URL."""
+    def check_payment_status(self, payment_id, method, payment_url, permit_timeout=10):
+        """Blocking wrapper of check_payment_status_async for the CLI."""
+        return run_sync(self.check_payment_status_async(payment_id, method, payment_url, permit_timeout))
+
+    async def check_payment_status_async(self, payment_id, method, payment_url, permit_timeout=10):
+        """
+        Checks the status of a payment using its token or URL.
+
+        permit_timeout: longest wait, in seconds, for a SociaBuzz rate limit permit before giving up.
+        """
         # Clarify if we are using token or scraping
         check_type = "Token" if payment_id else "Scraping"
-        print(f"[DEBUG_FLOW] [API] Checking status... ID={payment_id} ({check_type}), Method={method}")
+        # Lazy %-formatting: nothing is built when the category is off or the record sampled out
+        status_log.debug("check by %s id=%s method=%s", check_type, payment_id, method)
         
         if self.debug_mode:
             print(f"{Fore.CYAN}Checking status for {method} (ID: {payment_id}, URL: {payment_url})")
 
-        # 1. Try Midtrans/Token based check for E-Wallets
-        # We try this first for e-wallets as it provides more detailed status
+        # 1. Try Midtrans/Token based check for Snap-backed methods
+        # We try this first as it provides more detailed status; it is a plain status read
+        # (see MidtransStatusClient), not the /pay charge request used to get deep links
         
-        if method in ["gopay", "ovo", "dana", "linkaja", "shopeepay"] and payment_id:
-            # Attempt Midtrans check
-            data = self._get_midtrans_deep_link(payment_id)
-            if data and data.get("transaction_status"):
+        if method in SNAP_METHODS and is_snap_token(payment_id):
+            data = await self.midtrans.get_status(payment_id, timeout=httpx.Timeout(10, pool=permit_timeout))
+            if data:
                 if self.debug_mode:
-                    print(f"{Fore.GREEN}Midtrans check success: {data.get('transaction_status')}")
+                    print(f"{Fore.GREEN}Midtrans check success: {data['status']}")
                 return {
-                    "status": data.get("transaction_status"),
-                    "status_code": data.get("status_code"),
-                    "message": data.get("status_message")
+                    "status": data["status"],
+                    "status_code": data["status_code"],
+                    "message": data["message"]
                 }
             elif self.debug_mode:
                 print(f"{Fore.YELLOW}Midtrans check returned no status.")
@@ -504,76 +629,39 @@ class APIManager:
             if self.debug_mode:
                 print(f"{Fore.CYAN}Falling back to scraping: {payment_url}")
             try:
-                response = self.session.get(payment_url, timeout=10)
-                if response.status_code == 200:
-                    text_content = response.text.lower()
-                    
-                    # --- STATUS DETECTION LOGIC ---
-                    # Priority: Strong Success > Pending > Weak Success
-                    
-                    # A. Strong Success Keywords (Unambiguous)
-                    # User requested ONLY "terima kasih untuk dukungannya" and its variations
-                    strong_success_keywords = [
-                        "terima kasih untuk dukungannya",
-                        "terimakasih atas dukungannya"
-                    ]
-                    
-                    match_strong = next((x for x in strong_success_keywords if x in text_content), None)
-                    if match_strong:
-                        # DEBUG: Show context to debug false positives
-                        idx = text_content.find(match_strong)
-                        start = max(0, idx - 50)
-                        end = min(len(text_content), idx + len(match_strong) + 50)
-                        context_snippet = text_content[start:end].replace('\n', ' ').strip()
-                        print(f"[DEBUG_FLOW] Found '{match_strong}' in context: ...{context_snippet}...")
-
-                        # False Positive Check: Ensure it's not part of an instruction
-                        # Common false positives: "jika pembayaran berhasil", "pastikan pembayaran berhasil", "menunggu pembayaran berhasil"
-                        preceding_text = text_content[max(0, idx - 20):idx]
-                        false_positive_triggers = ["jika ", "if ", "pastikan ", "ensure ", "menunggu ", "waiting ", "setelah ", "after "]
-                        
-                        is_false_positive = any(trigger in preceding_text for trigger in false_positive_triggers)
-                        
-                        if is_false_positive:
-                            print(f"[DEBUG_FLOW] Ignored '{match_strong}' (Detected as False Positive due to preceding text)")
-                        else:
-                            print(f"[DEBUG_FLOW] Status: SUCCESS (Strong Match: '{match_strong}')")
-                            return {
-                                "status": "settlement",
-                                "status_code": "200",
-                                "message": "Payment Successful"
-                            }
-
-                    # B. Pending Keywords
-                    pending_keywords = [
-                        "menunggu pembayaran", "waiting for payment", 
-                        "qr_string", "scan qr",
-                        "nomor virtual account", "virtual account number", 
-                        "cek ponsel anda", "check your phone", 
-                        "payment code", "kode pembayaran",
-                        "complete payment", "selesaikan pembayaran",
-                        "batas waktu", "pay before"
-                    ]
-                    
-                    match_pending = next((x for x in pending_keywords if x in text_content), None)
-                    if match_pending:
-                         print(f"[DEBUG_FLOW] Status: PENDING (Match: '{match_pending}')")
-                         return {
-                            "status": "pending",
-                            "status_code": "201",
-                            "message": "Waiting for payment"
-                        }
-
-                    # C. Weak Success Keywords (Ambiguous - only if NOT pending)
-                    # "Terima kasih" now moved to Strong, but we keep this block empty or remove it.
-                    # Removing to avoid confusion.
-                    
-                    # D. Default/Unknown
+                # Streams the page and stops reading at the first decisive marker; an unchanged
+                # page (304, or the same text up to that marker) returns the cached verdict unscanned
+                verdict, response = await retry_async(lambda: response_cache.scan(
+                    self.async_client, payment_url, default_classifier.stream(),
+                    timeout=httpx.Timeout(10, pool=permit_timeout)))
+                if verdict is None:
+                    return None
+                self._record_scrape(response)
+
+                for marker, _, context in verdict.ignored:
+                    status_log.debug("ignored %r (false positive due to preceding text): ...%s...", marker, context)
+
+                if verdict.status == "settlement":
+                    status_log.info("settlement (strong match %r) in context: ...%s...", verdict.marker, verdict.context)
+                    return {
+                        "status": "settlement",
+                        "status_code": "200",
+                        "message": "Payment Successful"
+                    }
+                if verdict.status == "pending":
+                    status_log.debug("pending (match %r)", verdict.marker)
                     return {
                         "status": "pending",
                         "status_code": "201",
-                        "message": "Waiting for payment (Unverified)"
+                        "message": "Waiting for payment"
                     }
+
+                # Default/Unknown
+                return {
+                    "status": "pending",
+                    "status_code": "201",
+                    "message": "Waiting for payment (Unverified)"
+                }
             except Exception as e:
                 if self.debug_mode:
                     print(f"{Fore.RED}Scraping error: {e}")
@@ -581,6 +669,18 @@ class APIManager:
                 
         return None
 
+    def _record_scrape(self, response):
+        """Adds one status scrape to scrape_stats and logs how much of the page was skipped."""
+        read = response.num_bytes_downloaded
+        total = response.headers.get("Content-Length")
+        # Without a Content-Length (chunked page, 304) the skipped size is unknown
+        saved = max(0, int(total) - read) if total and total.isdigit() else 0
+        self.scrape_stats["checks"] += 1
+        self.scrape_stats["bytes_read"] += read
+        self.scrape_stats["bytes_saved"] += saved
+        status_log.debug("scraped %d of %s bytes (saved %d, HTTP %d)", read, total or "unknown", saved,
+                         response.status_code)
+
     def show_transactions(self):
         data = self.get_all_data()
         
@@ -591,5 +691,6 @@ class APIManager:
         print("-" * 80)
         
         for item in data:
-            print(f"{Fore.CYAN}{item['id']:<10} {Fore.MAGENTA}{item['date']:<15} {Fore.GREEN}{item['donor']:<20} {Fore.YELLOW}{f'Rp{item['amount']:,}':>10} {Fore.WHITE} {item['message']}")
+            amount_str = f"Rp{item['amount']:,}"
+            print(f"{Fore.CYAN}{item['id']:<10} {Fore.MAGENTA}{item['date']:<15} {Fore.GREEN}{item['donor']:<20} {Fore.YELLOW}{amount_str:>10} {Fore.WHITE} {item['message']}")
         print("-" * 80)
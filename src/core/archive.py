@@ -0,0 +1,119 @@
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class PaymentArchive:
+    """
+    Cold storage for terminal payments.
+
+    Records are grouped by the month of their created_at into append-only, gzip-compressed
+    JSON Lines segments (e.g. payment_archive/2026-02.jsonl.gz). Segments are never rewritten,
+    each archive run appends a new gzip member.
+    """
+    def __init__(self, directory="payment_archive", cache_segments=2):
+        self.directory = directory
+        self.cache_segments = cache_segments
+        self._lock = threading.Lock()
+        # month -> (segment size/mtime, {user_id: [records newest first]}), for the most recently read segments
+        self._user_cache = OrderedDict()
+
+    @staticmethod
+    def month_of(payment):
+        created_at = payment.get("created_at") or ""
+        return created_at[:7] if len(created_at) >= 7 else "unknown"
+
+    def _segment_path(self, month):
+        return os.path.join(self.directory, f"{month}.jsonl.gz")
+
+    def months(self):
+        """Returns the archived months, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        suffix = ".jsonl.gz"
+        return sorted((name[:-len(suffix)] for name in os.listdir(self.directory) if name.endswith(suffix)), reverse=True)
+
+    def append(self, payments):
+        """Appends payments to their monthly segments and fsyncs them."""
+        by_month = {}
+        for p in payments:
+            by_month.setdefault(self.month_of(p), []).append(p)
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            for month, records in by_month.items():
+                lines = "".join(json.dumps(p, ensure_ascii=False, separators=(',', ':')) + "\n" for p in records)
+                with open(self._segment_path(month), 'ab') as raw:
+                    with gzip.GzipFile(fileobj=raw, mode='ab') as gz:
+                        gz.write(lines.encode('utf-8'))
+                    raw.flush()
+                    os.fsync(raw.fileno())
+                self._user_cache.pop(month, None)
+
+    def iter_segment(self, month):
+        """Yields the records of one segment in file order."""
+        path = self._segment_path(month)
+        if not os.path.exists(path):
+            return
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (EOFError, OSError) as e:
+            # Truncated last member after a crash, everything before it is still valid
+            print(f"Warning: archive segment {path} is truncated: {e}")
+
+    def iter_all(self, dedupe=False):
+        """Yields every archived record, oldest segment first."""
+        seen = set()
+        for month in reversed(self.months()):
+            for p in self.iter_segment(month):
+                if dedupe:
+                    if p["id"] in seen:
+                        continue
+                    seen.add(p["id"])
+                yield p
+
+    def _segment_version(self, month):
+        try:
+            st = os.stat(self._segment_path(month))
+            return (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _user_index(self, month):
+        # Another process sharing the archive may have appended to the segment since it was cached
+        version = self._segment_version(month)
+        with self._lock:
+            cached = self._user_cache.get(month)
+            if cached is not None and cached[0] == version:
+                self._user_cache.move_to_end(month)
+                return cached[1]
+
+        index = {}
+        for p in self.iter_segment(month):
+            index.setdefault(p["user_id"], []).append(p)
+        for records in index.values():
+            records.sort(key=lambda p: (p.get("created_at", ""), p["id"]), reverse=True)
+
+        with self._lock:
+            self._user_cache[month] = (version, index)
+            while len(self._user_cache) > self.cache_segments:
+                self._user_cache.popitem(last=False)
+        return index
+
+    def iter_user(self, user_id):
+        """Yields a user's archived payments, newest first."""
+        seen = set()
+        for month in self.months():
+            for p in self._user_index(month).get(user_id, []):
+                # A crash between archiving and committing the removal can duplicate records
+                if p["id"] in seen:
+                    continue
+                seen.add(p["id"])
+                yield p
@@ -9,6 +9,7 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from config.settings import Config
+from .http_client import DEFAULT_HEADERS, get_async_client, run_sync
 
 # Initialize colorama
 init(autoreset=True)
@@ -20,11 +21,7 @@ class AuthManager:
     def __init__(self):
         self.session = requests.Session()
         # Use a standard browser User-Agent to avoid detection
-        self.session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5",
-        })
+        self.session.headers.update(DEFAULT_HEADERS)
         self.load_cookies()
 
     def login_with_browser(self):
@@ -310,12 +307,16 @@ class AuthManager:
                 print(f"{Fore.RED}Failed to load cookies: {e}")
 
     def check_session(self):
+        """Blocking wrapper of check_session_async for the CLI."""
+        return run_sync(self.check_session_async())
+
+    async def check_session_async(self):
         """Checks if the current session is valid by hitting a protected endpoint."""
         # User confirmed dashboard URL: https://sociabuzz.com/proaccount/profile
         # Also keeping /mylink as a fallback if needed, but prioritizing the user's URL
         dashboard_url = "https://sociabuzz.com/proaccount/profile"
         try:
-            r = self.session.get(dashboard_url, allow_redirects=False)
+            r = await get_async_client(self.session).get(dashboard_url, follow_redirects=False)
             
             # If we are redirected to login, session is invalid
             if r.status_code in [301, 302] and "login" in r.headers.get("Location", ""):
@@ -323,7 +324,7 @@ class AuthManager:
                 
             # If we get a 200 OK, it's valid.
             if r.status_code == 200:
-                if "login" in r.url:
+                if "login" in str(r.url):
                     return False
                 return True
                 
@@ -1,35 +1,737 @@
+import asyncio
+import bisect
+import csv
+import heapq
+import io
+import itertools
 import json
 import os
+import sqlite3
+import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from config.settings import Config
+from .archive import PaymentArchive
+from .filelock import InterProcessLock
+from .models import Payment, PaymentStatus, _epoch
+from .settings_store import SettingsStore
+from .serializer import SchemaVersionError, decode, dumps_json, encode, get_serializer, loads_json, paused_gc
+
+def _amount_value(amount):
+    """Parses a stored amount, returns None if it is not numeric."""
+    try:
+        return float(amount)
+    except (TypeError, ValueError):
+        return None
+
+
+def _empty_user_stats():
+    return {"success_count": 0, "success_sum": 0, "last_payment_at": None}
+
+
+def _add_to_rollup(stats, payment):
+    """Counts a successful payment into a rollup dict."""
+    stats["success_count"] += 1
+    amount = _amount_value(payment.get("amount"))
+    if amount is not None:
+        stats["success_sum"] += amount
+    paid_at = payment.get("updated_at")
+    if paid_at and (stats["last_payment_at"] is None or paid_at > stats["last_payment_at"]):
+        stats["last_payment_at"] = paid_at
+
+
+def _walk(items, start, stop, step):
+    """Iterates items[start:stop:step] without copying the list."""
+    return (items[i] for i in range(start, stop, step))
+
+
+# Only pending payments can still change; everything else may be archived
+ACTIVE_STATUSES = (PaymentStatus.PENDING,)
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+def _export_range(start, end):
+    """start/end datetimes (or None) as epoch seconds."""
+    return (int(start.timestamp()) if start else None, int(end.timestamp()) if end else None)
+
+
+def _export_match(record, user_id, start_ts, end_ts, status):
+    """Applies the iter_payments filters to a stored-shape record."""
+    if user_id is not None and record.get("user_id") != user_id:
+        return False
+    if status is not None and record.get("status") != status:
+        return False
+    if start_ts is not None or end_ts is not None:
+        created_ts = record.get("created_ts")
+        if created_ts is None:
+            created_ts = _epoch(record.get("created_at"))
+        if created_ts is None:
+            return False
+        if start_ts is not None and created_ts < start_ts:
+            return False
+        if end_ts is not None and created_ts >= end_ts:
+            return False
+    return True
+
+
+def parse_export_filters(tokens):
+    """
+    Parses "user=<id>", "from=YYYY-MM-DD", "to=YYYY-MM-DD" (inclusive) and "status=<status>"
+    tokens into iter_payments keyword arguments. Raises ValueError for anything else.
+    """
+    filters = {}
+    for token in tokens:
+        key, sep, value = token.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Expected key=value, got '{token}'")
+        if key == "user":
+            filters["user_id"] = int(value) if value.lstrip("-").isdigit() else value
+        elif key == "from":
+            filters["start"] = datetime.strptime(value, "%Y-%m-%d")
+        elif key == "to":
+            filters["end"] = datetime.strptime(value, "%Y-%m-%d") + timedelta(days=1)
+        elif key == "status":
+            filters["status"] = value
+        else:
+            raise ValueError(f"Unknown export filter '{key}', expected user, from, to or status")
+    return filters
+
+
+def write_export(rows, fileobj, fmt="csv", max_bytes=None):
+    """
+    Writes rows from iter_payments to a binary file as CSV (details JSON-encoded) or JSON Lines.
+    With max_bytes it stops once the file reaches that size, so the rest of the same iterator can
+    go into another file. Returns the number of rows written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of: {', '.join(EXPORT_FORMATS)}")
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="", write_through=True)
+    count = 0
+    try:
+        if fmt == "csv":
+            writer = csv.writer(text)
+            writer.writerow(Payment.FIELDS)
+        for record in rows:
+            if fmt == "csv":
+                record = dict(record, details=json.dumps(record.get("details") or {}, ensure_ascii=False))
+                writer.writerow([record.get(column, "") for column in Payment.FIELDS])
+            else:
+                text.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+            if max_bytes and fileobj.tell() >= max_bytes:
+                break
+    finally:
+        # Leave fileobj open for the caller
+        text.detach()
+    return count
+
 
 class PaymentDatabase:
-    def __init__(self, filename="payment_history.json"):
+    """
+    JSON file payment store.
+
+    By default every mutation rewrites the whole file. With journal=True each mutation is
+    appended as one compact JSON line to `<filename>.journal` instead, and the snapshot is
+    rewritten atomically in the background once the journal grows past compact_bytes.
+
+    With write_behind_ms set, mutations only mark the store dirty. A background thread
+    collects everything written during that window and persists it in one go (fsync plus
+    atomic rename, or one journal append). Use `await db.flush()` when a change must be on
+    disk before replying to the user.
+
+    With archive_after_days set, terminal payments that have not changed for that many days
+    are moved into monthly compressed segments (see PaymentArchive). The hot file only keeps
+    recent and pending payments; per-user history and totals still include archived data.
+
+    With shared=True several processes (bot, CLI, workers) can use the same files. Every
+    mutation holds an advisory lock on `<filename>.lock`, reloads whatever other processes
+    wrote since (detected by file mtime/size/inode) and persists before releasing the lock.
+    Reads reload lazily when the files changed. Write-behind is not available in this mode.
+
+    serializer picks the snapshot format ("json", "json-compact" or "msgpack", see
+    src/core/serializer.py). Loading detects the format of the existing file, so switching
+    only takes effect with the next full write (or `python main.py --convert-db`).
+    """
+    def __init__(self, filename="payment_history.json", journal=False, compact_bytes=1024 * 1024, write_behind_ms=0,
+                 archive_after_days=0, archive_dir=None, shared=False, serializer="json", settings_filename=None):
         self.filename = filename
-        self.data = self._load_data()
+        # Fail early on an unknown format or a missing msgpack package
+        self.serializer = get_serializer(serializer).name
+        self.journal = journal
+        self.journal_filename = f"{filename}.journal"
+        self.compact_bytes = compact_bytes
+        if shared and write_behind_ms:
+            # Buffered mutations would be invisible to (and overwritten by) the other processes
+            print("Warning: write-behind (DB_WRITE_BEHIND_MS) is off for a shared payment database (DB_MULTI_PROCESS)")
+            write_behind_ms = 0
+        self.write_behind_ms = write_behind_ms
+        self.archive_after_days = archive_after_days
+        self.archive = PaymentArchive(archive_dir or os.path.join(os.path.dirname(filename), "payment_archive"))
+        self._lock = threading.RLock()
+        # Serializes disk writes; always taken before self._lock
+        self._flush_lock = threading.Lock()
+        self._journal_file = None
+        self._compaction_thread = None
+        self._pending_entries = []
+        self._dirty = threading.Event()
+        # Set by close(), also cuts the flusher's batching window short
+        self._closed = threading.Event()
+        self._flusher_thread = None
+        self._file_lock = InterProcessLock(f"{filename}.lock") if shared else None
+        # Signature of the files as of our last read/write, see _reload_if_changed
+        self._disk_state = None
+        self._journal_offset = 0
+        # In-memory indexes, kept in sync with self.data["payments"] on every mutation
+        self._by_id = {}
+        self._by_user = {}
+        self._by_status = {}
+        # (created_ts, id) of pending payments, sorted so age-window queries are a bisect + slice
+        self._pending_by_time = []
+        # Per-user rollups of successful payments (see _stats_add/_stats_remove)
+        self._user_stats = {}
+        # Settings live in their own small file so toggling one never rewrites the payment history
+        self.settings = SettingsStore(settings_filename or os.path.join(os.path.dirname(filename), "bot_settings.json"),
+                                      shared=shared)
+        # Settings found in an old payment_history.json (or its journal), moved to self.settings below
+        self._legacy_settings = {"user_settings": {}, "global_settings": {}}
+        self.data = None
+        with self._exclusive():
+            if self._file_lock is None:
+                # A shared store is loaded by _exclusive() itself
+                self._load_from_disk()
+            if self.journal and os.path.exists(f"{self.journal_filename}.compacting"):
+                # Finish a compaction that was interrupted by a crash
+                self._write_snapshot(encode(self._snapshot_data(), self.serializer))
+                os.remove(f"{self.journal_filename}.compacting")
+        if self._legacy_settings["user_settings"] or self._legacy_settings["global_settings"]:
+            self.settings.import_settings(self._legacy_settings["user_settings"],
+                                          self._legacy_settings["global_settings"])
+        if self.write_behind_ms:
+            self._flusher_thread = threading.Thread(target=self._flusher_loop, daemon=True)
+            self._flusher_thread.start()
+        if self.archive_after_days:
+            self.archive_terminal()
+
+    def _load_from_disk(self):
+        with paused_gc():
+            self.data = self._load_data()
+            self._rebuild_indexes()
+            if self.journal:
+                self._replay_journal()
+        if self.journal:
+            self._open_journal()
 
     def _load_data(self):
         if not os.path.exists(self.filename):
-            return {"payments": [], "user_settings": {}, "global_settings": {}}
+            return {"payments": [], "archived_stats": {}}
         try:
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if "user_settings" not in data:
-                    data["user_settings"] = {}
-                if "global_settings" not in data:
-                    data["global_settings"] = {}
-                return data
+            with open(self.filename, 'rb') as f:
+                data, _ = decode(f.read())
+            for key in ("user_settings", "global_settings"):
+                # Dropped from the snapshot on its next write
+                self._legacy_settings[key].update(data.pop(key, None) or {})
+            if "archived_stats" not in data:
+                data["archived_stats"] = {}
+            data["payments"] = [Payment.from_dict(p) for p in data.get("payments", [])]
+            return data
+        except SchemaVersionError:
+            raise
         except Exception as e:
             print(f"Error loading database: {e}")
-            return {"payments": [], "user_settings": {}, "global_settings": {}}
+            return {"payments": [], "archived_stats": {}}
 
     def _save_data(self):
         try:
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            self._write_snapshot(encode(self._snapshot_data(), self.serializer))
+        except Exception as e:
+            print(f"Error saving database: {e}")
+
+    def _snapshot_data(self):
+        """self.data in the stored dict shape."""
+        with paused_gc():
+            return {**self.data, "payments": [p.to_dict() for p in self.data["payments"]]}
+
+    def _write_snapshot(self, payload):
+        """Writes the snapshot atomically so a crash never leaves a half-written file."""
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filename, self.filename)
+
+    # --- Multi-process sharing ---
+
+    @contextmanager
+    def _exclusive(self):
+        """
+        Holds self._lock for a mutation. For a shared store also holds the inter-process
+        lock, with the latest on-disk state loaded, until the mutation has been persisted.
+        """
+        with self._lock:
+            if self._file_lock is None:
+                yield
+                return
+            with self._file_lock:
+                self._reload_if_changed()
+                try:
+                    yield
+                finally:
+                    # Our own writes must not look like foreign changes
+                    self._mark_synced()
+
+    def _disk_signature(self):
+        paths = [self.filename]
+        if self.journal:
+            paths += [self.journal_filename, f"{self.journal_filename}.compacting"]
+        signature = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _mark_synced(self):
+        self._disk_state = self._disk_signature()
+        if self.journal:
+            self._journal_offset = self._disk_state[1][1] if self._disk_state[1] else 0
+
+    def _reload_if_changed(self):
+        """Loads what other processes wrote since our last read/write. Needs both locks."""
+        signature = self._disk_signature()
+        previous = self._disk_state
+        if signature == previous:
+            return
+        if (self.journal and previous and signature[0] == previous[0] and signature[2] == previous[2]
+                and signature[1] and previous[1] and signature[1][0] == previous[1][0]):
+            # Only the journal grew, apply just the new entries
+            self._journal_offset = self._read_journal(self.journal_filename, self._journal_offset)
+            if self._journal_offset == signature[1][1]:
+                return
+            # Torn tail left by a crashed writer, the full reload cuts it off
+        self._load_from_disk()
+
+    def _refresh(self):
+        """Picks up changes made by other processes before a read."""
+        if self._file_lock is not None and self._disk_signature() != self._disk_state:
+            with self._exclusive():
+                pass
+
+    # --- Journal ---
+
+    def _open_journal(self):
+        if self._journal_file is not None:
+            try:
+                if os.fstat(self._journal_file.fileno()).st_ino == os.stat(self.journal_filename).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            # Another process compacted, our handle points at the rotated file
+            self._journal_file.close()
+        self._journal_file = open(self.journal_filename, 'ab')
+
+    def _persist(self, entry):
+        """Persists a single mutation (see _apply_entry for the entry format)."""
+        if self.write_behind_ms:
+            self._pending_entries.append(entry)
+            self._dirty.set()
+            return
+        if not self.journal:
+            self._save_data()
+            return
+        try:
+            self._journal_file.write(dumps_json(entry) + b"\n")
+            self._journal_file.flush()
+        except Exception as e:
+            print(f"Error writing database journal: {e}")
+            return
+        if self._journal_file.tell() >= self.compact_bytes:
+            self._start_compaction()
+
+    # --- Write-behind ---
+
+    def _flusher_loop(self):
+        while not self._closed.is_set():
+            self._dirty.wait()
+            # Let the rest of the burst (e.g. add_payment + details + message_id) arrive;
+            # close() writes whatever is left itself
+            if self._closed.wait(self.write_behind_ms / 1000):
+                break
+            self.flush_now()
+
+    def flush_now(self):
+        """Writes every pending mutation to disk. Blocking."""
+        with self._flush_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._lock:
+            self._dirty.clear()
+            entries = self._pending_entries
+            self._pending_entries = []
+            if not entries:
+                return
+            if self.journal:
+                # Coalesce repeated writes of the same record, keep the latest position
+                coalesced = {}
+                for entry in entries:
+                    if entry["op"] == "put_payment":
+                        key = ("put_payment", entry["payment"]["id"])
+                    else:
+                        # Not an upsert, never coalesce
+                        key = id(entry)
+                    coalesced.pop(key, None)
+                    coalesced[key] = entry
+                # Serialize while holding the lock, records keep changing after we release it
+                payload = b"".join(dumps_json(entry) + b"\n" for entry in coalesced.values())
+            else:
+                payload = encode(self._snapshot_data(), self.serializer)
+
+        try:
+            if self.journal:
+                self._journal_file.write(payload)
+                self._journal_file.flush()
+                os.fsync(self._journal_file.fileno())
+                if self._journal_file.tell() >= self.compact_bytes:
+                    self._start_compaction()
+            else:
+                self._write_snapshot(payload)
         except Exception as e:
             print(f"Error saving database: {e}")
 
+    async def flush(self):
+        """Waits until every mutation made so far is durable on disk."""
+        if not self.write_behind_ms:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.flush_now)
+
+    def _apply_entry(self, entry):
+        """Applies a journal entry to self.data. Entries are idempotent upserts."""
+        op = entry.get("op")
+        if op == "put_payment":
+            record = Payment.from_dict(entry["payment"])
+            existing = self._by_id.get(record.id)
+            if existing is not None:
+                self._unindex(existing)
+                existing.overwrite(record)
+                self._index(existing)
+            else:
+                self.data["payments"].append(record)
+                self._index(record)
+        elif op == "set_user_setting":
+            # Written by older versions, settings are now kept in self.settings
+            self._legacy_settings["user_settings"].setdefault(entry["user_id"], {})[entry["key"]] = entry["value"]
+        elif op == "set_global_setting":
+            self._legacy_settings["global_settings"][entry["key"]] = entry["value"]
+        elif op == "archive_payments":
+            self._apply_archive(entry["ids"])
+        elif op == "set_archived_stats":
+            self.data["archived_stats"] = entry["stats"]
+            self._user_stats = self._compute_user_stats()
+
+    # --- Indexes ---
+
+    @staticmethod
+    def _sort_key(payment):
+        return (payment.created_at, payment.id)
+
+    def _pending_add(self, payment):
+        if payment.status == PaymentStatus.PENDING and payment.created_ts is not None:
+            bisect.insort(self._pending_by_time, (payment.created_ts, payment.id))
+
+    def _pending_remove(self, payment):
+        if payment.status == PaymentStatus.PENDING and payment.created_ts is not None:
+            key = (payment.created_ts, payment.id)
+            i = bisect.bisect_left(self._pending_by_time, key)
+            if i < len(self._pending_by_time) and self._pending_by_time[i] == key:
+                del self._pending_by_time[i]
+
+    def _index(self, payment):
+        self._by_id[payment.id] = payment
+        bisect.insort(self._by_user.setdefault(payment.user_id, []), payment, key=self._sort_key)
+        self._by_status.setdefault(payment.status, {})[payment.id] = payment
+        self._pending_add(payment)
+        self._stats_add(payment)
+
+    def _unindex(self, payment, keep_stats=False):
+        self._by_id.pop(payment.id, None)
+        user_payments = self._by_user.get(payment.user_id, [])
+        i = bisect.bisect_left(user_payments, self._sort_key(payment), key=self._sort_key)
+        while i < len(user_payments) and user_payments[i] is not payment:
+            i += 1
+        if i < len(user_payments):
+            del user_payments[i]
+        self._by_status.get(payment.status, {}).pop(payment.id, None)
+        self._pending_remove(payment)
+        if not keep_stats:
+            self._stats_remove(payment)
+
+    def _rebuild_indexes(self):
+        self._by_id = {}
+        self._by_user = {}
+        self._by_status = {}
+        self._pending_by_time = []
+        self._user_stats = self._archived_rollups()
+        for p in self.data["payments"]:
+            # Keep the first record if the file contains duplicate ids (same as the old linear scan)
+            if p.id in self._by_id:
+                continue
+            self._by_id[p.id] = p
+            self._by_user.setdefault(p.user_id, []).append(p)
+            self._by_status.setdefault(p.status, {})[p.id] = p
+            if p.status == PaymentStatus.PENDING and p.created_ts is not None:
+                self._pending_by_time.append((p.created_ts, p.id))
+            self._stats_add(p)
+        for user_payments in self._by_user.values():
+            user_payments.sort(key=self._sort_key)
+        self._pending_by_time.sort()
+
+    # --- Per-user aggregates ---
+
+    def _stats_add(self, payment):
+        """Counts a payment in its user's rollup if it is successful."""
+        if payment.status != PaymentStatus.SUCCESS:
+            return
+        _add_to_rollup(self._user_stats.setdefault(payment.user_id, _empty_user_stats()), payment)
+
+    def _stats_remove(self, payment):
+        """Takes a successful payment back out of its user's rollup."""
+        if payment.status != PaymentStatus.SUCCESS:
+            return
+        stats = self._user_stats.get(payment.user_id)
+        if not stats:
+            return
+        stats["success_count"] -= 1
+        amount = _amount_value(payment.get("amount"))
+        if amount is not None:
+            stats["success_sum"] -= amount
+        if stats["last_payment_at"] == payment.updated_at:
+            # Rare path (a payment leaving "success"), recompute from the user's own payments
+            archived = self.data["archived_stats"].get(str(payment.user_id), {})
+            stats["last_payment_at"] = max(
+                (p.updated_at for p in self._by_user.get(payment.user_id, [])
+                 if p.status == PaymentStatus.SUCCESS and p is not payment and p.updated_at),
+                default=archived.get("last_payment_at")
+            )
+
+    def _archived_rollups(self):
+        """Rollups of archived payments, as recorded when they were archived."""
+        rollups = {}
+        for entry in self.data["archived_stats"].values():
+            if entry["success_count"]:
+                rollups[entry["user_id"]] = {
+                    "success_count": entry["success_count"],
+                    "success_sum": entry["success_sum"],
+                    "last_payment_at": entry["last_payment_at"]
+                }
+        return rollups
+
+    def _compute_user_stats(self, archived_records=None):
+        """
+        Recomputes the per-user rollups from the raw payment records.
+        Archived payments are taken from archived_records if given (a full archive scan),
+        otherwise from the rollups recorded at archive time.
+        """
+        if archived_records is None:
+            computed = self._archived_rollups()
+        else:
+            computed = {}
+            for p in archived_records:
+                if p["status"] == "success" and p["id"] not in self._by_id:
+                    _add_to_rollup(computed.setdefault(p["user_id"], _empty_user_stats()), p)
+        for p in self._by_id.values():
+            if p.status != PaymentStatus.SUCCESS:
+                continue
+            _add_to_rollup(computed.setdefault(p.user_id, _empty_user_stats()), p)
+        return computed
+
+    def get_user_stats(self, user_id):
+        """Returns the user's success count, success sum and last successful payment time."""
+        self._refresh()
+        with self._lock:
+            return dict(self._user_stats.get(user_id) or _empty_user_stats())
+
+    def verify_user_stats(self):
+        """Compares the maintained rollups with a fresh recomputation. Returns the mismatches."""
+        self._refresh()
+        with self._lock:
+            computed = self._compute_user_stats(self.archive.iter_all(dedupe=True))
+            mismatches = []
+            for user_id in set(computed) | set(self._user_stats):
+                expected = computed.get(user_id, _empty_user_stats())
+                actual = self._user_stats.get(user_id, _empty_user_stats())
+                if (expected["success_count"] != actual["success_count"]
+                        or abs(expected["success_sum"] - actual["success_sum"]) > 0.005
+                        or expected["last_payment_at"] != actual["last_payment_at"]):
+                    mismatches.append({"user_id": user_id, "expected": expected, "actual": actual})
+            return mismatches
+
+    def rebuild_user_stats(self):
+        """Recomputes the rollups (including archived payments) from raw records. Returns the number of users."""
+        with self._exclusive():
+            archived_stats = {}
+            for p in self.archive.iter_all(dedupe=True):
+                if p["id"] not in self._by_id:
+                    self._add_archived_stats(archived_stats, p)
+            self.data["archived_stats"] = archived_stats
+            self._persist({"op": "set_archived_stats", "stats": archived_stats})
+            self._user_stats = self._compute_user_stats()
+            return len(self._user_stats)
+
+    # --- Archive ---
+
+    @staticmethod
+    def _add_archived_stats(archived_stats, payment):
+        entry = archived_stats.setdefault(str(payment["user_id"]), {
+            "user_id": payment["user_id"],
+            "archived_count": 0,
+            "archived_newest": None,
+            **_empty_user_stats()
+        })
+        entry["archived_count"] += 1
+        created_at = payment.get("created_at")
+        if created_at and (entry["archived_newest"] is None or created_at > entry["archived_newest"]):
+            entry["archived_newest"] = created_at
+        if payment["status"] == "success":
+            _add_to_rollup(entry, payment)
+
+    def _apply_archive(self, ids):
+        """Drops archived payments from the hot set. Their totals move into archived_stats."""
+        removed = set()
+        for payment_id in ids:
+            p = self._by_id.get(payment_id)
+            if p is None:
+                continue
+            # The user's rollup is unchanged, the payment just lives somewhere else now
+            self._unindex(p, keep_stats=True)
+            self._add_archived_stats(self.data["archived_stats"], p)
+            removed.add(id(p))
+        if removed:
+            self.data["payments"] = [p for p in self.data["payments"] if id(p) not in removed]
+
+    def archive_terminal(self, older_than_days=None):
+        """
+        Moves terminal payments not updated for older_than_days (default: archive_after_days)
+        into the monthly archive. Returns the number of archived payments.
+        """
+        days = older_than_days if older_than_days is not None else self.archive_after_days
+        if not days:
+            return 0
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+
+        with self._exclusive():
+            candidates = [
+                p for status, bucket in self._by_status.items() if status not in ACTIVE_STATUSES
+                for p in bucket.values() if p.updated_at < cutoff
+            ]
+            if not candidates:
+                return 0
+            try:
+                # Segments must be durable before the hot copies are dropped
+                self.archive.append([p.to_dict() for p in candidates])
+            except Exception as e:
+                print(f"Error archiving payments: {e}")
+                return 0
+            ids = [p.id for p in candidates]
+            self._apply_archive(ids)
+            self._persist({"op": "archive_payments", "ids": ids})
+        return len(ids)
+
+    def _replay_journal(self):
+        # A ".compacting" file is left behind if we crashed mid-compaction; replaying it
+        # again on top of the snapshot is harmless because entries are idempotent.
+        compacting_filename = f"{self.journal_filename}.compacting"
+        if os.path.exists(compacting_filename):
+            self._read_journal(compacting_filename)
+        self._journal_offset = 0
+        if os.path.exists(self.journal_filename):
+            self._journal_offset = self._read_journal(self.journal_filename)
+            if self._journal_offset < os.path.getsize(self.journal_filename):
+                # Torn write at the tail, cut it off so the next append starts on a fresh line
+                os.truncate(self.journal_filename, self._journal_offset)
+
+    def _read_journal(self, path, offset=0):
+        """Applies the complete lines of a journal from offset on. Returns the offset after the last one."""
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    self._apply_entry(loads_json(line))
+                except ValueError:
+                    continue
+        return offset
+
+    def _start_compaction(self):
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self.compact, daemon=True)
+        self._compaction_thread.start()
+
+    def compact(self):
+        """Folds the journal into a fresh snapshot."""
+        compacting_filename = f"{self.journal_filename}.compacting"
+        with self._flush_lock:
+            # Pending write-behind entries belong to the journal being compacted
+            self._flush_locked()
+            with self._exclusive():
+                if not self.journal or os.path.exists(compacting_filename):
+                    return
+                payload = encode(self._snapshot_data(), self.serializer)
+                # New mutations go to a fresh journal while the snapshot is being written
+                self._journal_file.close()
+                os.replace(self.journal_filename, compacting_filename)
+                self._journal_file = open(self.journal_filename, 'ab')
+                if self._file_lock is not None:
+                    # Other processes must not see the rotated journal before the new snapshot
+                    self._finish_compaction(payload, compacting_filename)
+                    return
+
+        self._finish_compaction(payload, compacting_filename)
+
+    def _finish_compaction(self, payload, compacting_filename):
+        try:
+            self._write_snapshot(payload)
+            os.remove(compacting_filename)
+        except Exception as e:
+            print(f"Error compacting database: {e}")
+
+    def save_snapshot(self):
+        """Rewrites the whole snapshot in the configured format, folding in the journal if there is one."""
+        if self.journal:
+            self.compact()
+            return
+        with self._flush_lock:
+            self._flush_locked()
+            with self._exclusive():
+                self._save_data()
+
+    def close(self):
+        if self._flusher_thread:
+            self._closed.set()
+            self._dirty.set()
+            self._flusher_thread.join()
+            self._flusher_thread = None
+        self.flush_now()
+        if self._compaction_thread:
+            self._compaction_thread.join()
+        with self._lock:
+            if self._journal_file:
+                self._journal_file.close()
+                self._journal_file = None
+            if self._file_lock is not None:
+                self._file_lock.close()
+        self.settings.close()
+
+    # --- Payments ---
+
     def add_payment(self, user_id, payment_url, method, amount, message, donor_name, order_id=None):
         """Adds a new payment record."""
         # Use order_id as the unique ID if provided, otherwise generate one
@@ -38,6 +740,360 @@ class PaymentDatabase:
         else:
             payment_id = f"pay_{int(time.time())}_{user_id}"
         
+        now = datetime.now()
+        record = Payment(
+            id=payment_id,
+            user_id=user_id,
+            status=PaymentStatus.PENDING,
+            url=payment_url,
+            method=method,
+            amount=amount,
+            message=message,
+            donor_name=donor_name,
+            created_at=now.isoformat(),
+            updated_at=now.isoformat(),
+            created_ts=int(now.timestamp()),
+            updated_ts=int(now.timestamp()),
+            details={} # Store API response details here if needed
+        )
+        
+        with self._exclusive():
+            # Check if exists to prevent duplicates
+            p = self._by_id.get(payment_id)
+            if p is not None:
+                # Update existing instead of adding
+                self._unindex(p)
+                p.update(record.to_dict())
+                self._index(p)
+                self._persist({"op": "put_payment", "payment": p.to_dict()})
+                return payment_id
+
+            self.data["payments"].append(record)
+            self._index(record)
+            self._persist({"op": "put_payment", "payment": record.to_dict()})
+        return payment_id
+
+    def update_payment_status(self, payment_id, new_status, details=None):
+        """Updates the status of a payment."""
+        with self._exclusive():
+            p = self._by_id.get(payment_id)
+            if p is None:
+                return False
+
+            new_status = PaymentStatus.parse(new_status)
+            status_changed = p.status != new_status
+            if status_changed:
+                self._by_status.get(p.status, {}).pop(payment_id, None)
+                self._by_status.setdefault(new_status, {})[payment_id] = p
+                self._pending_remove(p)
+                self._stats_remove(p)
+            now = datetime.now()
+            p.status = new_status
+            p.updated_at = now.isoformat()
+            p.updated_ts = int(now.timestamp())
+            if status_changed:
+                self._pending_add(p)
+                self._stats_add(p)
+            if details:
+                # Merge details instead of overwriting to preserve message_id etc.
+                if isinstance(p.details, dict) and isinstance(details, dict):
+                    p.details.update(details)
+                else:
+                    p.details = details
+            self._persist({"op": "put_payment", "payment": p.to_dict()})
+            return True
+        
+    def _pending_created_between(self, start_ts, end_ts=None):
+        """Pending payments with start_ts < created_ts (<= end_ts), oldest first."""
+        self._refresh()
+        with self._lock:
+            lo = bisect.bisect_right(self._pending_by_time, (start_ts, "\uffff"))
+            if end_ts is None:
+                keys = self._pending_by_time[lo:]
+            else:
+                hi = bisect.bisect_right(self._pending_by_time, (end_ts, "\uffff"))
+                keys = self._pending_by_time[lo:hi]
+            return [self._by_id[payment_id] for _, payment_id in keys]
+
+    def get_pending_payments(self, max_age_minutes=60):
+        """Returns a list of all pending payments created within the last max_age_minutes."""
+        # Payments with a missing or invalid date are not in the time index (treated as old)
+        return self._pending_created_between(int(time.time()) - max_age_minutes * 60)
+
+    def get_pending_payments_expiring(self, within_seconds, max_age_minutes=60):
+        """Returns pending payments that drop out of the max_age_minutes window in the next within_seconds."""
+        cutoff_ts = int(time.time()) - max_age_minutes * 60
+        return self._pending_created_between(cutoff_ts, cutoff_ts + within_seconds)
+
+    def get_user_history(self, user_id, limit=10):
+        """Returns payment history for a specific user."""
+        if limit <= 0:
+            return []
+        self._refresh()
+        with self._lock:
+            # Per-user list is kept sorted by created_at, newest entries are at the end
+            user_payments = self._by_user.get(user_id, [])
+            hot = user_payments[:-limit - 1:-1]
+            archived = self.data["archived_stats"].get(str(user_id))
+            if not archived or not archived["archived_count"]:
+                return hot
+            # Archived payments are all older than the hot page, no need to open the archive
+            if len(hot) == limit and hot[-1].created_at > (archived["archived_newest"] or ""):
+                return hot
+            hot = user_payments[::-1]
+
+        hot_ids = {p.id for p in hot}
+        archived_payments = (Payment.from_dict(p) for p in self.archive.iter_user(user_id) if p["id"] not in hot_ids)
+        merged = heapq.merge(hot, archived_payments, key=self._sort_key, reverse=True)
+        return list(itertools.islice(merged, limit))
+
+    def get_user_history_page(self, user_id, cursor=None, page_size=10):
+        """
+        Returns one page of a user's history, newest first, without sorting the whole history.
+
+        cursor is None for the newest page, or a next_cursor/prev_cursor of an earlier page.
+        Returns {"payments", "total", "offset", "next_cursor", "prev_cursor"}, where offset is
+        the number of payments newer than the page.
+        """
+        self._refresh()
+        with self._lock:
+            archived = self.data["archived_stats"].get(str(user_id))
+        archived_payments = []
+        if archived and archived["archived_count"]:
+            # Oldest first like the hot list; PaymentArchive caches the user's segments
+            archived_payments = [Payment.from_dict(p) for p in self.archive.iter_user(user_id)][::-1]
+
+        with self._lock:
+            hot = self._by_user.get(user_id, [])
+            archived_payments = [p for p in archived_payments if p.id not in self._by_id]
+            direction = cursor_key = None
+            if cursor and cursor[0] in "ab":
+                anchor = self._by_id.get(cursor[1:]) or next(
+                    (p for p in archived_payments if p.id == cursor[1:]), None)
+                if anchor is not None and anchor.user_id == user_id:
+                    direction, cursor_key = cursor[0], self._sort_key(anchor)
+
+            sources = (hot, archived_payments)
+            total = len(hot) + len(archived_payments)
+            if direction == "b":
+                # The page_size payments right after the cursor, walking towards the newest
+                starts = [bisect.bisect_right(s, cursor_key, key=self._sort_key) for s in sources]
+                ascending = heapq.merge(*(_walk(s, start, len(s), 1) for s, start in zip(sources, starts)),
+                                        key=self._sort_key)
+                page = list(itertools.islice(ascending, page_size))[::-1]
+                newer = sum(len(s) - start for s, start in zip(sources, starts)) - len(page)
+                older = total - newer - len(page)
+            else:
+                ends = [len(s) for s in sources]
+                if direction == "a":
+                    ends = [bisect.bisect_left(s, cursor_key, key=self._sort_key) for s in sources]
+                descending = heapq.merge(*(_walk(s, end - 1, -1, -1) for s, end in zip(sources, ends)),
+                                         key=self._sort_key, reverse=True)
+                page = list(itertools.islice(descending, page_size))
+                newer = total - sum(ends)
+                older = sum(ends) - len(page)
+
+        if not page and direction:
+            # Stale cursor (e.g. the page below it was archived), start over
+            return self.get_user_history_page(user_id, None, page_size)
+        return {
+            "payments": page,
+            "total": total,
+            "offset": newer,
+            "next_cursor": f"a{page[-1].id}" if page and older else None,
+            "prev_cursor": f"b{page[0].id}" if page and newer else None
+        }
+
+    def iter_payments(self, user_id=None, start=None, end=None, status=None, chunk_size=500):
+        """
+        Yields every payment matching the filters as a stored-shape dict, archived ones first.
+
+        start/end are datetimes matched against created_at (end exclusive). Archive segments
+        outside the range are skipped unread, the others are streamed record by record, and the
+        hot payments are converted chunk_size at a time, so memory does not grow with the history.
+        """
+        self._refresh()
+        start_ts, end_ts = _export_range(start, end)
+        first_month = start.strftime("%Y-%m") if start else None
+        last_month = end.strftime("%Y-%m") if end else None
+        for month in reversed(self.archive.months()):
+            if month != "unknown" and ((first_month and month < first_month) or (last_month and month > last_month)):
+                continue
+            for record in self.archive.iter_segment(month):
+                # Skip records still hot after an interrupted archive run, they are exported below
+                if record["id"] in self._by_id or not _export_match(record, user_id, start_ts, end_ts, status):
+                    continue
+                yield record
+
+        position = 0
+        while True:
+            with self._lock:
+                source = self._by_user.get(user_id, []) if user_id is not None else self.data["payments"]
+                chunk = [p.to_dict() for p in source[position:position + chunk_size]]
+            position += len(chunk)
+            for record in chunk:
+                if _export_match(record, user_id, start_ts, end_ts, status):
+                    yield record
+            if len(chunk) < chunk_size:
+                return
+
+    def get_user_success_total(self, user_id):
+        """Returns total successful payment amount for a specific user."""
+        self._refresh()
+        with self._lock:
+            stats = self._user_stats.get(user_id)
+            return stats["success_sum"] if stats else 0
+
+    def get_payment(self, payment_id):
+        self._refresh()
+        with self._lock:
+            return self._by_id.get(payment_id)
+
+    def get_user_setting(self, user_id, key, default=None):
+        """Get a specific setting for a user."""
+        return self.settings.get_user_setting(user_id, key, default)
+
+    def set_user_setting(self, user_id, key, value):
+        """Set a specific setting for a user."""
+        self.settings.set_user_setting(user_id, key, value)
+
+    def get_global_setting(self, key, default=None):
+        """Get a global setting."""
+        return self.settings.get_global_setting(key, default)
+
+    def set_global_setting(self, key, value):
+        """Set a global setting."""
+        self.settings.set_global_setting(key, value)
+
+    def get_bot_info(self):
+        """Get the custom bot info/announcement."""
+        return self.get_global_setting("bot_info_text", "")
+
+    def set_bot_info(self, text):
+        """Set the custom bot info/announcement."""
+        self.set_global_setting("bot_info_text", text)
+
+
+class SQLitePaymentDatabase:
+    """
+    SQLite-backed payment store with the same public methods as PaymentDatabase.
+    Each mutation only touches the affected row instead of rewriting the whole history.
+    """
+    PAYMENT_COLUMNS = ("id", "user_id", "status", "url", "method", "amount", "message",
+                       "donor_name", "created_at", "updated_at", "created_ts", "updated_ts", "details")
+
+    def __init__(self, filename="payment_history.db"):
+        self.filename = filename
+        self._lock = threading.Lock()
+        # The bot touches the database from the event loop and from executor threads,
+        # so the connection is shared and guarded by self._lock. Other processes are
+        # serialized by SQLite's own file locks; wait for them instead of failing.
+        self.conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+    @contextmanager
+    def _write_transaction(self):
+        """
+        Holds self._lock and an IMMEDIATE transaction. Taking the write lock up front means
+        rows read inside the transaction cannot be changed by another process before we write.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            yield
+
+    def _init_schema(self):
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self._write_transaction():
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS payments (
+                    id TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    status TEXT,
+                    url TEXT,
+                    method TEXT,
+                    amount,
+                    message TEXT,
+                    donor_name TEXT,
+                    created_at TEXT,
+                    updated_at TEXT,
+                    created_ts INTEGER,
+                    updated_ts INTEGER,
+                    details TEXT
+                )
+            """)
+            columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(payments)")}
+            if "created_ts" not in columns:
+                # Databases created before the epoch columns existed; convert with the same
+                # local-time rules as PaymentDatabase instead of SQLite's UTC strftime
+                self.conn.create_function("iso_epoch", 1, _epoch, deterministic=True)
+                self.conn.execute("ALTER TABLE payments ADD COLUMN created_ts INTEGER")
+                self.conn.execute("ALTER TABLE payments ADD COLUMN updated_ts INTEGER")
+                self.conn.execute("UPDATE payments SET created_ts = iso_epoch(created_at), updated_ts = iso_epoch(updated_at)")
+            # id is covered by the PRIMARY KEY index
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_user_created ON payments (user_id, created_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_status ON payments (status)")
+            # Pending sweeps filter on status and a created_ts range
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_status_created ON payments (status, created_ts)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_settings (
+                    user_id TEXT,
+                    key TEXT,
+                    value TEXT,
+                    PRIMARY KEY (user_id, key)
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS global_settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            stats_exists = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'"
+            ).fetchone()
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_id INTEGER PRIMARY KEY,
+                    success_count INTEGER NOT NULL DEFAULT 0,
+                    success_sum REAL NOT NULL DEFAULT 0,
+                    last_payment_at TEXT
+                )
+            """)
+            if not stats_exists:
+                # Databases created before the rollups existed
+                self._rebuild_user_stats_locked()
+
+    def _row_to_payment(self, row):
+        payment = dict(row)
+        try:
+            payment["details"] = json.loads(payment["details"]) if payment["details"] else {}
+        except ValueError:
+            payment["details"] = {}
+        return Payment.from_dict(payment)
+
+    def _upsert_payment(self, record):
+        if "created_ts" not in record:
+            # Records imported from older JSON files only carry the ISO strings
+            record = dict(record, created_ts=_epoch(record.get("created_at")), updated_ts=_epoch(record.get("updated_at")))
+        values = [record.get(col) for col in self.PAYMENT_COLUMNS]
+        values[-1] = json.dumps(record.get("details") or {}, ensure_ascii=False)
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO payments ({', '.join(self.PAYMENT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(self.PAYMENT_COLUMNS))})",
+            values
+        )
+
+    def add_payment(self, user_id, payment_url, method, amount, message, donor_name, order_id=None):
+        """Adds a new payment record."""
+        if order_id:
+            payment_id = order_id
+        else:
+            payment_id = f"pay_{int(time.time())}_{user_id}"
+
+        now = datetime.now()
         record = {
             "id": payment_id,
             "user_id": user_id,
@@ -47,107 +1103,299 @@ class PaymentDatabase:
             "amount": amount,
             "message": message,
             "donor_name": donor_name,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat(),
-            "details": {} # Store API response details here if needed
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat(),
+            "created_ts": int(now.timestamp()),
+            "updated_ts": int(now.timestamp()),
+            "details": {}
         }
-        
-        # Check if exists to prevent duplicates
-        for p in self.data["payments"]:
-            if p["id"] == payment_id:
-                # Update existing instead of adding
-                p.update(record)
-                self._save_data()
-                return payment_id
 
-        self.data["payments"].append(record)
-        self._save_data()
+        try:
+            with self._write_transaction():
+                previous = self.conn.execute("SELECT status, user_id FROM payments WHERE id = ?", (payment_id,)).fetchone()
+                # INSERT OR REPLACE keeps the "update existing instead of adding" behaviour
+                self._upsert_payment(record)
+                if previous is not None and previous["status"] == "success":
+                    self._refresh_user_stats(previous["user_id"])
+        except Exception as e:
+            print(f"Error saving database: {e}")
         return payment_id
 
     def update_payment_status(self, payment_id, new_status, details=None):
         """Updates the status of a payment."""
-        for p in self.data["payments"]:
-            if p["id"] == payment_id:
-                p["status"] = new_status
-                p["updated_at"] = datetime.now().isoformat()
+        try:
+            with self._write_transaction():
+                row = self.conn.execute(
+                    "SELECT details, status, user_id, amount FROM payments WHERE id = ?", (payment_id,)
+                ).fetchone()
+                if row is None:
+                    return False
+                now = datetime.now()
+                updated_at = now.isoformat()
+                updated_ts = int(now.timestamp())
+
                 if details:
+                    try:
+                        current = json.loads(row["details"]) if row["details"] else {}
+                    except ValueError:
+                        current = {}
                     # Merge details instead of overwriting to preserve message_id etc.
-                    if "details" not in p:
-                        p["details"] = {}
-                    if isinstance(p["details"], dict) and isinstance(details, dict):
-                        p["details"].update(details)
+                    if isinstance(current, dict) and isinstance(details, dict):
+                        current.update(details)
                     else:
-                        p["details"] = details
-                self._save_data()
+                        current = details
+                    self.conn.execute(
+                        "UPDATE payments SET status = ?, updated_at = ?, updated_ts = ?, details = ? WHERE id = ?",
+                        (new_status, updated_at, updated_ts, json.dumps(current, ensure_ascii=False), payment_id)
+                    )
+                else:
+                    self.conn.execute(
+                        "UPDATE payments SET status = ?, updated_at = ?, updated_ts = ? WHERE id = ?",
+                        (new_status, updated_at, updated_ts, payment_id)
+                    )
+
+                if row["status"] != "success" and new_status == "success":
+                    amount = _amount_value(row["amount"])
+                    self.conn.execute(
+                        """
+                        INSERT INTO user_stats (user_id, success_count, success_sum, last_payment_at)
+                        VALUES (?, 1, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            success_count = success_count + 1,
+                            success_sum = success_sum + excluded.success_sum,
+                            last_payment_at = MAX(COALESCE(last_payment_at, ''), excluded.last_payment_at)
+                        """,
+                        (row["user_id"], amount or 0, updated_at)
+                    )
+                elif row["status"] == "success" and new_status != "success":
+                    self._refresh_user_stats(row["user_id"])
                 return True
-        return False
-        
+        except Exception as e:
+            print(f"Error saving database: {e}")
+            return False
+
     def get_pending_payments(self, max_age_minutes=60):
         """Returns a list of all pending payments created within the last max_age_minutes."""
-        cutoff_time = datetime.now() - timedelta(minutes=max_age_minutes)
-        active_payments = []
-        
-        for p in self.data["payments"]:
-            if p["status"] == "pending":
-                try:
-                    # Handle ISO format parsing
-                    created_at = datetime.fromisoformat(p["created_at"])
-                    if created_at > cutoff_time:
-                        active_payments.append(p)
-                except Exception as e:
-                    # If date is missing or invalid, skip it (treat as old)
-                    continue
-                    
-        return active_payments
+        return self._pending_created_between(int(time.time()) - max_age_minutes * 60)
+
+    def get_pending_payments_expiring(self, within_seconds, max_age_minutes=60):
+        """Returns pending payments that drop out of the max_age_minutes window in the next within_seconds."""
+        cutoff_ts = int(time.time()) - max_age_minutes * 60
+        return self._pending_created_between(cutoff_ts, cutoff_ts + within_seconds)
+
+    def _pending_created_between(self, start_ts, end_ts=None):
+        """Pending payments with start_ts < created_ts (<= end_ts), oldest first."""
+        with self._lock:
+            # Served by idx_payments_status_created
+            rows = self.conn.execute(
+                "SELECT * FROM payments WHERE status = 'pending' AND created_ts > ? AND created_ts <= ? "
+                "ORDER BY created_ts, id",
+                (start_ts, end_ts if end_ts is not None else 2 ** 62)
+            ).fetchall()
+        return [self._row_to_payment(row) for row in rows]
 
     def get_user_history(self, user_id, limit=10):
         """Returns payment history for a specific user."""
-        user_payments = [p for p in self.data["payments"] if p["user_id"] == user_id]
-        # Sort by created_at desc
-        user_payments.sort(key=lambda x: x["created_at"], reverse=True)
-        return user_payments[:limit]
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM payments WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        return [self._row_to_payment(row) for row in rows]
+
+    def get_user_history_page(self, user_id, cursor=None, page_size=10):
+        """Returns one page of a user's history, newest first (see PaymentDatabase.get_user_history_page)."""
+        with self._lock:
+            total = self.conn.execute("SELECT COUNT(*) FROM payments WHERE user_id = ?", (user_id,)).fetchone()[0]
+            anchor = None
+            if cursor and cursor[0] in "ab":
+                anchor = self.conn.execute(
+                    "SELECT created_at, id FROM payments WHERE id = ? AND user_id = ?", (cursor[1:], user_id)
+                ).fetchone()
+            direction = cursor[0] if anchor else None
+
+            if direction == "b":
+                rows = self.conn.execute(
+                    "SELECT * FROM payments WHERE user_id = ? AND (created_at, id) > (?, ?) "
+                    "ORDER BY created_at, id LIMIT ?",
+                    (user_id, anchor["created_at"], anchor["id"], page_size)
+                ).fetchall()[::-1]
+                newer = self.conn.execute(
+                    "SELECT COUNT(*) FROM payments WHERE user_id = ? AND (created_at, id) > (?, ?)",
+                    (user_id, anchor["created_at"], anchor["id"])
+                ).fetchone()[0] - len(rows)
+            elif direction == "a":
+                rows = self.conn.execute(
+                    "SELECT * FROM payments WHERE user_id = ? AND (created_at, id) < (?, ?) "
+                    "ORDER BY created_at DESC, id DESC LIMIT ?",
+                    (user_id, anchor["created_at"], anchor["id"], page_size)
+                ).fetchall()
+                newer = total - self.conn.execute(
+                    "SELECT COUNT(*) FROM payments WHERE user_id = ? AND (created_at, id) < (?, ?)",
+                    (user_id, anchor["created_at"], anchor["id"])
+                ).fetchone()[0]
+            else:
+                rows = self.conn.execute(
+                    "SELECT * FROM payments WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                    (user_id, page_size)
+                ).fetchall()
+                newer = 0
+
+        if not rows and direction:
+            return self.get_user_history_page(user_id, None, page_size)
+        page = [self._row_to_payment(row) for row in rows]
+        older = total - newer - len(page)
+        return {
+            "payments": page,
+            "total": total,
+            "offset": newer,
+            "next_cursor": f"a{page[-1]['id']}" if page and older else None,
+            "prev_cursor": f"b{page[0]['id']}" if page and newer else None
+        }
+
+    def iter_payments(self, user_id=None, start=None, end=None, status=None, chunk_size=500):
+        """Yields the matching payments oldest first (see PaymentDatabase.iter_payments), one keyset page at a time."""
+        start_ts, end_ts = _export_range(start, end)
+        where, params = [], []
+        if user_id is not None:
+            where.append("user_id = ?")
+            params.append(user_id)
+        if start_ts is not None:
+            where.append("created_ts >= ?")
+            params.append(start_ts)
+        if end_ts is not None:
+            where.append("created_ts < ?")
+            params.append(end_ts)
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+
+        last = None
+        while True:
+            clauses = where + (["(created_at, id) > (?, ?)"] if last else [])
+            sql = "SELECT * FROM payments"
+            if clauses:
+                sql += " WHERE " + " AND ".join(clauses)
+            sql += " ORDER BY created_at, id LIMIT ?"
+            with self._lock:
+                rows = self.conn.execute(sql, params + list(last or ()) + [chunk_size]).fetchall()
+            # Not holding the lock while the caller consumes the page
+            for row in rows:
+                yield self._row_to_payment(row).to_dict()
+            if len(rows) < chunk_size:
+                return
+            last = (rows[-1]["created_at"], rows[-1]["id"])
 
     def get_user_success_total(self, user_id):
         """Returns total successful payment amount for a specific user."""
-        total = 0
-        for p in self.data["payments"]:
-            if p["user_id"] == user_id and p["status"] == "success":
-                try:
-                    total += float(p["amount"])
-                except:
-                    pass
-        return total
+        return self.get_user_stats(user_id)["success_sum"]
+
+    # --- Per-user aggregates ---
+
+    def _compute_user_stats(self, user_id=None):
+        """Recomputes rollups from raw payment rows, for one user or for everyone."""
+        query = "SELECT user_id, amount, updated_at FROM payments WHERE status = 'success'"
+        params = ()
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params = (user_id,)
+        computed = {}
+        for row in self.conn.execute(query, params):
+            stats = computed.setdefault(row["user_id"], _empty_user_stats())
+            stats["success_count"] += 1
+            amount = _amount_value(row["amount"])
+            if amount is not None:
+                stats["success_sum"] += amount
+            if row["updated_at"] and (stats["last_payment_at"] is None or row["updated_at"] > stats["last_payment_at"]):
+                stats["last_payment_at"] = row["updated_at"]
+        return computed
+
+    def _refresh_user_stats(self, user_id):
+        stats = self._compute_user_stats(user_id).get(user_id, _empty_user_stats())
+        self.conn.execute(
+            "INSERT OR REPLACE INTO user_stats (user_id, success_count, success_sum, last_payment_at) VALUES (?, ?, ?, ?)",
+            (user_id, stats["success_count"], stats["success_sum"], stats["last_payment_at"])
+        )
+
+    def _rebuild_user_stats_locked(self):
+        computed = self._compute_user_stats()
+        self.conn.execute("DELETE FROM user_stats")
+        self.conn.executemany(
+            "INSERT INTO user_stats (user_id, success_count, success_sum, last_payment_at) VALUES (?, ?, ?, ?)",
+            [(uid, st["success_count"], st["success_sum"], st["last_payment_at"]) for uid, st in computed.items()]
+        )
+        return len(computed)
+
+    def get_user_stats(self, user_id):
+        """Returns the user's success count, success sum and last successful payment time."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT success_count, success_sum, last_payment_at FROM user_stats WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        return dict(row) if row else _empty_user_stats()
+
+    def verify_user_stats(self):
+        """Compares the stored rollups with a fresh recomputation. Returns the mismatches."""
+        with self._lock:
+            computed = self._compute_user_stats()
+            stored = {row["user_id"]: dict(row) for row in self.conn.execute(
+                "SELECT user_id, success_count, success_sum, last_payment_at FROM user_stats"
+            )}
+        mismatches = []
+        for user_id in set(computed) | set(stored):
+            expected = computed.get(user_id, _empty_user_stats())
+            actual = stored.get(user_id, _empty_user_stats())
+            actual.pop("user_id", None)
+            if (expected["success_count"] != actual["success_count"]
+                    or abs(expected["success_sum"] - actual["success_sum"]) > 0.005
+                    or expected["last_payment_at"] != actual["last_payment_at"]):
+                # Users whose rollup dropped to zero are equivalent to missing rows
+                if expected["success_count"] == 0 and actual["success_count"] == 0:
+                    continue
+                mismatches.append({"user_id": user_id, "expected": expected, "actual": actual})
+        return mismatches
+
+    def rebuild_user_stats(self):
+        """Recomputes the rollups from raw records. Returns the number of users."""
+        with self._write_transaction():
+            return self._rebuild_user_stats_locked()
 
     def get_payment(self, payment_id):
-        for p in self.data["payments"]:
-            if p["id"] == payment_id:
-                return p
-        return None
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM payments WHERE id = ?", (payment_id,)).fetchone()
+        return self._row_to_payment(row) if row else None
 
     def get_user_setting(self, user_id, key, default=None):
         """Get a specific setting for a user."""
-        user_id = str(user_id)
-        if user_id in self.data["user_settings"]:
-            return self.data["user_settings"][user_id].get(key, default)
-        return default
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM user_settings WHERE user_id = ? AND key = ?",
+                (str(user_id), key)
+            ).fetchone()
+        return json.loads(row["value"]) if row else default
 
     def set_user_setting(self, user_id, key, value):
         """Set a specific setting for a user."""
-        user_id = str(user_id)
-        if user_id not in self.data["user_settings"]:
-            self.data["user_settings"][user_id] = {}
-        
-        self.data["user_settings"][user_id][key] = value
-        self._save_data()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO user_settings (user_id, key, value) VALUES (?, ?, ?)",
+                (str(user_id), key, json.dumps(value, ensure_ascii=False))
+            )
 
     def get_global_setting(self, key, default=None):
         """Get a global setting."""
-        return self.data["global_settings"].get(key, default)
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM global_settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else default
 
     def set_global_setting(self, key, value):
         """Set a global setting."""
-        self.data["global_settings"][key] = value
-        self._save_data()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO global_settings (key, value) VALUES (?, ?)",
+                (key, json.dumps(value, ensure_ascii=False))
+            )
 
     def get_bot_info(self):
         """Get the custom bot info/announcement."""
@@ -156,3 +1404,105 @@ class PaymentDatabase:
     def set_bot_info(self, text):
         """Set the custom bot info/announcement."""
         self.set_global_setting("bot_info_text", text)
+
+    def count_payments(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM payments").fetchone()[0]
+
+    def import_from_json(self, json_filename="payment_history.json", archive_dir=None, settings_filename=None):
+        """
+        One-shot importer from the legacy JSON store, including its archived payments
+        (archive_dir, default Config.DB_ARCHIVE_DIR) and its settings file (settings_filename,
+        default Config.DB_SETTINGS_FILE).
+        Existing rows with the same payment id are overwritten, so it is safe to re-run.
+        Returns the number of imported payments.
+        """
+        # A store run in journal mode keeps its recent changes in the journal only
+        journal = Config.DB_ENGINE == "journal" or os.path.exists(f"{json_filename}.journal")
+        source = PaymentDatabase(json_filename, journal=journal, archive_dir=archive_dir or Config.DB_ARCHIVE_DIR,
+                                 settings_filename=settings_filename or Config.DB_SETTINGS_FILE)
+        try:
+            data = {**source.data, **source.settings.data}
+            hot_ids = {p.id for p in data.get("payments", [])}
+            # Newest archived copy of each payment that is not back in the hot set
+            archived = [p for p in source.archive.iter_all(dedupe=True) if p["id"] not in hot_ids]
+        finally:
+            source.close()
+
+        with self._write_transaction():
+            for record in data.get("payments", []):
+                self._upsert_payment(record)
+            for record in archived:
+                self._upsert_payment(record)
+            for user_id, settings in data.get("user_settings", {}).items():
+                for key, value in settings.items():
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO user_settings (user_id, key, value) VALUES (?, ?, ?)",
+                        (str(user_id), key, json.dumps(value, ensure_ascii=False))
+                    )
+            for key, value in data.get("global_settings", {}).items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO global_settings (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False))
+                )
+            self._rebuild_user_stats_locked()
+            self._carry_archived_rollups(data.get("archived_stats", {}), archived)
+        return len(data.get("payments", [])) + len(archived)
+
+    def _carry_archived_rollups(self, archived_stats, archived_records):
+        """
+        Adds the recorded rollups of archived payments whose segments are gone (not among
+        archived_records) to user_stats, so their totals survive the import. There are no rows
+        behind these totals: rebuild_user_stats() drops them again.
+        """
+        found = {}
+        for p in archived_records:
+            if p["status"] == "success":
+                _add_to_rollup(found.setdefault(p["user_id"], _empty_user_stats()), p)
+        for entry in archived_stats.values():
+            user_id = entry["user_id"]
+            seen = found.get(user_id, _empty_user_stats())
+            missing = entry["success_count"] - seen["success_count"]
+            if missing <= 0:
+                continue
+            print(f"Warning: {missing} archived payment(s) of user {user_id} are not in the archive, "
+                  f"importing their recorded totals only")
+            row = self.conn.execute(
+                "SELECT success_count, success_sum, last_payment_at FROM user_stats WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            stats = dict(row) if row else _empty_user_stats()
+            last = max(filter(None, (stats["last_payment_at"], entry["last_payment_at"])), default=None)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO user_stats (user_id, success_count, success_sum, last_payment_at) "
+                "VALUES (?, ?, ?, ?)",
+                (user_id, stats["success_count"] + missing,
+                 stats["success_sum"] + entry["success_sum"] - seen["success_sum"], last)
+            )
+
+    async def flush(self):
+        """Every mutation is committed in its own transaction, nothing is buffered."""
+        return
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def create_database():
+    """Creates the payment database selected by Config.DB_ENGINE."""
+    if Config.DB_ENGINE == "sqlite":
+        db = SQLitePaymentDatabase(Config.DB_SQLITE_FILE)
+        if db.count_payments() == 0 and os.path.exists(Config.DB_JSON_FILE):
+            print(f"SQLite database is empty. Run 'python main.py --import-json' to import {Config.DB_JSON_FILE}.")
+        return db
+    return PaymentDatabase(
+        Config.DB_JSON_FILE,
+        journal=Config.DB_ENGINE == "journal",
+        compact_bytes=Config.DB_JOURNAL_COMPACT_BYTES,
+        write_behind_ms=Config.DB_WRITE_BEHIND_MS,
+        archive_after_days=Config.DB_ARCHIVE_AFTER_DAYS,
+        archive_dir=Config.DB_ARCHIVE_DIR,
+        shared=Config.DB_MULTI_PROCESS,
+        serializer=Config.DB_FORMAT,
+        settings_filename=Config.DB_SETTINGS_FILE
+    )
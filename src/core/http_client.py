@@ -0,0 +1,380 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+import httpx
+from config.settings import Config
+from .resilience import CircuitBreaker, TokenBucket
+
+# Default for every upstream request that does not pass its own timeout
+DEFAULT_TIMEOUT = 30
+
+# Sent with every request; read-only so nobody can change them for all callers at once.
+# Anything call-specific goes in that request's headers= argument.
+DEFAULT_HEADERS = MappingProxyType({
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+})
+
+# Separate connection pool per upstream host: name -> (mount pattern, limits, pre-warm URL).
+# SociaBuzz serves every user action and the monitor's scraping, Midtrans only Snap lookups.
+HOST_POOLS = {
+    "sociabuzz": ("all://sociabuzz.com",
+                  httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+                  "https://sociabuzz.com/"),
+    "midtrans": ("all://app.midtrans.com",
+                 httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=30),
+                 "https://app.midtrans.com/"),
+}
+# Everything else (payment redirect pages, tests)
+OTHER_POOL_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=30)
+
+# One circuit breaker per HOST_POOLS host, shared by every client (the bot's loop and the sync wrappers')
+breakers = {name: CircuitBreaker(name) for name in HOST_POOLS}
+
+# Requests per second and burst per HOST_POOLS host and endpoint class: read (GET/HEAD: pages,
+# status scraping, getData*) and write (everything else: creating payments, selecting methods,
+# withdrawals). Overridable with Config.HTTP_RATE_LIMITS.
+RATE_LIMITS = {
+    "sociabuzz": {"read": (3.0, 10), "write": (0.5, 3)},
+    "midtrans": {"read": (5.0, 10), "write": (2.0, 5)},
+}
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _rate_limits(overrides):
+    """RATE_LIMITS with the host.kind=rate:burst entries of overrides applied."""
+    limits = {host: dict(kinds) for host, kinds in RATE_LIMITS.items()}
+    for item in filter(None, (part.strip() for part in overrides.split(","))):
+        try:
+            key, value = item.split("=")
+            host, kind = key.strip().split(".")
+            rate, burst = value.split(":")
+            if kind not in limits[host] or float(rate) <= 0:
+                raise ValueError(kind)
+            limits[host][kind] = (float(rate), int(burst))
+        except (KeyError, ValueError):
+            print(f"[HTTP] Ignoring invalid HTTP_RATE_LIMITS entry: {item}")
+    return limits
+
+
+# Token buckets shared, like the breakers, by every caller of the session in this process
+limiters = {host: {kind: TokenBucket(f"{host}.{kind}", rate, burst) for kind, (rate, burst) in kinds.items()}
+            for host, kinds in _rate_limits(Config.HTTP_RATE_LIMITS).items()}
+
+# (id(session), event loop) -> (httpx.AsyncClient, {pool name: PoolTransport})
+_clients = {}
+_lock = threading.Lock()
+# Background loop the sync wrappers run on, see run_sync
+_sync_loop = None
+
+
+class PoolTransport(httpx.AsyncHTTPTransport):
+    """
+    An AsyncHTTPTransport (one connection pool) that keeps usage counters for pool_stats(),
+    takes a permit from its host's rate limiters and feeds its host's breaker.
+    """
+    def __init__(self, name, limits, breaker=None, limiters=None):
+        super().__init__(limits=limits)
+        self.name = name
+        self.limits = limits
+        self.breaker = breaker
+        self.limiters = limiters
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def handle_async_request(self, request):
+        # Raises CircuitOpenError (an httpx.TransportError) while the host's circuit is open
+        admitted = self.breaker.before_request() if self.breaker else None
+        if self.limiters:
+            limiter = self.limiters["read" if request.method in READ_METHODS else "write"]
+            try:
+                # The pool timeout doubles as the permit deadline: both are waits for capacity.
+                # A miss raises RateLimitTimeout (an httpx.PoolTimeout)
+                await limiter.acquire(request.extensions.get("timeout", {}).get("pool"))
+            except BaseException:
+                if self.breaker:
+                    self.breaker.after_request(admitted, None, 0)
+                raise
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.monotonic()
+        # None (not counted) if the request is cancelled
+        failed = None
+        try:
+            response = await super().handle_async_request(request)
+            failed = response.status_code >= 500 or response.status_code == 429
+            return response
+        except Exception:
+            self.errors += 1
+            failed = True
+            raise
+        finally:
+            self.in_flight -= 1
+            if self.breaker:
+                self.breaker.after_request(admitted, failed, time.monotonic() - started)
+
+    def stats(self):
+        # httpx keeps the httpcore pool in _pool; its connections list is httpcore's public API
+        connections = self._pool.connections
+        busy = sum(1 for c in connections if not c.is_idle())
+        return {
+            "max_connections": self.limits.max_connections,
+            "open": len(connections),
+            "busy": busy,
+            "utilization": round(busy / self.limits.max_connections, 2),
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class CacheEntry:
+    __slots__ = ("etag", "last_modified", "digest", "length", "complete", "value")
+
+    def __init__(self, etag, last_modified, digest, length, complete, value):
+        self.etag = etag
+        self.last_modified = last_modified
+        # blake2b of the first `length` characters of the body; complete: they were the whole body
+        self.digest = digest
+        self.length = length
+        self.complete = complete
+        self.value = value
+
+
+class ResponseCache:
+    """
+    Remembers the parsed result of repeatedly polled GETs, by URL, so unchanged pages are not parsed again.
+
+    Requests carry If-None-Match / If-Modified-Since when the server sent an ETag / Last-Modified;
+    a 304 returns the cached result. Otherwise the body's digest is compared with the last one.
+    Cached results are shared between callers and must not be modified. Keys are plain URLs:
+    one process talks to SociaBuzz as one account.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # The bot's loop and the sync wrappers' loop run in different threads
+        self._entries_lock = threading.Lock()
+        # not_modified: 304 answers, unchanged: same body digest, misses: parsed / scanned
+        self.stats = {"not_modified": 0, "unchanged": 0, "misses": 0}
+
+    def _lookup(self, key):
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, response, digest, length, complete, value):
+        entry = CacheEntry(response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                           digest, length, complete, value)
+        with self._entries_lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _validators(entry, headers=None):
+        headers = dict(headers or {})
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def _hit(self, entry, response, kind):
+        # Keep the validators of the latest response
+        entry.etag = response.headers.get("ETag", entry.etag)
+        entry.last_modified = response.headers.get("Last-Modified", entry.last_modified)
+        self.stats[kind] += 1
+        return entry.value
+
+    async def get(self, client, url, parse, params=None, headers=None, **kwargs):
+        """GETs url and returns parse(response), or the cached result if the body has not changed."""
+        key = str(httpx.URL(url, params=params))
+        entry = self._lookup(key)
+        response = await client.get(url, params=params, headers=self._validators(entry, headers), **kwargs)
+        if response.status_code == 304 and entry is not None:
+            return self._hit(entry, response, "not_modified")
+        if response.status_code != 200:
+            return parse(response)
+
+        digest = hashlib.blake2b(response.content).digest()
+        if entry is not None and entry.complete and entry.digest == digest:
+            return self._hit(entry, response, "unchanged")
+        self.stats["misses"] += 1
+        value = parse(response)
+        self._store(key, response, digest, len(response.content), True, value)
+        return value
+
+    async def scan(self, client, url, scanner, headers=None, **kwargs):
+        """
+        Streams url's text through scanner and returns (result, response); result is None unless the status is 200/304.
+
+        scanner has expect(content_length or None), feed(chunk) -> result or None and finish() -> result
+        (see StatusStream). Reading stops at the first result, so only the text the scanner needed is
+        digested: when the next body starts with the same text, the cached result is returned without
+        scanning again.
+        """
+        entry = self._lookup(url)
+        async with client.stream("GET", url, headers=self._validators(entry, headers), **kwargs) as response:
+            if response.status_code == 304 and entry is not None:
+                return self._hit(entry, response, "not_modified"), response
+            if response.status_code != 200:
+                return None, response
+
+            size = response.headers.get("Content-Length")
+            scanner.expect(int(size) if size and size.isdigit() else None)
+
+            digest = hashlib.blake2b()
+            length = 0
+            # Text held back while it may still equal the cached prefix
+            held = [] if entry is not None else None
+            result = None
+            async for chunk in response.aiter_text():
+                if held is not None:
+                    held.append(chunk)
+                    if length + len(chunk) < entry.length:
+                        digest.update(chunk.encode("utf-8", "surrogatepass"))
+                        length += len(chunk)
+                        continue
+                    # Compare exactly the cached prefix, then decide about the rest
+                    head = chunk[:entry.length - length]
+                    same = digest.copy()
+                    same.update(head.encode("utf-8", "surrogatepass"))
+                    if same.digest() == entry.digest and not (entry.complete and len(head) < len(chunk)):
+                        if not entry.complete:
+                            return self._hit(entry, response, "unchanged"), response
+                        # A complete body must also end here; keep reading to make sure
+                        digest, length = same, entry.length
+                        continue
+                    # Changed: scan what was held back, and go on as a miss
+                    chunks, held, digest, length = held, None, hashlib.blake2b(), 0
+                else:
+                    chunks = [chunk]
+
+                for part in chunks:
+                    digest.update(part.encode("utf-8", "surrogatepass"))
+                    length += len(part)
+                    result = scanner.feed(part)
+                    if result is not None:
+                        break
+                if result is not None:
+                    break
+
+            if held is not None and length == entry.length:
+                # Whole body seen, identical to the cached complete one
+                return self._hit(entry, response, "unchanged"), response
+            if held is not None:
+                # Body ended before the cached prefix did: it changed
+                for part in held:
+                    digest.update(part.encode("utf-8", "surrogatepass"))
+                    length += len(part)
+                    result = scanner.feed(part)
+                    if result is not None:
+                        break
+            complete = result is None
+            result = scanner.finish() if complete else result
+            self.stats["misses"] += 1
+            self._store(url, response, digest.digest(), length, complete, result)
+            return result, response
+
+
+# Shared by APIManager and TransactionManager; its stats are reported next to pool_stats()
+response_cache = ResponseCache()
+
+
+def get_async_client(session):
+    """
+    Returns the pooled httpx.AsyncClient of the running event loop for a requests.Session.
+
+    The client shares the session's cookie jar (a relogin is visible to both) and routes each
+    upstream host to its own pool (HOST_POOLS), so a burst of SociaBuzz scraping cannot starve
+    Midtrans lookups. An httpx client is bound to the loop that opened its connections, so each
+    loop gets its own: the bot's loop and the sync wrappers' loop.
+    """
+    loop = asyncio.get_running_loop()
+    key = (id(session), loop)
+    with _lock:
+        entry = _clients.get(key)
+        if entry is None or entry[0].is_closed:
+            pools = {name: PoolTransport(name, limits, breakers[name], limiters[name])
+                     for name, (_, limits, _) in HOST_POOLS.items()}
+            pools["other"] = PoolTransport("other", OTHER_POOL_LIMITS)
+            client = httpx.AsyncClient(
+                cookies=session.cookies,
+                headers=DEFAULT_HEADERS,
+                timeout=DEFAULT_TIMEOUT,
+                follow_redirects=True,
+                transport=pools["other"],
+                mounts={pattern: pools[name] for name, (pattern, _, _) in HOST_POOLS.items()}
+            )
+            entry = _clients[key] = (client, pools)
+        return entry[0]
+
+
+async def prewarm(session, connections=2):
+    """Opens `connections` keep-alive connections per upstream host, so the first user actions skip DNS + TLS."""
+    client = get_async_client(session)
+
+    async def warm(url):
+        try:
+            await client.head(url, follow_redirects=False, timeout=10)
+        except httpx.HTTPError as e:
+            print(f"[HTTP] Pre-warming {url} failed: {e}")
+
+    # Concurrent requests to one host each need their own connection
+    await asyncio.gather(*(warm(url) for _, _, url in HOST_POOLS.values() for _ in range(connections)))
+
+
+def pool_stats():
+    """Usage of every live connection pool, by client ("async" for the bot's loop, "sync" for the wrappers)."""
+    with _lock:
+        entries = list(_clients.items())
+    return {
+        f"{'sync' if loop is _sync_loop else 'async'}-{session_id:x}": {name: pool.stats() for name, pool in pools.items()}
+        for (session_id, loop), (client, pools) in entries if not client.is_closed
+    }
+
+
+def circuit_stats():
+    """State, rolling error rate and latency of every upstream host's circuit breaker."""
+    return {name: breaker.stats() for name, breaker in breakers.items()}
+
+
+def limiter_stats():
+    """Permits handed out and time spent waiting for them, per host.kind rate limiter."""
+    return {bucket.name: bucket.stats() for kinds in limiters.values() for bucket in kinds.values()}
+
+
+async def aclose_clients():
+    """Closes the clients of the running loop (call on shutdown)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        entries = [_clients.pop(key) for key in [k for k in _clients if k[1] is loop]]
+    for client, _ in entries:
+        await client.aclose()
+
+
+def run_sync(coro):
+    """
+    Runs a coroutine for synchronous callers (the CLI, worker threads) and returns its result.
+
+    All of them share one background event loop, so their client keeps its connections between
+    calls. Must not be called from a coroutine: await the *_async method instead.
+    """
+    global _sync_loop
+    with _lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="http-sync-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
@@ -0,0 +1,69 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class IdempotencyCache:
+    """
+    Runs an async action at most once per key within ttl_seconds.
+
+    A repeated call with the same key awaits the in-flight future, or gets the finished result,
+    instead of running the action again. Entries expire in insertion order (the TTL is the
+    same for all of them), so expiry only ever pops from the front; max_entries bounds memory
+    even when the TTL is long. Meant for a single event loop, like the bot's.
+    """
+    def __init__(self, ttl_seconds=600, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> (expires_at, future), oldest first
+        self._entries = OrderedDict()
+
+    def _expire(self, now):
+        while self._entries:
+            key, (expires_at, future) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        self._expire(time.monotonic())
+        return len(self._entries)
+
+    async def run(self, key, action, cache_if=None):
+        """
+        Returns the result of `await action()` for key, running it only if no live entry exists.
+
+        cache_if(result) can refuse to keep a finished result (e.g. an upstream error), so the
+        next call retries; callers already waiting on it still share that result. An exception
+        is raised to every waiter and never cached.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._entries.get(key)
+        if entry is not None:
+            # shield: a cancelled duplicate must not cancel the original action
+            return await asyncio.shield(entry[1])
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (now + self.ttl_seconds, future)
+        try:
+            result = await action()
+        except asyncio.CancelledError:
+            self._discard(key, future)
+            future.cancel()
+            raise
+        except Exception as e:
+            self._discard(key, future)
+            future.set_exception(e)
+            # Mark it retrieved, nobody may be waiting on it
+            future.exception()
+            raise
+        future.set_result(result)
+        if cache_if is not None and not cache_if(result):
+            self._discard(key, future)
+        return result
+
+    def _discard(self, key, future):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is future:
+            del self._entries[key]
@@ -0,0 +1,248 @@
+import atexit
+import datetime
+import gzip
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+
+# Parent logger of the API traffic categories, see get_logger
+ROOT = "paysobuz"
+# http: request/response bodies, status: payment status checks (one per payment per monitor sweep),
+# payment: payment creation and method selection, bot: Telegram command flow
+CATEGORIES = ("http", "status", "payment", "bot")
+# Disabled categories still pass warnings and errors
+DISABLED_LEVEL = logging.WARNING
+# LogRecord attributes, which logging refuses as `extra` keys
+RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+# `extra` keys renamed with a trailing underscore: record attributes and the JSON line's own fields
+RESERVED_EXTRA = RECORD_ATTRS | {"ts", "level", "category"}
+
+
+# (root, category) -> CategoryLogger
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+
+class CategoryLogger(logging.Logger):
+    """
+    Logger of one category. Keeps `sample_rate` of its DEBUG calls, evenly spread (0.1: every
+    10th call); sampled-out and disabled calls return before a LogRecord is made. INFO and above
+    are never sampled. Records skip the caller's file/line lookup, the JSON lines do not carry it.
+    An `extra` key that is taken (args, message, level, ...) is written with a trailing underscore.
+    """
+    def __init__(self, name, category):
+        super().__init__(name)
+        self.category = category
+        self.sample_rate = 1.0
+        self._calls = itertools.count(1)
+        self.sampled_out = 0
+
+    def debug(self, msg, *args, **kwargs):
+        if not self.isEnabledFor(logging.DEBUG):
+            return
+        if self.sample_rate < 1.0:
+            # next() on a count is atomic, so threads sharing the logger do not skew the rate
+            calls = next(self._calls)
+            if int(calls * self.sample_rate) == int((calls - 1) * self.sample_rate):
+                self.sampled_out += 1
+                return
+        self._log(logging.DEBUG, msg, args, **kwargs)
+
+    def makeRecord(self, name, level, fn, lno, msg, args, exc_info, func=None, extra=None, sinfo=None):
+        # "args" or "message" in extra would make logging raise, and a log call must not break its caller
+        if extra and not RESERVED_EXTRA.isdisjoint(extra):
+            extra = {f"{key}_" if key in RESERVED_EXTRA else key: value for key, value in extra.items()}
+        return super().makeRecord(name, level, fn, lno, msg, args, exc_info, func, extra, sinfo)
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        # Not registered with the logging manager, whose cache reset only reaches its own loggers
+        self._cache.clear()
+
+    def findCaller(self, stack_info=False, stacklevel=1):
+        return "(unknown file)", 0, "(unknown function)", None
+
+
+def get_logger(category, root=ROOT):
+    """The CategoryLogger of category, a child of logging.getLogger(root)."""
+    with _loggers_lock:
+        logger = _loggers.get((root, category))
+        if logger is None:
+            logger = CategoryLogger(f"{root}.{category}", category)
+            logger.parent = logging.getLogger(root)
+            _loggers[(root, category)] = logger
+        return logger
+
+
+def parse_sample_rates(spec):
+    """Parses "status=0.1,http=0.5" into {"status": 0.1, "http": 0.5}."""
+    rates = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        category, _, rate = entry.partition("=")
+        try:
+            rates[category.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            print(f"[Logging] Ignoring invalid sample rate '{entry}'")
+    return rates
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record: time, level, category, message and the record's `extra` fields."""
+    # LogRecord attributes that are not `extra` fields
+    STANDARD_ATTRS = RECORD_ATTRS
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "category": record.name.rpartition(".")[2],
+            "msg": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in self.STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without formatting them and drops them once max_queued
+    are waiting, so logging never waits on the disk. Records are formatted later, on the writer
+    thread: log immutable values (or copies), not objects the caller goes on to modify.
+    """
+    def __init__(self, max_queued):
+        # SimpleQueue has no lock/condition pair to take on put; the size cap is approximate
+        super().__init__(queue.SimpleQueue())
+        self.max_queued = max_queued
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.max_queued:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+        self.enqueued += 1
+
+
+class GzipRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler whose rotated files (name.1.gz, name.2.gz, ...) are gzip-compressed."""
+    def __init__(self, filename, max_bytes, backups):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+        self.written = 0
+        self.rotations = 0
+
+    def emit(self, record):
+        super().emit(record)
+        self.written += 1
+
+    def namer(self, name):
+        return name + ".gz"
+
+    def rotator(self, source, dest):
+        with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+        self.rotations += 1
+
+
+class LogPipeline:
+    """
+    Queue-based logging for the API traffic categories.
+
+    Callers only check the category level and sample rate (see CategoryLogger) and enqueue; a
+    background thread formats the records as JSON lines and writes them to `path`, rotating it at
+    max_bytes into `backups` gzip files. Categories not in `categories` are set to WARNING, so
+    their debug/info calls return after one cached level check. console=True also prints
+    records to stdout.
+    """
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backups=5, queue_size=10000,
+                 categories=CATEGORIES, sample_rates=None, console=False, root=ROOT):
+        self.root = root
+        self.categories = set(categories)
+        self.file_handler = GzipRotatingFileHandler(path, max_bytes, backups)
+        self.file_handler.setFormatter(JsonLinesFormatter())
+        handlers = [self.file_handler]
+        if console:
+            stream = logging.StreamHandler()
+            stream.setFormatter(logging.Formatter("[%(name)s] %(message)s"))
+            handlers.append(stream)
+        self.sample_rates = dict(sample_rates or {})
+        self.queue_handler = NonBlockingQueueHandler(queue_size)
+        self._listener = logging.handlers.QueueListener(self.queue_handler.queue, *handlers)
+        self._started = False
+
+    def start(self):
+        logger = logging.getLogger(self.root)
+        logger.addHandler(self.queue_handler)
+        logger.setLevel(logging.DEBUG)
+        # Keep API traffic out of the bot's console log (logging.basicConfig on the root logger)
+        logger.propagate = False
+        for category in CATEGORIES:
+            get_logger(category, self.root).sample_rate = self.sample_rates.get(category, 1.0)
+            self.set_category(category, category in self.categories)
+        self._listener.start()
+        self._started = True
+        return self
+
+    def set_category(self, category, enabled):
+        get_logger(category, self.root).setLevel(logging.DEBUG if enabled else DISABLED_LEVEL)
+        if enabled:
+            self.categories.add(category)
+        else:
+            self.categories.discard(category)
+
+    def stop(self):
+        """Writes out the queued records and stops the writer thread."""
+        if not self._started:
+            return
+        self._started = False
+        logging.getLogger(self.root).removeHandler(self.queue_handler)
+        self._listener.stop()
+        self.file_handler.close()
+
+    def stats(self):
+        return {
+            "categories": sorted(self.categories),
+            "enqueued": self.queue_handler.enqueued,
+            "queued": self.queue_handler.queue.qsize(),
+            "dropped": self.queue_handler.dropped,
+            "sampled_out": sum(get_logger(category, self.root).sampled_out for category in CATEGORIES),
+            "written": self.file_handler.written,
+            "rotations": self.file_handler.rotations,
+        }
+
+
+# The process-wide pipeline, see configure
+pipeline = None
+_configure_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Starts the process-wide pipeline (LogPipeline arguments) once; later calls return it."""
+    global pipeline
+    with _configure_lock:
+        if pipeline is None:
+            pipeline = LogPipeline(**kwargs).start()
+            atexit.register(pipeline.stop)
+        return pipeline
+
+
+def set_category(category, enabled):
+    """Turns a category on or off in the process-wide pipeline (no-op before configure)."""
+    if pipeline is not None:
+        pipeline.set_category(category, enabled)
+
+
+def log_stats():
+    return pipeline.stats() if pipeline is not None else {}
@@ -0,0 +1,83 @@
+import re
+from collections import OrderedDict
+import httpx
+from colorama import Fore
+from .http_client import get_async_client, response_cache
+from .resilience import retry_async
+from .status_service import TERMINAL_STATUSES
+
+MIDTRANS_BASE_URL = "https://app.midtrans.com"
+# Methods whose SociaBuzz payments run through a Midtrans Snap token
+SNAP_METHODS = ("gopay", "shopeepay", "bca", "ovo", "dana", "linkaja")
+# Snap tokens are random (version 4) UUIDs; SociaBuzz order ids are time-based (version 1) UUIDs
+# and bank ids are plain numbers, Snap only ever answers "doesn't exist" for those
+SNAP_TOKEN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}", re.IGNORECASE)
+
+
+def is_snap_token(payment_id):
+    """True if payment_id can be a Snap token, i.e. worth a status request to Midtrans."""
+    return bool(payment_id) and SNAP_TOKEN.fullmatch(payment_id) is not None
+
+
+class MidtransStatusClient:
+    """
+    Read-only status of a Snap transaction by token.
+
+    Uses GET /snap/v1/transactions/{token}/status, the request Snap's own payment page polls,
+    instead of POST .../pay, which (re)starts a charge. Unchanged answers are not parsed again
+    (response_cache) and terminal ones are kept, so a finished payment is never asked about twice.
+    """
+    def __init__(self, session, base_url=MIDTRANS_BASE_URL, max_terminal=10000):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.max_terminal = max_terminal
+        # token -> terminal status, oldest first
+        self._terminal = OrderedDict()
+        self.stats = {"requests": 0, "terminal_hits": 0}
+
+    async def get_status(self, token, timeout=10):
+        """
+        Returns {"status", "status_code", "message", "payment_type"} for token, or None while
+        Snap has no charge for it (the payer has not picked a method yet) and on errors.
+        """
+        if token in self._terminal:
+            self.stats["terminal_hits"] += 1
+            return self._terminal[token]
+
+        url = f"{self.base_url}/snap/v1/transactions/{token}/status"
+        headers = {
+            'Accept': 'application/json',
+            'Origin': self.base_url,
+            'Referer': f"{self.base_url}/snap/v4/redirection/{token}"
+        }
+        self.stats["requests"] += 1
+        try:
+            result = await retry_async(lambda: response_cache.get(
+                get_async_client(self.session), url, self._parse_status, headers=headers, timeout=timeout))
+        except httpx.HTTPError as e:
+            print(f"{Fore.RED}Error reading Midtrans status: {e}")
+            return None
+
+        if result and result["status"] in TERMINAL_STATUSES:
+            self._terminal[token] = result
+            while len(self._terminal) > self.max_terminal:
+                self._terminal.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _parse_status(response):
+        if response.status_code != 200:
+            return None
+        try:
+            data = response.json()
+        except ValueError:
+            return None
+        # Before a charge exists Snap answers 200 with {"status_code": "404", ...} and no transaction_status
+        if not isinstance(data, dict) or not data.get("transaction_status"):
+            return None
+        return {
+            "status": data["transaction_status"],
+            "status_code": data.get("status_code"),
+            "message": data.get("status_message"),
+            "payment_type": data.get("payment_type")
+        }
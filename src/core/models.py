@@ -0,0 +1,177 @@
+import sys
+from datetime import datetime
+from enum import StrEnum
+
+
+class PaymentStatus(StrEnum):
+    """Known payment states. Members compare and hash like their string values."""
+    PENDING = "pending"
+    SUCCESS = "success"
+    CANCELLED = "cancelled"
+    CANCELLED_BY_USER = "cancelled_by_user"
+    FAILED_INITIALIZATION = "failed_initialization"
+    FAILED_API = "failed_api"
+
+    @classmethod
+    def parse(cls, value):
+        """Returns the member for value, or the plain string for states this version does not know."""
+        return _STATUS_BY_VALUE.get(value, value)
+
+
+_STATUS_BY_VALUE = {status.value: status for status in PaymentStatus}
+
+
+def _epoch(iso_string):
+    """Converts a stored ISO timestamp to integer epoch seconds, None if it is missing/invalid."""
+    try:
+        return int(datetime.fromisoformat(iso_string).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def _coerce_amount(amount):
+    """Stores amounts as int (or float for fractional values); anything non-numeric is kept as is."""
+    if isinstance(amount, (int, float)) and not isinstance(amount, bool):
+        return amount
+    try:
+        value = float(amount)
+    except (TypeError, ValueError):
+        return amount
+    return int(value) if value.is_integer() else value
+
+
+class Payment:
+    """
+    One payment record.
+
+    A slotted object instead of a dict (see bench_memory.py for the saving), status is a
+    PaymentStatus, amount is numeric and created_ts/updated_ts are epoch seconds.
+    It still supports the read/write mapping access the bot uses (payment['id'],
+    payment.get('details', {})), and converts to/from the stored dict shape with
+    from_dict/to_dict. Optional fields missing from an old record stay missing.
+    """
+    FIELDS = ("id", "user_id", "status", "url", "method", "amount", "message", "donor_name",
+              "created_at", "updated_at", "created_ts", "updated_ts", "details")
+    __slots__ = FIELDS + ("extra",)
+    _FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self, id, user_id, status=PaymentStatus.PENDING, url=None, method=None, amount=None,
+                 message=None, donor_name=None, created_at="", updated_at="", created_ts=None,
+                 updated_ts=None, details=None):
+        self.id = id
+        self.user_id = user_id
+        self.status = PaymentStatus.parse(status)
+        self.url = url
+        self.method = sys.intern(method) if isinstance(method, str) else method
+        self.amount = _coerce_amount(amount)
+        self.message = message
+        self.donor_name = donor_name
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.created_ts = created_ts if created_ts is not None else _epoch(created_at)
+        self.updated_ts = updated_ts if updated_ts is not None else _epoch(updated_at)
+        self.details = details if details is not None else {}
+        # Keys this version does not know about, kept so they survive a save
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, record):
+        payment = cls.__new__(cls)
+        payment.extra = None
+        # Plain setattr instead of __setitem__, this runs for every record on load
+        fields = cls._FIELD_SET
+        for key, value in record.items():
+            if key in fields:
+                setattr(payment, key, value)
+            else:
+                payment[key] = value
+        payment.status = _STATUS_BY_VALUE.get(record.get("status"), record.get("status", PaymentStatus.PENDING))
+        if "amount" in record:
+            payment.amount = _coerce_amount(payment.amount)
+        if isinstance(record.get("method"), str):
+            payment.method = sys.intern(payment.method)
+        # Fields the indexes rely on are always present
+        for key in ("created_at", "updated_at"):
+            if not hasattr(payment, key):
+                setattr(payment, key, "")
+        if getattr(payment, "created_ts", None) is None:
+            payment.created_ts = _epoch(payment.created_at)
+        if getattr(payment, "updated_ts", None) is None:
+            payment.updated_ts = _epoch(payment.updated_at)
+        if not hasattr(payment, "details"):
+            payment.details = {}
+        return payment
+
+    def to_dict(self):
+        record = {}
+        for key in self.FIELDS:
+            try:
+                record[key] = getattr(self, key)
+            except AttributeError:
+                # Optional field the original record did not have
+                continue
+        record["status"] = str(self.status)
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+    def overwrite(self, other):
+        """Replaces every field with other's, keeping this object (and its index entries) alive."""
+        for key in self.__slots__:
+            if hasattr(other, key):
+                setattr(self, key, getattr(other, key))
+            elif hasattr(self, key):
+                delattr(self, key)
+
+    # --- Mapping access, so callers written against the dict records keep working ---
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELD_SET:
+            if key == "status":
+                value = PaymentStatus.parse(value)
+            elif key == "amount":
+                value = _coerce_amount(value)
+            elif key == "method" and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if key in self._FIELD_SET:
+            return hasattr(self, key)
+        return bool(self.extra) and key in self.extra
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return self.to_dict().items()
+
+    def update(self, record):
+        for key, value in record.items():
+            self[key] = value
+
+    def __repr__(self):
+        return f"Payment({self.to_dict()!r})"
@@ -0,0 +1,239 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+import httpx
+from . import log_pipeline
+
+# Circuit state changes; openings are warnings, so they are written even while /debug is off
+http_log = log_pipeline.get_logger("http")
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request while the upstream host's circuit is open."""
+
+
+class RateLimitTimeout(httpx.PoolTimeout):
+    """Raised when no rate limit permit is available within the caller's deadline."""
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Exponential backoff with full jitter: a random delay up to min(cap, base * 2**attempt) seconds."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def retry_async(call, attempts=3, base=0.5, cap=8.0):
+    """
+    Awaits call() (a coroutine function), retrying transient transport errors with jittered backoff.
+
+    Only for idempotent requests. An open circuit is not retried (the host is known to be down),
+    nor a missed rate limit deadline.
+    """
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except (CircuitOpenError, RateLimitTimeout):
+            raise
+        except httpx.TransportError:
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(backoff_delay(attempt, base, cap))
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average and bursts of up to `burst`.
+
+    Permits are reserved under a thread lock and then slept for, so one bucket can be shared by
+    every thread and event loop; reservations are served in order. Tracks wait time for stats().
+    """
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.permits = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def reserve(self, timeout=None):
+        """Takes a permit; returns how long to wait before using it, RateLimitTimeout if that exceeds timeout."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens go negative while permits are reserved ahead of time
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                self.timeouts += 1
+                raise RateLimitTimeout(f"{self.name}: no permit within {timeout:g}s (next in {wait:.1f}s)")
+            self._tokens -= 1
+            self.permits += 1
+            if wait:
+                self.waited += 1
+                self.wait_seconds += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def release(self):
+        """Returns an unused permit (its caller gave up while waiting)."""
+        with self._lock:
+            self._tokens += 1
+
+    async def acquire(self, timeout=None):
+        """Waits for a permit, at most timeout seconds (None: as long as needed)."""
+        wait = self.reserve(timeout)
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.release()
+                raise
+
+    def stats(self):
+        with self._lock:
+            tokens = min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate)
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "available": round(tokens, 2),
+                "permits": self.permits,
+                "waited": self.waited,
+                "avg_wait": round(self.wait_seconds / self.waited, 3) if self.waited else 0,
+                "max_wait": round(self.max_wait, 3),
+                "total_wait": round(self.wait_seconds, 3),
+                "timeouts": self.timeouts,
+            }
+
+
+class CircuitBreaker:
+    """
+    Fails requests to one upstream host fast while it is erroring or too slow.
+
+    closed: requests pass; the outcomes of the last window_seconds are kept, and once there are
+    min_calls of them a failure rate (transport errors, 5xx, 429) or slow rate (slower than
+    slow_call_seconds) at or above the thresholds opens the circuit.
+    open: requests raise CircuitOpenError. After a jittered, exponentially growing delay
+    (open_seconds doubled per consecutive trip, capped at max_open_seconds) the circuit half-opens.
+    half_open: up to `probes` requests go through; all of them succeeding closes the circuit,
+    any failure opens it again for longer.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, window_seconds=30, min_calls=10, failure_rate=0.5, slow_call_seconds=8.0,
+                 slow_rate=0.8, open_seconds=5.0, max_open_seconds=300.0, probes=2):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probes = probes
+
+        self.state = self.CLOSED
+        # (finished_at, failed, latency) of recent requests
+        self._calls = deque()
+        # Consecutive openings without a successful half-open round, drives the backoff
+        self._trips = 0
+        self._open_until = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Admits a request or raises CircuitOpenError; pass the returned state to after_request."""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._open_until - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(f"{self.name} circuit is open, next probe in {remaining:.0f}s")
+                self._transition(self.HALF_OPEN, "probing")
+                self._probes_in_flight = self._probe_successes = 0
+            if self.state == self.HALF_OPEN:
+                if self._probes_in_flight >= self.probes:
+                    raise CircuitOpenError(f"{self.name} circuit is half-open, waiting for probes")
+                self._probes_in_flight += 1
+            return self.state
+
+    def after_request(self, admitted_state, failed, latency):
+        """Records a finished request; failed=None (cancelled) only releases its probe slot."""
+        with self._lock:
+            if admitted_state == self.HALF_OPEN:
+                self._probes_in_flight -= 1
+                if self.state != self.HALF_OPEN or failed is None:
+                    return
+                if failed or latency >= self.slow_call_seconds:
+                    self._open(f"probe {'failed' if failed else f'took {latency:.1f}s'}")
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.probes:
+                        self._trips = 0
+                        self._calls.clear()
+                        self._transition(self.CLOSED, f"{self.probes} probes succeeded")
+                return
+
+            if failed is None:
+                return
+            now = time.monotonic()
+            self._calls.append((now, failed, latency))
+            self._prune(now)
+            if self.state != self.CLOSED or len(self._calls) < self.min_calls:
+                return
+            errors, slow = self._rates()
+            if errors >= self.failure_rate:
+                self._open(f"error rate {errors:.0%} over {len(self._calls)} requests")
+            elif slow >= self.slow_rate:
+                self._open(f"{slow:.0%} of {len(self._calls)} requests slower than {self.slow_call_seconds:g}s")
+
+    def is_open(self):
+        """True while requests would fail fast; False once a probe may go through."""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() < self._open_until
+
+    def stats(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            errors, slow = self._rates()
+            latencies = sorted(latency for _, _, latency in self._calls)
+            return {
+                "state": self.state,
+                "window_requests": len(latencies),
+                "error_rate": round(errors, 2),
+                "slow_rate": round(slow, 2),
+                "p50_latency": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                "max_latency": round(latencies[-1], 3) if latencies else None,
+                "open_for": round(max(0.0, self._open_until - time.monotonic()), 1) if self.state == self.OPEN else 0,
+                "trips": self._trips,
+            }
+
+    def _rates(self):
+        if not self._calls:
+            return 0.0, 0.0
+        errors = sum(1 for _, failed, _ in self._calls if failed)
+        slow = sum(1 for _, _, latency in self._calls if latency >= self.slow_call_seconds)
+        return errors / len(self._calls), slow / len(self._calls)
+
+    def _prune(self, now):
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def _open(self, reason):
+        # Equal jitter: at least half the backoff, so a host that is down is not probed right away
+        delay = min(self.max_open_seconds, self.open_seconds * 2 ** self._trips)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self._trips += 1
+        self._open_until = time.monotonic() + delay
+        self._transition(self.OPEN, f"{reason}, retrying in {delay:.1f}s")
+
+    def _transition(self, state, reason):
+        log = http_log.warning if state == self.OPEN else http_log.info
+        log("circuit %s: %s -> %s (%s)", self.name, self.state, state, reason,
+            extra={"host": self.name, "from_state": self.state, "to_state": state, "reason": reason})
+        self.state = state
@@ -0,0 +1,131 @@
+import gc
+import json
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Bump when the layout of the stored data changes and add an upgrade step to _UPGRADES
+SCHEMA_VERSION = 1
+# Files written in a non-legacy format start with "#paysobuz-db v<schema> <format>\n"
+HEADER_PREFIX = b"#paysobuz-db "
+
+
+class SchemaVersionError(ValueError):
+    """The file was written by a newer version; loading it as empty would lose data on the next save."""
+
+
+@contextmanager
+def paused_gc():
+    """
+    Pauses the cyclic garbage collector while a large object graph is built. Parsing creates
+    millions of dicts, each allocation burst would otherwise trigger (useless) collections.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def dumps_json(obj):
+    """Compact JSON as bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads_json(payload):
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+class JsonSerializer:
+    """Pretty-printed JSON without a header, the original payment_history.json layout."""
+    name = "json"
+
+    def dumps(self, data):
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+    def loads(self, payload):
+        return json.loads(payload)
+
+
+class CompactJsonSerializer:
+    """Single-line JSON, encoded/decoded by orjson when available."""
+    name = "json-compact"
+
+    def dumps(self, data):
+        return dumps_json(data)
+
+    def loads(self, payload):
+        return loads_json(payload)
+
+
+class MsgpackSerializer:
+    """Binary MessagePack, needs `pip install msgpack`."""
+    name = "msgpack"
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, payload):
+        # user_id keys in old files may be ints
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+
+SERIALIZERS = {s.name: s for s in (JsonSerializer(), CompactJsonSerializer(), MsgpackSerializer())}
+
+# version -> function upgrading data of that version to version + 1
+_UPGRADES = {}
+
+
+def get_serializer(name):
+    serializer = SERIALIZERS.get(name)
+    if serializer is None:
+        raise ValueError(f"Unknown database format '{name}', expected one of: {', '.join(SERIALIZERS)}")
+    if serializer.name == "msgpack" and msgpack is None:
+        raise ValueError("Database format 'msgpack' needs the msgpack package (pip install msgpack)")
+    return serializer
+
+
+def encode(data, name="json"):
+    """Serializes the database contents. Every format except legacy "json" gets a versioned header."""
+    serializer = get_serializer(name)
+    payload = serializer.dumps(data)
+    if serializer.name == "json":
+        return payload
+    return HEADER_PREFIX + f"v{SCHEMA_VERSION} {serializer.name}\n".encode('ascii') + payload
+
+
+def decode(raw):
+    """Parses any supported format, detected from the header. Returns (data, format name)."""
+    with paused_gc():
+        return _decode(raw)
+
+
+def _decode(raw):
+    if not raw.startswith(HEADER_PREFIX):
+        # Headerless files are the legacy pretty-printed JSON, schema version 1
+        return JsonSerializer().loads(raw), "json"
+
+    header_end = raw.index(b"\n")
+    version, name = raw[len(HEADER_PREFIX):header_end].decode('ascii').split()
+    version = int(version.lstrip("v"))
+    if version > SCHEMA_VERSION:
+        raise SchemaVersionError(f"Database file has schema v{version}, this version only understands up to v{SCHEMA_VERSION}")
+    data = get_serializer(name).loads(raw[header_end + 1:])
+    while version < SCHEMA_VERSION:
+        data = _UPGRADES[version](data)
+        version += 1
+    return data, name
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from .filelock import InterProcessLock
+
+
+class SettingsStore:
+    """
+    User and global bot settings in their own small JSON file, next to the payment history.
+
+    Everything is cached in memory: reads never touch the disk, a write rewrites only this
+    file (atomically). With shared=True writes hold an advisory lock and first reload what
+    other processes wrote; readers pick up foreign changes within refresh_interval seconds.
+    """
+    def __init__(self, filename="bot_settings.json", shared=False, refresh_interval=1.0):
+        self.filename = filename
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._file_lock = InterProcessLock(f"{filename}.lock") if shared else None
+        self._disk_state = None
+        self._next_check = 0
+        self.existed = os.path.exists(filename)
+        self.data = self._load()
+        self._disk_state = self._disk_signature()
+
+    def _load(self):
+        data = {"user_settings": {}, "global_settings": {}}
+        if not os.path.exists(self.filename):
+            return data
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                data.update(json.load(f))
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+        return data
+
+    def _disk_signature(self):
+        try:
+            st = os.stat(self.filename)
+            return (st.st_ino, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self):
+        signature = self._disk_signature()
+        if signature != self._disk_state:
+            self.data = self._load()
+            self._disk_state = signature
+
+    def _maybe_refresh(self):
+        # Only a shared store can change behind our back; check at most every refresh_interval
+        if self._file_lock is None or time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.refresh_interval
+        if self._disk_signature() != self._disk_state:
+            # Same order as _update (thread lock first), otherwise the two can deadlock
+            with self._lock, self._file_lock:
+                self._reload_if_changed()
+
+    def _update(self, apply):
+        """Applies a change and writes the file, holding the inter-process lock if shared."""
+        with self._lock:
+            if self._file_lock is not None:
+                self._file_lock.acquire()
+            try:
+                if self._file_lock is not None:
+                    self._reload_if_changed()
+                apply(self.data)
+                self._save()
+            finally:
+                if self._file_lock is not None:
+                    self._file_lock.release()
+
+    def _save(self):
+        tmp_filename = f"{self.filename}.tmp"
+        try:
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_filename, self.filename)
+            self._disk_state = self._disk_signature()
+        except Exception as e:
+            print(f"Error saving settings: {e}")
+
+    def is_empty(self):
+        with self._lock:
+            return not self.data["user_settings"] and not self.data["global_settings"]
+
+    def import_settings(self, user_settings, global_settings):
+        """Merges settings from the legacy payment_history.json layout (existing keys win)."""
+        def apply(data):
+            for user_id, settings in (user_settings or {}).items():
+                merged = dict(settings)
+                merged.update(data["user_settings"].get(str(user_id), {}))
+                data["user_settings"][str(user_id)] = merged
+            for key, value in (global_settings or {}).items():
+                data["global_settings"].setdefault(key, value)
+        self._update(apply)
+
+    def get_user_setting(self, user_id, key, default=None):
+        """Get a specific setting for a user."""
+        self._maybe_refresh()
+        settings = self.data["user_settings"].get(str(user_id))
+        return settings.get(key, default) if settings else default
+
+    def set_user_setting(self, user_id, key, value):
+        """Set a specific setting for a user."""
+        self._update(lambda data: data["user_settings"].setdefault(str(user_id), {}).__setitem__(key, value))
+
+    def get_global_setting(self, key, default=None):
+        """Get a global setting."""
+        self._maybe_refresh()
+        return self.data["global_settings"].get(key, default)
+
+    def set_global_setting(self, key, value):
+        """Set a global setting."""
+        self._update(lambda data: data["global_settings"].__setitem__(key, value))
+
+    def close(self):
+        if self._file_lock is not None:
+            self._file_lock.close()
@@ -0,0 +1,180 @@
+import re
+from typing import NamedTuple
+
+# Payment page texts (pages are matched lowercased). Only the thank-you message proves a payment went through
+SUCCESS_MARKERS = ("terima kasih untuk dukungannya", "terimakasih atas dukungannya")
+PENDING_MARKERS = (
+    "menunggu pembayaran", "waiting for payment",
+    "qr_string", "scan qr",
+    "nomor virtual account", "virtual account number",
+    "cek ponsel anda", "check your phone",
+    "payment code", "kode pembayaran",
+    "complete payment", "selesaikan pembayaran",
+    "batas waktu", "pay before"
+)
+# A success marker right after one of these is an instruction ("jika pembayaran berhasil ..."), not a result
+FALSE_POSITIVE_TRIGGERS = ("jika ", "if ", "pastikan ", "ensure ", "menunggu ", "waiting ", "setelah ", "after ")
+
+
+class StatusVerdict(NamedTuple):
+    """Result of classifying a payment page."""
+    # "settlement", "pending" or "unknown" (no decisive marker)
+    status: str
+    # Marker that decided the status and its character offset in the page (None for "unknown")
+    marker: str | None
+    offset: int | None
+    # Page text around the marker, lowercase, for logs
+    context: str
+    # (marker, offset, context) of success markers rejected as false positives
+    ignored: tuple
+
+
+class PaymentStatusClassifier:
+    """
+    Finds the status markers of a payment page and applies the false positive rules.
+
+    classify() takes a whole page, stream() returns a StatusStream for pages read chunk by chunk;
+    both give the same verdict for the same page length. A success marker preceded (within
+    trigger_window characters) by a FALSE_POSITIVE_TRIGGERS entry is ignored. Otherwise success
+    wins if it starts no later than pending_lookahead characters after the first pending marker
+    (a paid page may show the payment code above the thank-you).
+
+    Further below, a thank-you may be a result template in the page scripts
+    (status_corpus/sociabuzz_pending_result_template.html). A page known to be at most
+    full_read_bytes long is read to the end and a thank-you there still wins unless it is inside a
+    <script> block. A longer page, or one of unknown length, is taken as pending once the stream
+    is pending_lookahead past a pending marker. pending_lookahead=None restores the old
+    whole-page scan, where a thank-you anywhere on the page won.
+    """
+    def __init__(self, success_markers=SUCCESS_MARKERS, pending_markers=PENDING_MARKERS,
+                 false_positive_triggers=FALSE_POSITIVE_TRIGGERS, trigger_window=20, context=50,
+                 pending_lookahead=8192, full_read_bytes=256 * 1024):
+        # Markers are searched with str.find on the lowercased page: CPython's substring search
+        # beats a combined regex (even a prefix-factored one) by 2-3x on these pages, see
+        # bench_status_classifier.py. Only the small trigger window goes through a regex.
+        self.success_markers = tuple(m.lower() for m in success_markers)
+        self.pending_markers = tuple(m.lower() for m in pending_markers)
+        self.triggers = re.compile("|".join(re.escape(t.lower()) for t in false_positive_triggers))
+        self.longest = max(len(m) for m in self.success_markers + self.pending_markers)
+        self.trigger_window = trigger_window
+        self.context = context
+        self.pending_lookahead = pending_lookahead
+        self.full_read_bytes = full_read_bytes
+
+    def classify(self, text):
+        """Classifies a whole page."""
+        stream = self.stream(len(text))
+        return stream.feed(text) or stream.finish()
+
+    def stream(self, length=None):
+        """StatusStream for a page of `length` characters or bytes (Content-Length), None if unknown."""
+        stream = StatusStream(self)
+        stream.expect(length)
+        return stream
+
+
+class StatusStream:
+    """Incremental classification of one page; keeps only a short tail of the text fed so far."""
+    def __init__(self, classifier):
+        self.classifier = classifier
+        self.tail = ""
+        # Characters fed before self.tail, to report offsets in the whole page
+        self.consumed = 0
+        self.ignored = []
+        # (marker, offset, context) of the first pending marker
+        self.pending = None
+        # Read a pending page to the end (small page), see PaymentStatusClassifier
+        self.to_end = False
+        # Page offsets of the last "<script" and "</script" seen, only tracked when reading to the end
+        self.script_open = self.script_close = -1
+
+    def expect(self, length):
+        """Tells the stream the page size before the first chunk (None if unknown)."""
+        limit = self.classifier.full_read_bytes
+        self.to_end = length is not None and limit is not None and length <= limit
+
+    def feed(self, chunk):
+        """Adds the next chunk of the page; returns the StatusVerdict once it is decided, else None."""
+        c = self.classifier
+        text = self.tail + chunk.lower()
+        # Matches lying entirely in the tail were handled by the previous call
+        fresh = len(self.tail)
+        base = self.consumed
+
+        opens, closes = [self.script_open], [self.script_close]
+        if self.to_end:
+            for tag, found in (("<script", opens), ("</script", closes)):
+                idx = text.find(tag, max(0, fresh - len(tag) + 1))
+                while idx != -1:
+                    found.append(base + idx)
+                    idx = text.find(tag, idx + 1)
+            self.script_open, self.script_close = opens[-1], closes[-1]
+
+        success = self._first_success(text, fresh)
+
+        # Earliest pending marker, only needed before that success; each hit narrows the next search
+        if not self.pending:
+            end = success[0] if success else len(text)
+            first = None
+            for marker in c.pending_markers:
+                idx = text.find(marker, max(0, fresh - len(marker) + 1), end + len(marker) - 1)
+                if idx != -1:
+                    first, end = (idx, marker), idx
+            if first:
+                self.pending = self._evidence(text, base, *first)
+
+        # Without a lookahead (None) a pending page is read to the end, in case a thank-you follows
+        horizon = None
+        if self.pending and c.pending_lookahead is not None:
+            horizon = self.pending[1] + c.pending_lookahead
+        while success and horizon is not None and base + success[0] > horizon:
+            if not self.to_end:
+                return self._verdict("pending", self.pending)
+            at = base + success[0]
+            if max(o for o in opens if o < at) <= max(e for e in closes if e < at):
+                break
+            # A thank-you inside a script far below the pending marker is a result template
+            self.ignored.append(self._evidence(text, base, *success))
+            success = self._first_success(text, fresh, success[0] + 1)
+        if success:
+            return self._verdict("settlement", self._evidence(text, base, *success))
+        if horizon is not None and not self.to_end and base + len(text) > horizon + c.longest:
+            return self._verdict("pending", self.pending)
+
+        keep = c.longest + max(c.context, c.trigger_window)
+        self.tail = text[-keep:]
+        self.consumed = base + len(text) - len(self.tail)
+        return None
+
+    def _first_success(self, text, fresh, start=0):
+        """(index, marker) of the earliest success marker from text[start] that is not a false positive."""
+        c = self.classifier
+        base = self.consumed
+        success = None
+        for marker in c.success_markers:
+            idx = text.find(marker, max(start, fresh - len(marker) + 1))
+            while idx != -1 and (success is None or idx < success[0]):
+                if c.triggers.search(text, max(0, idx - c.trigger_window), idx):
+                    self.ignored.append(self._evidence(text, base, idx, marker))
+                    idx = text.find(marker, idx + 1)
+                else:
+                    success = (idx, marker)
+        return success
+
+    def finish(self):
+        """Verdict once the page has ended."""
+        return self._verdict("pending", self.pending) if self.pending else self._verdict("unknown", (None, None, ""))
+
+    def _evidence(self, text, base, idx, marker):
+        """(marker, offset in the page, surrounding text) of a match at text[idx]."""
+        c = self.classifier
+        context = text[max(0, idx - c.context):idx + len(marker) + c.context].replace('\n', ' ').strip()
+        return marker, base + idx, context
+
+    def _verdict(self, status, evidence):
+        marker, offset, context = evidence
+        return StatusVerdict(status, marker, offset, context, tuple(self.ignored))
+
+
+# Shared instance, its marker tables are read-only
+default_classifier = PaymentStatusClassifier()
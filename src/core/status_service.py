@@ -0,0 +1,82 @@
+import asyncio
+from collections import OrderedDict
+from .idempotency import IdempotencyCache
+
+# Payment states that never change again (Midtrans transaction_status values)
+TERMINAL_STATUSES = ("settlement", "capture", "expire", "cancel", "deny")
+
+
+class StatusService:
+    """
+    Front door for payment status checks, shared by the payment monitor and the "Cek Status" button.
+
+    Concurrent checks of the same payment share one upstream request and its result is reused
+    for ttl_seconds. Terminal results are published: kept (up to max_published) and returned to
+    every later check of that payment without fetching again. A payment is identified by its
+    SociaBuzz page URL and by its token, either one is enough to find a published result.
+    A check joining one started with a longer permit_timeout (a button press during a monitor
+    sweep) waits at most its own permit_timeout for it and then returns None, as if its own
+    request had found no permit; the shared check goes on for the others.
+    Meant for a single event loop, like IdempotencyCache.
+    """
+    def __init__(self, api, ttl_seconds=5, max_published=10000):
+        self.api = api
+        self.max_published = max_published
+        self._checks = IdempotencyCache(ttl_seconds=ttl_seconds)
+        # url or token -> terminal result, oldest first
+        self._published = OrderedDict()
+        # key -> permit_timeout of the check fetching it right now
+        self._in_flight = {}
+        # checks: calls, fetches: upstream requests, published_hits: answered from a terminal result,
+        # deadline_misses: gave up on a shared check with a longer deadline
+        self.stats = {"checks": 0, "fetches": 0, "published_hits": 0, "deadline_misses": 0}
+
+    def published(self, payment_id=None, payment_url=None):
+        """The published terminal result of a payment, None if there is none yet."""
+        for key in (payment_url, payment_id):
+            if key and key in self._published:
+                return self._published[key]
+        return None
+
+    async def check(self, payment_id, method, payment_url, permit_timeout=10):
+        """Same arguments and result as APIManager.check_payment_status_async."""
+        self.stats["checks"] += 1
+        result = self.published(payment_id, payment_url)
+        if result is not None:
+            self.stats["published_hits"] += 1
+            return result
+
+        key = payment_url or payment_id
+
+        async def fetch():
+            self.stats["fetches"] += 1
+            self._in_flight[key] = permit_timeout
+            try:
+                return await self.api.check_payment_status_async(payment_id, method, payment_url, permit_timeout)
+            finally:
+                self._in_flight.pop(key, None)
+
+        if not key:
+            return await fetch()
+        # A failed check (None) is shared with whoever is waiting on it, but not kept
+        shared = self._checks.run(key, fetch, cache_if=lambda r: r is not None)
+        if self._in_flight.get(key, permit_timeout) > permit_timeout:
+            try:
+                # Cancelling a joined check leaves the shared one running (IdempotencyCache shields it)
+                result = await asyncio.wait_for(shared, permit_timeout)
+            except asyncio.TimeoutError:
+                self.stats["deadline_misses"] += 1
+                return None
+        else:
+            result = await shared
+        if result and result.get("status") in TERMINAL_STATUSES:
+            self._publish(payment_id, payment_url, result)
+        return result
+
+    def _publish(self, payment_id, payment_url, result):
+        for key in (payment_url, payment_id):
+            if key:
+                self._published[key] = result
+                self._published.move_to_end(key)
+        while len(self._published) > self.max_published:
+            self._published.popitem(last=False)
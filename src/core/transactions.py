@@ -1,29 +1,35 @@
+import asyncio
 import requests
+from types import MappingProxyType
 from bs4 import BeautifulSoup
 import re
 import json
 import os
 from .auth import AuthManager
+from .http_client import get_async_client, response_cache, run_sync
+from .resilience import retry_async
 
 class TransactionManager:
     def __init__(self, auth_manager=None):
         self.auth = auth_manager if auth_manager else AuthManager()
         self.base_url = "https://sociabuzz.com/proaccount/transaction"
-        self.headers = {
+        # Sent per request (read-only), the shared session headers are never touched
+        self.headers = MappingProxyType({
             "Referer": "https://sociabuzz.com/proaccount/transaction",
             "X-Requested-With": "XMLHttpRequest",
             "Accept": "application/json, text/javascript, */*; q=0.01"
-        }
+        })
         
+    @property
+    def client(self):
+        return get_async_client(self.auth.session)
+
     def save_to_json(self, filename="transactions.json"):
         """Fetches latest data and saves to a JSON file."""
         try:
             print(f"Fetching transaction data for {filename}...")
-            # Fetch various data points
-            balance_info = self.get_balance_info()
-            history = self.get_history(page=1)
-            pending = self.get_pending_transactions(page=1)
-            withdrawals = self.get_withdraw_history(page=1)
+            # Fetch various data points, concurrently
+            balance_info, history, pending, withdrawals = run_sync(self._fetch_snapshot_async())
             
             data = {
                 "timestamp": __import__('time').time(),
@@ -43,13 +49,28 @@ class TransactionManager:
             print(f"Error saving transaction data: {e}")
             return False
 
+    async def _fetch_snapshot_async(self):
+        return await asyncio.gather(
+            self.get_balance_info_async(),
+            self.get_history_async(page=1),
+            self.get_pending_transactions_async(page=1),
+            self.get_withdraw_history_async(page=1)
+        )
+
     def ensure_session(self):
         """Ensures that the session is valid and cookies are loaded."""
+        run_sync(self.ensure_session_async())
+
+    async def ensure_session_async(self):
         # self.auth.load_cookies() # Redundant if sharing AuthManager instance
-        if not self.auth.check_session():
+        if not await self.auth.check_session_async():
             raise Exception("Session invalid. Please login first.")
 
     def get_balance_info(self):
+        """Blocking wrapper of get_balance_info_async for the CLI."""
+        return run_sync(self.get_balance_info_async())
+
+    async def get_balance_info_async(self):
         """
         Fetches the menu data which includes current balance and total earnings.
         Returns:
@@ -60,29 +81,35 @@ class TransactionManager:
                 "raw_response": dict
             }
         """
-        self.ensure_session()
+        await self.ensure_session_async()
         endpoint = f"{self.base_url}/getMenu"
         
-        self.auth.session.headers.update(self.headers)
-        
         try:
-            r = self.auth.session.get(endpoint)
-            if r.status_code == 200:
-                data = r.json()
-                if data.get("success"):
-                    return {
-                        "balance": data.get("balance", 0),
-                        "total_saldo": data.get("totalSaldo", 0),
-                        "success": True,
-                        "raw_response": data
-                    }
-                return {"success": False, "error": "API returned success=False", "raw_response": data}
-            else:
-                return {"success": False, "error": f"HTTP {r.status_code}"}
+            # Unchanged responses come back from response_cache without being parsed again;
+            # timeouts and dropped connections are retried with backoff (GETs are idempotent)
+            return await retry_async(lambda: response_cache.get(self.client, endpoint, self._parse_menu, headers=self.headers))
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _parse_menu(self, r):
+        if r.status_code == 200:
+            data = r.json()
+            if data.get("success"):
+                return {
+                    "balance": data.get("balance", 0),
+                    "total_saldo": data.get("totalSaldo", 0),
+                    "success": True,
+                    "raw_response": data
+                }
+            return {"success": False, "error": "API returned success=False", "raw_response": data}
+        else:
+            return {"success": False, "error": f"HTTP {r.status_code}"}
+
     def get_history(self, page=1, search=""):
+        """Blocking wrapper of get_history_async for the CLI."""
+        return run_sync(self.get_history_async(page, search))
+
+    async def get_history_async(self, page=1, search=""):
         """
         Fetches transaction history.
         Args:
@@ -91,32 +118,32 @@ class TransactionManager:
         Returns:
             dict: Parsed transaction data.
         """
-        self.ensure_session()
+        await self.ensure_session_async()
         endpoint = f"{self.base_url}/getDataHistory"
         params = {"page": page, "search": search}
         
-        self.auth.session.headers.update(self.headers)
-        
         try:
-            r = self.auth.session.get(endpoint, params=params)
-            if r.status_code == 200:
-                data = r.json()
-                if data.get("success"):
-                    # Parse HTML data
-                    parsed_transactions = self._parse_transaction_html(data.get("data", ""))
-                    return {
-                        "success": True,
-                        "total": data.get("total", 0),
-                        "limit": data.get("limit", 10),
-                        "transactions": parsed_transactions,
-                        "raw_html": data.get("data", "")
-                    }
-                return {"success": False, "error": "API returned success=False", "raw_response": data}
-            else:
-                return {"success": False, "error": f"HTTP {r.status_code}"}
+            return await retry_async(lambda: response_cache.get(self.client, endpoint, self._parse_history, params=params, headers=self.headers))
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _parse_history(self, r):
+        if r.status_code == 200:
+            data = r.json()
+            if data.get("success"):
+                # Parse HTML data
+                parsed_transactions = self._parse_transaction_html(data.get("data", ""))
+                return {
+                    "success": True,
+                    "total": data.get("total", 0),
+                    "limit": data.get("limit", 10),
+                    "transactions": parsed_transactions,
+                    "raw_html": data.get("data", "")
+                }
+            return {"success": False, "error": "API returned success=False", "raw_response": data}
+        else:
+            return {"success": False, "error": f"HTTP {r.status_code}"}
+
     def _parse_transaction_html(self, html_content):
         """Parses the HTML content returned by the API."""
         soup = BeautifulSoup(html_content, 'html.parser')
@@ -165,41 +192,53 @@ class TransactionManager:
         return transactions
 
     def get_withdraw_history(self, page=1):
-        return self._fetch_generic_data("getDataWithdraw", page)
+        return run_sync(self.get_withdraw_history_async(page))
 
     def get_pending_transactions(self, page=1):
-        return self._fetch_generic_data("getDataPending", page)
+        return run_sync(self.get_pending_transactions_async(page))
 
     def get_waiting_payment(self, page=1):
-        return self._fetch_generic_data("getDataWaiting", page)
+        return run_sync(self.get_waiting_payment_async(page))
         
     def get_in_process(self, page=1, search=""):
-        return self._fetch_generic_data("getDataInprocess", page, search=search)
+        return run_sync(self.get_in_process_async(page, search))
+
+    async def get_withdraw_history_async(self, page=1):
+        return await self._fetch_generic_data_async("getDataWithdraw", page)
+
+    async def get_pending_transactions_async(self, page=1):
+        return await self._fetch_generic_data_async("getDataPending", page)
+
+    async def get_waiting_payment_async(self, page=1):
+        return await self._fetch_generic_data_async("getDataWaiting", page)
 
-    def _fetch_generic_data(self, endpoint_suffix, page, search=None):
+    async def get_in_process_async(self, page=1, search=""):
+        return await self._fetch_generic_data_async("getDataInprocess", page, search=search)
+
+    async def _fetch_generic_data_async(self, endpoint_suffix, page, search=None):
         """Helper for other similar endpoints."""
-        self.ensure_session()
+        await self.ensure_session_async()
         endpoint = f"{self.base_url}/{endpoint_suffix}"
         params = {"page": page}
         if search is not None:
             params["search"] = search
-            
-        self.auth.session.headers.update(self.headers)
         
         try:
-            r = self.auth.session.get(endpoint, params=params)
-            if r.status_code == 200:
-                data = r.json()
-                if data.get("success"):
-                    parsed_data = self._parse_transaction_html(data.get("data", ""))
-                    return {
-                        "success": True,
-                        "total": data.get("total", 0),
-                        "limit": data.get("limit", 10),
-                        "data": parsed_data
-                    }
-                return {"success": False, "error": "API returned success=False", "raw_response": data}
-            else:
-                return {"success": False, "error": f"HTTP {r.status_code}"}
+            return await retry_async(lambda: response_cache.get(self.client, endpoint, self._parse_generic_data, params=params, headers=self.headers))
         except Exception as e:
             return {"success": False, "error": str(e)}
+
+    def _parse_generic_data(self, r):
+        if r.status_code == 200:
+            data = r.json()
+            if data.get("success"):
+                parsed_data = self._parse_transaction_html(data.get("data", ""))
+                return {
+                    "success": True,
+                    "total": data.get("total", 0),
+                    "limit": data.get("limit", 10),
+                    "data": parsed_data
+                }
+            return {"success": False, "error": "API returned success=False", "raw_response": data}
+        else:
+            return {"success": False, "error": f"HTTP {r.status_code}"}
@@ -0,0 +1,147 @@
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the app.midtrans.com Snap endpoints the bot uses, for tests and benchmarks.
+# Usage: python stub_snap_server.py [port]   then point MidtransStatusClient(base_url=...) at it.
+STATUS_PATH = re.compile(r"^/snap/v1/transactions/([^/]+)/status$")
+PAY_PATH = re.compile(r"^/snap/v1/transactions/([^/]+)/pay$")
+
+STATUS_CODES = {"pending": "201", "settlement": "200", "capture": "200", "expire": "407", "cancel": "202", "deny": "202"}
+
+
+class StubSnapServer:
+    """
+    Serves GET .../{token}/status and POST .../{token}/pay from an in-memory transaction table.
+
+    status_latency / pay_latency add a fixed server-side delay (seconds) to each request, to
+    model a charge being more expensive than a status read. `requests` counts calls per endpoint.
+    set_page() also serves an HTML page at a path, standing in for a SociaBuzz payment page.
+    """
+    def __init__(self, port=0, status_latency=0.0, pay_latency=0.0):
+        self.status_latency = status_latency
+        self.pay_latency = pay_latency
+        # token -> {"transaction_status": ..., "payment_type": ...}
+        self.transactions = {}
+        self.requests = {"status": 0, "pay": 0}
+        # path -> HTML, see set_page
+        self.pages = {}
+        self.page_requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="stub-snap", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def set_status(self, token, status, payment_type="gopay"):
+        with self._lock:
+            self.transactions[token] = {"transaction_status": status, "payment_type": payment_type}
+
+    def set_page(self, path, html):
+        """Serves html at path; returns the page's URL."""
+        with self._lock:
+            self.pages[path] = html
+        return f"{self.base_url}{path}"
+
+    def _count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def _transaction(self, token):
+        with self._lock:
+            tx = self.transactions.get(token)
+        if tx is None:
+            return {"status_code": "404", "status_message": "Transaction doesn't exist."}
+        status = tx["transaction_status"]
+        return {
+            "status_code": STATUS_CODES.get(status, "201"),
+            "status_message": f"Success, transaction is {status}",
+            "transaction_id": str(uuid.uuid5(uuid.NAMESPACE_URL, token)),
+            "order_id": f"SBZ-{token[:8]}",
+            "gross_amount": "25000.00",
+            "currency": "IDR",
+            "payment_type": tx["payment_type"],
+            "transaction_time": "2026-10-17 20:00:00",
+            "transaction_status": status,
+            "fraud_status": "accept"
+        }
+
+    def _charge(self, token, payment_type):
+        # A charge answers with the transaction plus the payer's next steps
+        self.set_status(token, self.transactions.get(token, {}).get("transaction_status", "pending"), payment_type)
+        result = self._transaction(token)
+        result["actions"] = [
+            {"name": "generate-qr-code", "method": "GET", "url": f"{self.base_url}/v2/gopay/{token}/qr-code"},
+            {"name": "deeplink-redirect", "method": "GET", "url": f"gojek://gopay/merchanttransfer?tref={token}"},
+            {"name": "get-status", "method": "GET", "url": f"{self.base_url}/v2/{token}/status"},
+            {"name": "cancel", "method": "POST", "url": f"{self.base_url}/v2/{token}/cancel"}
+        ]
+        if payment_type == "bca_va":
+            result["va_numbers"] = [{"bank": "bca", "va_number": "12345" + token.replace("-", "")[:12]}]
+        return result
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with stub._lock:
+                    page = stub.pages.get(self.path)
+                    stub.page_requests += page is not None
+                if page is not None:
+                    return self._reply(200, page, "text/html; charset=utf-8")
+                match = STATUS_PATH.match(self.path)
+                if not match:
+                    return self._reply(404, {"error_messages": ["Not found"]})
+                stub._count("status")
+                time.sleep(stub.status_latency)
+                self._reply(200, stub._transaction(match.group(1)))
+
+            def do_POST(self):
+                match = PAY_PATH.match(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not match:
+                    return self._reply(404, {"error_messages": ["Not found"]})
+                stub._count("pay")
+                time.sleep(stub.pay_latency)
+                self._reply(200, stub._charge(match.group(1), payload.get("payment_type", "gopay")))
+
+            def _reply(self, code, body, content_type="application/json"):
+                data = (body if isinstance(body, str) else json.dumps(body)).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    server = StubSnapServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765).start()
+    server.set_status("demo-pending", "pending")
+    server.set_status("demo-paid", "settlement")
+    print(f"Stub Snap server on {server.base_url} (tokens: demo-pending, demo-paid)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,96 @@
+import asyncio
+import sys
+from urllib.parse import parse_qs
+import httpx
+import requests
+from src.core.api import APIManager
+
+# Checks APIManager._post_with_csrf_async against a mocked SociaBuzz: a rejected cached token
+# is refetched and the POST retried once, and a rejected token never stays in the cache.
+PAGE_URL = "https://sociabuzz.com/creator/tribe"
+ENDPOINT = "https://sociabuzz.com/creator/tribe/pay"
+
+
+class FakeSociaBuzz:
+    """Serves a new CSRF token on every page load and refuses the POSTs carrying a rejected one."""
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.page_loads = 0
+        self.posted_tokens = []
+
+    def handle(self, request):
+        if request.method == "GET":
+            self.page_loads += 1
+            html = f'<input type="hidden" name="sb_token_csrf" value="tok-{self.page_loads}">'
+            return httpx.Response(200, text=html)
+        token = parse_qs(request.content.decode())["sb_token_csrf"][0]
+        self.posted_tokens.append(token)
+        if token in self.rejected:
+            return httpx.Response(403, text="The action you have requested is not allowed.")
+        return httpx.Response(200, json={"status": "ok"})
+
+
+class MockedAPIManager(APIManager):
+    def __init__(self, server):
+        super().__init__(requests.Session())
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(server.handle))
+
+    @property
+    def async_client(self):
+        return self.client
+
+
+def post(api, count=1):
+    async def main():
+        try:
+            return [await api._post_with_csrf_async(PAGE_URL, ENDPOINT, {"amount": 1000}) for _ in range(count)]
+        finally:
+            await api.client.aclose()
+    return asyncio.run(main())
+
+
+def test_cached_token_reused():
+    server = FakeSociaBuzz()
+    responses = post(MockedAPIManager(server), count=3)
+    assert [r.status_code for r in responses] == [200] * 3
+    assert server.page_loads == 1 and server.posted_tokens == ["tok-1"] * 3, server.posted_tokens
+    print("cached token: ok")
+
+
+def test_rejected_cached_token_is_refetched_once():
+    # tok-1 goes stale after the first POST, the second POST refetches and retries
+    server = FakeSociaBuzz()
+    api = MockedAPIManager(server)
+
+    async def main():
+        try:
+            first = await api._post_with_csrf_async(PAGE_URL, ENDPOINT, {"amount": 1000})
+            server.rejected.add("tok-1")
+            second = await api._post_with_csrf_async(PAGE_URL, ENDPOINT, {"amount": 1000})
+            return first, second
+        finally:
+            await api.client.aclose()
+    first, second = asyncio.run(main())
+    assert (first.status_code, second.status_code) == (200, 200)
+    assert server.posted_tokens == ["tok-1", "tok-1", "tok-2"], server.posted_tokens
+    assert server.page_loads == 2, server.page_loads
+    assert api._csrf_cache[PAGE_URL][1] == "tok-2"
+    print("refetch on rejection: ok")
+
+
+def test_rejected_retry_clears_the_cache():
+    # Every token is refused: one retry only, and the refused token is not kept
+    server = FakeSociaBuzz(rejected={"tok-1", "tok-2"})
+    api = MockedAPIManager(server)
+    response, = post(api)
+    assert response.status_code == 403
+    assert server.posted_tokens == ["tok-1", "tok-2"], server.posted_tokens
+    assert PAGE_URL not in api._csrf_cache, api._csrf_cache
+    print("cache cleared after rejection: ok")
+
+
+if __name__ == "__main__":
+    test_cached_token_reused()
+    test_rejected_cached_token_is_refetched_once()
+    test_rejected_retry_clears_the_cache()
+    sys.exit(0)
@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from src.core.database import PaymentDatabase, SQLitePaymentDatabase
+from src.core.settings_store import SettingsStore
+
+# Stress test: several processes x threads write to one store at the same time,
+# then a fresh instance checks that no update was lost.
+PROCESSES = 4
+THREADS = 3
+ITERATIONS = 15
+SHARED_PAYMENT_ID = "shared_order"
+
+
+def open_database(engine, path):
+    if engine == "sqlite":
+        return SQLitePaymentDatabase(path)
+    # Small compaction threshold so processes also race journal compactions
+    return PaymentDatabase(path, journal=engine == "journal", compact_bytes=16 * 1024, shared=True)
+
+
+def writer(engine, path, worker):
+    db = open_database(engine, path)
+
+    def run(thread):
+        for i in range(ITERATIONS):
+            tag = f"w{worker}_t{thread}_{i}"
+            db.add_payment(worker, f"https://sociabuzz.com/payment/{tag}", "qris", 1000, "stress", "Tester", order_id=tag)
+            db.update_payment_status(tag, "success", {"writer": tag})
+            # Every writer merges its own key into the same record
+            db.update_payment_status(SHARED_PAYMENT_ID, "pending", {tag: True})
+            db.set_user_setting(worker, tag, i)
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    db.close()
+
+
+def run_stress(engine):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "stress.db" if engine == "sqlite" else "stress.json")
+    db = open_database(engine, path)
+    db.add_payment(0, "https://sociabuzz.com/payment/shared", "qris", 1000, "stress", "Tester", order_id=SHARED_PAYMENT_ID)
+    db.close()
+
+    processes = [multiprocessing.Process(target=writer, args=(engine, path, w)) for w in range(1, PROCESSES + 1)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0, f"writer process failed with exit code {p.exitcode}"
+
+    db = open_database(engine, path)
+    tags = [f"w{w}_t{t}_{i}" for w in range(1, PROCESSES + 1) for t in range(THREADS) for i in range(ITERATIONS)]
+    missing = [tag for tag in tags if (db.get_payment(tag) or {}).get("status") != "success"]
+    shared = db.get_payment(SHARED_PAYMENT_ID)
+    lost_details = [tag for tag in tags if tag not in shared["details"]]
+    lost_settings = [tag for tag in tags if db.get_user_setting(int(tag[1:tag.index("_")]), tag) is None]
+    per_worker = THREADS * ITERATIONS
+    totals = [db.get_user_success_total(w) for w in range(1, PROCESSES + 1)]
+    mismatches = db.verify_user_stats()
+    db.close()
+
+    print(f"[{engine}] {len(tags)} payments, missing={len(missing)}, lost details={len(lost_details)}, "
+          f"lost settings={len(lost_settings)}, stats mismatches={len(mismatches)}")
+    assert not missing, f"lost payments: {missing[:5]}"
+    assert not lost_details, f"lost detail updates: {lost_details[:5]}"
+    assert not lost_settings, f"lost settings: {lost_settings[:5]}"
+    assert totals == [per_worker * 1000] * PROCESSES, totals
+    assert not mismatches, mismatches[:3]
+
+
+def test_json_concurrent_writers():
+    run_stress("json")
+
+
+def test_journal_concurrent_writers():
+    run_stress("journal")
+
+
+def test_sqlite_concurrent_writers():
+    run_stress("sqlite")
+
+
+def test_settings_refresh_during_write():
+    # A reader reloading a changed file must not hold the file lock while it waits for the
+    # thread lock that a writer of the same instance already holds
+    path = os.path.join(tempfile.mkdtemp(), "bot_settings.json")
+    store = SettingsStore(path, shared=True, refresh_interval=0)
+    other = SettingsStore(path, shared=True, refresh_interval=0)
+    other.set_user_setting(2, "k", 1)
+    reader = threading.Thread(target=store.get_user_setting, args=(2, "k"), daemon=True)
+
+    def write():
+        # Same steps as _update, with the reader let in between taking the two locks
+        with store._lock:
+            reader.start()
+            time.sleep(0.2)
+            store.set_user_setting(1, "k", 1)
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    writer.join(timeout=10)
+    reader.join(timeout=10)
+    assert not writer.is_alive() and not reader.is_alive(), "settings store deadlocked"
+    store.close()
+    other.close()
+    check = SettingsStore(path)
+    assert (check.get_user_setting(1, "k"), check.get_user_setting(2, "k")) == (1, 1)
+
+
+if __name__ == "__main__":
+    for engine in sys.argv[1:] or ["json", "journal", "sqlite"]:
+        run_stress(engine)
+    test_settings_refresh_during_write()
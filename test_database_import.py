@@ -0,0 +1,114 @@
+import os
+import shutil
+import sys
+import tempfile
+from src.core.database import PaymentDatabase, SQLitePaymentDatabase
+
+# Checks the JSON -> SQLite importer (python main.py --import-json) against stores that keep
+# part of their data outside the snapshot.
+
+
+def add_successes(db, user_id, count, amount=100):
+    for i in range(count):
+        order_id = f"u{user_id}_{i}"
+        db.add_payment(user_id, f"https://sociabuzz.com/payment/{order_id}", "qris", amount, "test", "Tester",
+                       order_id=order_id)
+        db.update_payment_status(order_id, "success", {})
+
+
+def settings_path(tmp):
+    return os.path.join(tmp, "bot_settings.json")
+
+
+def test_import_replays_journal():
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "payment_history.json")
+        source = PaymentDatabase(json_path, journal=True, settings_filename=settings_path(tmp))
+        add_successes(source, 1, 5)
+        source.close()
+        # Every change is still in the journal, there is no snapshot yet
+        assert not os.path.exists(json_path)
+
+        target = SQLitePaymentDatabase(os.path.join(tmp, "payment_history.db"))
+        try:
+            assert target.import_from_json(json_path, settings_filename=settings_path(tmp)) == 5
+            assert target.count_payments() == 5
+            assert target.get_user_stats(1)["success_sum"] == 500
+        finally:
+            target.close()
+        print("journal import: ok")
+
+
+def archived_store(tmp):
+    """A store with 10 successful payments of 50, the 5 oldest of them archived."""
+    json_path = os.path.join(tmp, "payment_history.json")
+    archive_dir = os.path.join(tmp, "payment_archive")
+    source = PaymentDatabase(json_path, archive_dir=archive_dir, settings_filename=settings_path(tmp))
+    add_successes(source, 1, 10, amount=50)
+    for p in source.data["payments"][:5]:
+        p.updated_at = "2025-01-01T00:00:00"
+    assert source.archive_terminal(older_than_days=30) == 5
+    source.close()
+    return json_path, archive_dir
+
+
+def test_import_includes_archive():
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path, archive_dir = archived_store(tmp)
+        target = SQLitePaymentDatabase(os.path.join(tmp, "payment_history.db"))
+        try:
+            assert target.import_from_json(json_path, archive_dir=archive_dir, settings_filename=settings_path(tmp)) == 10
+            assert target.count_payments() == 10
+            assert target.get_payment("u1_0")["status"] == "success"
+            stats = target.get_user_stats(1)
+            assert (stats["success_count"], stats["success_sum"]) == (10, 500), stats
+            assert target.verify_user_stats() == []
+        finally:
+            target.close()
+        print("archive import: ok")
+
+
+def test_import_carries_rollups_of_lost_segments():
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path, archive_dir = archived_store(tmp)
+        shutil.rmtree(archive_dir)
+        target = SQLitePaymentDatabase(os.path.join(tmp, "payment_history.db"))
+        try:
+            # Only the hot payments have rows, the archived ones keep their recorded totals
+            assert target.import_from_json(json_path, archive_dir=archive_dir, settings_filename=settings_path(tmp)) == 5
+            stats = target.get_user_stats(1)
+            assert (stats["success_count"], stats["success_sum"]) == (10, 500), stats
+        finally:
+            target.close()
+        print("lost archive segments: ok")
+
+
+def test_import_reads_the_configured_settings_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "payment_history.json")
+        # DB_SETTINGS_FILE pointing away from the payment history
+        custom_settings = os.path.join(tmp, "config", "settings.json")
+        os.makedirs(os.path.dirname(custom_settings))
+        source = PaymentDatabase(json_path, settings_filename=custom_settings)
+        add_successes(source, 1, 1)
+        source.set_user_setting(1, "use_qris_logo", True)
+        source.set_global_setting("maintenance", True)
+        source.close()
+        assert not os.path.exists(settings_path(tmp))
+
+        target = SQLitePaymentDatabase(os.path.join(tmp, "payment_history.db"))
+        try:
+            assert target.import_from_json(json_path, settings_filename=custom_settings) == 1
+            assert target.get_user_setting(1, "use_qris_logo") is True
+            assert target.get_global_setting("maintenance") is True
+        finally:
+            target.close()
+        print("settings file import: ok")
+
+
+if __name__ == "__main__":
+    test_import_replays_journal()
+    test_import_includes_archive()
+    test_import_carries_rollups_of_lost_segments()
+    test_import_reads_the_configured_settings_file()
+    sys.exit(0)
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from src.core.database import PaymentDatabase
+
+# Checks write-behind (write_behind_ms): mutations are held in memory, reach the disk coalesced
+# on flush(), on close() and from the flusher thread, and a fresh instance sees every one.
+
+
+def add_payment(db, order_id, user_id=1):
+    db.add_payment(user_id, f"https://sociabuzz.com/payment/{order_id}", "qris", 1000, "test", "Tester",
+                   order_id=order_id)
+
+
+def count_snapshot_writes(db):
+    """Wraps db._write_snapshot; returns the list its calls are recorded in."""
+    writes = []
+    write_snapshot = db._write_snapshot
+
+    def counted(payload):
+        writes.append(len(payload))
+        write_snapshot(payload)
+    db._write_snapshot = counted
+    return writes
+
+
+def test_flush_writes_coalesced_mutations():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payment_history.json")
+        # A window long enough that only flush() writes
+        db = PaymentDatabase(path, write_behind_ms=60_000)
+        writes = count_snapshot_writes(db)
+        add_payment(db, "order_1")
+        db.update_payment_status("order_1", "pending", {"token": "tok-1"})
+        db.update_payment_status("order_1", "pending", {"message_id": 7})
+        add_payment(db, "order_2")
+        assert not os.path.exists(path) and writes == []
+
+        asyncio.run(db.flush())
+        assert len(writes) == 1, writes
+        check = PaymentDatabase(path)
+        assert check.get_payment("order_1")["details"] == {"token": "tok-1", "message_id": 7}
+        assert check.get_payment("order_2") is not None
+        check.close()
+        # Nothing left to write
+        asyncio.run(db.flush())
+        assert len(writes) == 1, writes
+        db.close()
+        print("flush: ok")
+
+
+def test_journal_flush_coalesces_entries():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payment_history.json")
+        db = PaymentDatabase(path, journal=True, write_behind_ms=60_000)
+        add_payment(db, "order_1")
+        for i in range(5):
+            db.update_payment_status("order_1", "pending", {"attempt": i})
+        db.flush_now()
+        with open(f"{path}.journal", encoding="utf-8") as f:
+            lines = f.readlines()
+        # Six upserts of one payment, one journal line
+        assert len(lines) == 1, lines
+        db.close()
+        check = PaymentDatabase(path, journal=True)
+        assert check.get_payment("order_1")["details"]["attempt"] == 4
+        check.close()
+        print("journal coalescing: ok")
+
+
+def test_close_writes_pending_mutations():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payment_history.json")
+        db = PaymentDatabase(path, write_behind_ms=60_000)
+        add_payment(db, "order_1")
+        db.update_payment_status("order_1", "success", {})
+        db.close()
+        check = PaymentDatabase(path)
+        assert check.get_payment("order_1")["status"] == "success"
+        assert check.get_user_success_total(1) == 1000
+        check.close()
+        print("close: ok")
+
+
+def test_flusher_thread_writes_after_the_window():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payment_history.json")
+        db = PaymentDatabase(path, write_behind_ms=20)
+        try:
+            add_payment(db, "order_1")
+            deadline = time.monotonic() + 5
+            while not os.path.exists(path) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            check = PaymentDatabase(path)
+            assert check.get_payment("order_1") is not None
+            check.close()
+        finally:
+            db.close()
+        print("flusher thread: ok")
+
+
+if __name__ == "__main__":
+    test_flush_writes_coalesced_mutations()
+    test_journal_flush_coalesces_entries()
+    test_close_writes_pending_mutations()
+    test_flusher_thread_writes_after_the_window()
+    sys.exit(0)
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from src.bot import telegram_bot
+from src.core import database
+from src.core.database import PaymentDatabase, SQLitePaymentDatabase
+
+# Checks the cursor pagination of a user's history on both engines (page boundaries, payments
+# created in the same second, the last page) and the bot's "user_transactions_page_" buttons.
+PAGE_SIZE = 10
+
+
+class FrozenNow:
+    """Makes database.datetime.now() return `at` while the test adds payments."""
+    def __init__(self):
+        self.at = datetime(2026, 1, 1, 12, 0, 0)
+        clock = self
+
+        class Frozen(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return clock.at
+        self.frozen = Frozen
+
+    def __enter__(self):
+        self.saved = database.datetime
+        database.datetime = self.frozen
+        return self
+
+    def __exit__(self, *exc):
+        database.datetime = self.saved
+
+
+def engines():
+    """Yields (name, empty database) for the JSON and the SQLite engine."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = PaymentDatabase(os.path.join(tmp, "payment_history.json"))
+        yield "json", db
+        db.close()
+        db = SQLitePaymentDatabase(os.path.join(tmp, "payment_history.db"))
+        yield "sqlite", db
+        db.close()
+
+
+def add_payments(db, user_id, seconds):
+    """One payment per entry of `seconds`, created that many seconds after noon; returns their ids newest first."""
+    added = []
+    with FrozenNow() as clock:
+        for second in seconds:
+            clock.at = datetime(2026, 1, 1, 12, 0, second)
+            order_id = str(uuid.uuid4())
+            db.add_payment(user_id, f"https://sociabuzz.com/payment/{order_id}", "qris", 1000, "test", "Tester",
+                           order_id=order_id)
+            added.append((clock.at.isoformat(), order_id))
+    return [order_id for _, order_id in sorted(added, reverse=True)]
+
+
+def walk(db, user_id, cursor_key):
+    """Follows cursor_key ("next_cursor" or "prev_cursor") from the first page; returns every page."""
+    pages = [db.get_user_history_page(user_id, None, PAGE_SIZE)]
+    while pages[-1][cursor_key]:
+        pages.append(db.get_user_history_page(user_id, pages[-1][cursor_key], PAGE_SIZE))
+    return pages
+
+
+def ids(page):
+    return [p["id"] for p in page["payments"]]
+
+
+def test_pages_cover_the_history_in_order():
+    for name, db in engines():
+        # Five payments per second, so most page boundaries fall inside a run of equal created_at
+        expected = add_payments(db, 1, [i // 5 for i in range(23)])
+        add_payments(db, 2, [0, 1])
+        pages = walk(db, 1, "next_cursor")
+        assert [len(p["payments"]) for p in pages] == [10, 10, 3], (name, pages)
+        assert [p["offset"] for p in pages] == [0, 10, 20], name
+        assert all(p["total"] == 23 for p in pages), name
+        assert sum((ids(p) for p in pages), []) == expected, name
+        assert pages[0]["prev_cursor"] is None and pages[-1]["next_cursor"] is None, name
+
+        # Walking back from the last page gives the same pages
+        back = [pages[-1]]
+        while back[-1]["prev_cursor"]:
+            back.append(db.get_user_history_page(1, back[-1]["prev_cursor"], PAGE_SIZE))
+        assert [ids(p) for p in back] == [ids(p) for p in reversed(pages)], name
+        assert [p["offset"] for p in back] == [20, 10, 0], name
+        print(f"{name} pages: ok")
+
+
+def test_ties_keep_their_order_across_pages():
+    for name, db in engines():
+        # Every payment in the same second, only the id breaks the tie
+        expected = add_payments(db, 1, [0] * 25)
+        pages = walk(db, 1, "next_cursor")
+        assert sum((ids(p) for p in pages), []) == expected, name
+        assert len(set(sum((ids(p) for p in pages), []))) == 25, name
+        # The cursor of the middle page leads back to the first one
+        assert ids(db.get_user_history_page(1, pages[1]["prev_cursor"], PAGE_SIZE)) == ids(pages[0]), name
+        print(f"{name} ties: ok")
+
+
+def test_no_empty_last_page():
+    for name, db in engines():
+        expected = add_payments(db, 1, range(20))
+        pages = walk(db, 1, "next_cursor")
+        # A history that fills its pages exactly does not offer a third, empty one
+        assert [len(p["payments"]) for p in pages] == [10, 10], (name, pages)
+        assert pages[-1]["next_cursor"] is None, name
+        # A cursor past the oldest payment, an old page number or an unknown id: first page
+        for cursor in (f"a{expected[-1]}", "2", f"a{expected[0]}x"):
+            assert ids(db.get_user_history_page(1, cursor, PAGE_SIZE)) == expected[:10], (name, cursor)
+        empty = db.get_user_history_page(3, None, PAGE_SIZE)
+        assert (empty["payments"], empty["total"], empty["next_cursor"], empty["prev_cursor"]) == ([], 0, None, None)
+        print(f"{name} last page: ok")
+
+
+def test_bot_buttons_follow_the_cursors():
+    for name, db in engines():
+        expected = add_payments(db, 42, [i // 4 for i in range(25)])
+        bot = telegram_bot.SocialBuzzBot.__new__(telegram_bot.SocialBuzzBot)
+        bot.db = db
+        shown = []
+
+        async def edit_message_text(text, reply_markup=None, **kwargs):
+            shown.append((text, reply_markup))
+
+        def press(data):
+            query = SimpleNamespace(data=data, message=SimpleNamespace(photo=None),
+                                    edit_message_text=edit_message_text)
+            update = SimpleNamespace(callback_query=query, effective_user=SimpleNamespace(id=42))
+            asyncio.run(bot.view_user_transactions(update, SimpleNamespace()))
+            text, markup = shown[-1]
+            buttons = {b.text: b.callback_data for row in markup.inline_keyboard for b in row}
+            return text, buttons
+
+        text, buttons = press("user_transactions")
+        assert "Halaman 1 dari 3" in text and text.count("✅") + text.count("⏳") == 10, (name, text)
+        assert set(buttons) == {"Selanjutnya ➡️", "🔙 Kembali"}, (name, buttons)
+        # Telegram refuses callback data over 64 bytes
+        assert len(buttons["Selanjutnya ➡️"].encode()) <= 64, buttons
+        text, buttons = press(buttons["Selanjutnya ➡️"])
+        assert "Halaman 2 dari 3" in text and "\n11. " in text and "\n21. " not in text, (name, text)
+        text, buttons = press(buttons["Selanjutnya ➡️"])
+        assert "Halaman 3 dari 3" in text and "\n25. " in text, (name, text)
+        assert "Selanjutnya ➡️" not in buttons, (name, buttons)
+        text, buttons = press(buttons["⬅️ Sebelumnya"])
+        assert "Halaman 2 dari 3" in text, (name, text)
+        assert buttons["⬅️ Sebelumnya"] == f"user_transactions_page_b{expected[10]}", (name, buttons)
+        print(f"{name} bot buttons: ok")
+
+
+if __name__ == "__main__":
+    test_pages_cover_the_history_in_order()
+    test_ties_keep_their_order_across_pages()
+    test_no_empty_last_page()
+    test_bot_buttons_follow_the_cursors()
+    sys.exit(0)
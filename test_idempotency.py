@@ -0,0 +1,145 @@
+import asyncio
+import sys
+from src.core.idempotency import IdempotencyCache
+
+# Checks IdempotencyCache as the payment method buttons use it: a double tap runs the
+# action once, results expire after the TTL, and errors reach every waiting caller.
+
+
+class Action:
+    """Counts calls and finishes when release() is called (or right away if not gated)."""
+    def __init__(self, result="ok", error=None, gated=True):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.gate = asyncio.Event()
+        if not gated:
+            self.gate.set()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return f"{self.result}-{self.calls}"
+
+    def release(self):
+        self.gate.set()
+
+
+def test_double_tap_runs_once():
+    async def main():
+        cache = IdempotencyCache(ttl_seconds=60)
+        action = Action()
+        first = asyncio.create_task(cache.run(("user", "qris"), action))
+        second = asyncio.create_task(cache.run(("user", "qris"), action))
+        await asyncio.sleep(0)
+        action.release()
+        results = await asyncio.gather(first, second)
+        # A later tap gets the finished result, another key runs on its own
+        later = await cache.run(("user", "qris"), action)
+        other = await cache.run(("user", "gopay"), action)
+        return results, later, other, action.calls
+
+    results, later, other, calls = asyncio.run(main())
+    assert results == ["ok-1", "ok-1"], results
+    assert later == "ok-1" and other == "ok-2", (later, other)
+    assert calls == 2, calls
+    print("double tap: ok")
+
+
+def test_entries_expire():
+    async def main():
+        cache = IdempotencyCache(ttl_seconds=0.05)
+        action = Action(gated=False)
+        first = await cache.run("key", action)
+        cached = await cache.run("key", action)
+        size = len(cache)
+        await asyncio.sleep(0.1)
+        expired_size = len(cache)
+        again = await cache.run("key", action)
+        return first, cached, size, expired_size, again
+
+    first, cached, size, expired_size, again = asyncio.run(main())
+    assert (first, cached, again) == ("ok-1", "ok-1", "ok-2"), (first, cached, again)
+    assert (size, expired_size) == (1, 0), (size, expired_size)
+    print("expiry: ok")
+
+
+def test_max_entries_drops_the_oldest():
+    async def main():
+        cache = IdempotencyCache(ttl_seconds=60, max_entries=2)
+        action = Action(gated=False)
+        for key in ("a", "b", "c"):
+            await cache.run(key, action)
+        # "a" was pushed out, "c" is still cached
+        return await cache.run("a", action), await cache.run("c", action), len(cache)
+
+    a, c, size = asyncio.run(main())
+    assert (a, c, size) == ("ok-4", "ok-3", 2), (a, c, size)
+    print("max entries: ok")
+
+
+def test_error_reaches_coalesced_callers():
+    async def main():
+        cache = IdempotencyCache(ttl_seconds=60)
+        failing = Action(error=RuntimeError("upstream down"))
+        first = asyncio.create_task(cache.run("key", failing))
+        second = asyncio.create_task(cache.run("key", failing))
+        await asyncio.sleep(0)
+        failing.release()
+        outcomes = await asyncio.gather(first, second, return_exceptions=True)
+        # The error is not cached, the next tap runs the action again
+        retry = await cache.run("key", Action(gated=False))
+        return outcomes, failing.calls, retry
+
+    outcomes, calls, retry = asyncio.run(main())
+    assert all(isinstance(o, RuntimeError) and str(o) == "upstream down" for o in outcomes), outcomes
+    assert calls == 1, calls
+    assert retry == "ok-1", retry
+    print("error propagation: ok")
+
+
+def test_refused_result_is_shared_but_not_kept():
+    async def main():
+        cache = IdempotencyCache(ttl_seconds=60)
+        action = Action(result="error")
+        keep = lambda result: not result.startswith("error")
+        first = asyncio.create_task(cache.run("key", action, cache_if=keep))
+        second = asyncio.create_task(cache.run("key", action, cache_if=keep))
+        await asyncio.sleep(0)
+        action.release()
+        shared = await asyncio.gather(first, second)
+        return shared, await cache.run("key", action, cache_if=keep)
+
+    shared, retry = asyncio.run(main())
+    assert shared == ["error-1", "error-1"], shared
+    assert retry == "error-2", retry
+    print("cache_if: ok")
+
+
+def test_cancelled_duplicate_keeps_the_original_running():
+    async def main():
+        cache = IdempotencyCache(ttl_seconds=60)
+        action = Action()
+        first = asyncio.create_task(cache.run("key", action))
+        second = asyncio.create_task(cache.run("key", action))
+        await asyncio.sleep(0)
+        second.cancel()
+        await asyncio.sleep(0)
+        action.release()
+        return await first, second.cancelled(), action.calls
+
+    result, cancelled, calls = asyncio.run(main())
+    assert (result, cancelled, calls) == ("ok-1", True, 1), (result, cancelled, calls)
+    print("cancelled duplicate: ok")
+
+
+if __name__ == "__main__":
+    test_double_tap_runs_once()
+    test_entries_expire()
+    test_max_entries_drops_the_oldest()
+    test_error_reaches_coalesced_callers()
+    test_refused_result_is_shared_but_not_kept()
+    test_cancelled_duplicate_keeps_the_original_running()
+    sys.exit(0)
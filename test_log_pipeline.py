@@ -0,0 +1,158 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+from src.bot import telegram_bot
+from src.core.log_pipeline import LogPipeline, get_logger, parse_sample_rates
+
+# Checks the queued JSON-lines log pipeline: record format, disabled categories, per-category
+# sampling, gzip rotation and dropping records when the writer falls behind. Each test uses
+# its own logger root so it does not touch the bot's pipeline.
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_json_lines_and_categories():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "api.jsonl")
+        pipeline = LogPipeline(path, categories=("payment",), root="t_format").start()
+        payment, http = get_logger("payment", "t_format"), get_logger("http", "t_format")
+        payment.info("select_payment_method", extra={"method": "gopay", "amount": 25000})
+        payment.debug("check %s id=%s", "Token", "tok-1")
+        http.debug("request", extra={"url": "https://sociabuzz.com"})
+        assert not http.isEnabledFor(logging.DEBUG)
+        http.warning("disabled categories still log warnings")
+        pipeline.set_category("http", True)
+        http.debug("response", extra={"status": 200})
+        pipeline.stop()
+
+        lines = read_lines(path)
+        assert [line["msg"] for line in lines] == ["select_payment_method", "check Token id=tok-1",
+                                                   "disabled categories still log warnings", "response"], lines
+        assert lines[0]["category"] == "payment" and lines[0]["level"] == "INFO", lines[0]
+        assert lines[0]["method"] == "gopay" and lines[0]["amount"] == 25000, lines[0]
+        assert lines[3]["category"] == "http" and lines[3]["status"] == 200, lines[3]
+        assert pipeline.stats()["written"] == 4, pipeline.stats()
+        print("format: ok")
+
+
+def test_sampling_keeps_info():
+    assert parse_sample_rates("status=0.1, http=2,bad=x") == {"status": 0.1, "http": 1.0}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "api.jsonl")
+        pipeline = LogPipeline(path, sample_rates={"status": 0.1}, root="t_sampling").start()
+        status, payment = get_logger("status", "t_sampling"), get_logger("payment", "t_sampling")
+        for i in range(100):
+            status.debug("check %d", i)
+            payment.debug("step %d", i)
+        status.info("settlement")
+        pipeline.stop()
+
+        lines = read_lines(path)
+        checks = [line["msg"] for line in lines if line["category"] == "status"]
+        # Every 10th debug record, evenly spread, and the info record
+        assert checks == [f"check {i}" for i in range(9, 100, 10)] + ["settlement"], checks
+        assert sum(1 for line in lines if line["category"] == "payment") == 100
+        assert pipeline.stats()["sampled_out"] == 90, pipeline.stats()
+        print("sampling: ok")
+
+
+def test_rotation_compresses():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "api.jsonl")
+        pipeline = LogPipeline(path, max_bytes=2000, backups=2, root="t_rotation").start()
+        log = get_logger("http", "t_rotation")
+        for i in range(200):
+            log.info("response %d", i, extra={"body": "x" * 100})
+        pipeline.stop()
+
+        assert sorted(os.listdir(tmp)) == ["api.jsonl", "api.jsonl.1.gz", "api.jsonl.2.gz"], os.listdir(tmp)
+        with gzip.open(path + ".1.gz", "rt", encoding="utf-8") as f:
+            rotated = [json.loads(line) for line in f]
+        current = read_lines(path)
+        # The newest backup ends right before the current file starts
+        assert int(rotated[-1]["msg"].split()[1]) + 1 == int(current[0]["msg"].split()[1])
+        assert current[-1]["msg"] == "response 199"
+        assert pipeline.stats()["rotations"] > 2, pipeline.stats()
+        print("rotation: ok")
+
+
+def test_full_queue_drops():
+    with tempfile.TemporaryDirectory() as tmp:
+        pipeline = LogPipeline(os.path.join(tmp, "api.jsonl"), queue_size=5, root="t_drop")
+        # Not started: nothing drains the queue
+        logging.getLogger("t_drop").addHandler(pipeline.queue_handler)
+        logging.getLogger("t_drop").propagate = False
+        log = get_logger("status", "t_drop")
+        for i in range(8):
+            log.warning("check %d", i)
+        logging.getLogger("t_drop").removeHandler(pipeline.queue_handler)
+        assert pipeline.queue_handler.enqueued == 5 and pipeline.queue_handler.dropped == 3, pipeline.stats()
+        pipeline.file_handler.close()
+        print("full queue: ok")
+
+
+def test_reserved_extra_keys_are_renamed():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "api.jsonl")
+        pipeline = LogPipeline(path, categories=("bot",), root="t_reserved").start()
+        log = get_logger("bot", "t_reserved")
+        log.info("taken keys", extra={"args": ["/pay"], "message": "hi", "level": 1, "user_id": 7})
+        pipeline.stop()
+
+        line, = read_lines(path)
+        assert (line["msg"], line["level"]) == ("taken keys", "INFO"), line
+        assert (line["args_"], line["message_"], line["level_"], line["user_id"]) == (["/pay"], "hi", 1, 7), line
+        print("reserved keys: ok")
+
+
+def test_pay_command_extras():
+    # The /pay handler's own log calls, written through a pipeline
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "api.jsonl")
+        pipeline = LogPipeline(path, categories=("bot",), root="t_bot").start()
+        bot = telegram_bot.SocialBuzzBot.__new__(telegram_bot.SocialBuzzBot)
+        bot.db = SimpleNamespace(get_global_setting=lambda key, default=None: None)
+        created, replies = [], []
+
+        async def execute_payment_creation(update, context, username, amount, message):
+            created.append((username, amount, message))
+
+        async def reply_text(text, **kwargs):
+            replies.append(text)
+        bot._execute_payment_creation = execute_payment_creation
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=42), message=SimpleNamespace(reply_text=reply_text))
+
+        saved, telegram_bot.bot_log = telegram_bot.bot_log, get_logger("bot", "t_bot")
+        try:
+            for args in (["kreatorbuzz", "25000", "semangat", "kak"], ["kreatorbuzz", "banyak"]):
+                asyncio.run(bot.create_payment_command(update, SimpleNamespace(user_data={}, args=args)))
+        finally:
+            telegram_bot.bot_log = saved
+        pipeline.stop()
+
+        assert created == [("kreatorbuzz", 25000, "semangat kak")], created
+        assert len(replies) == 1, replies
+        lines = read_lines(path)
+        assert [line["msg"] for line in lines] == ["/pay received", "/pay valid, creating payment",
+                                                   "/pay received", "/pay invalid format"], lines
+        assert (lines[1]["username"], lines[1]["amount"], lines[1]["note"]) == ("kreatorbuzz", 25000, "semangat kak")
+        assert lines[3]["argv"] == ["kreatorbuzz", "banyak"], lines[3]
+        print("/pay extras: ok")
+
+
+if __name__ == "__main__":
+    test_json_lines_and_categories()
+    test_sampling_keeps_info()
+    test_rotation_compresses()
+    test_full_queue_drops()
+    test_reserved_extra_keys_are_renamed()
+    test_pay_command_extras()
+    sys.exit(0)
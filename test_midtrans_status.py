@@ -0,0 +1,160 @@
+import asyncio
+import sys
+from types import SimpleNamespace
+import requests
+from src.bot import telegram_bot
+from src.core.api import APIManager
+from src.core.http_client import aclose_clients, response_cache
+from src.core.midtrans import MidtransStatusClient
+from stub_snap_server import StubSnapServer
+
+# Checks MidtransStatusClient against the local stub Snap server: status parsing, the
+# no-charge-yet answer, terminal caching, that check_payment_status never POSTs to /pay, which
+# ids it asks Snap about before falling back to the payment page, and that the pending monitor
+# keeps checking Snap payments while SociaBuzz is failing.
+SNAP_TOKEN = "42c61ac6-18a0-4ffd-9474-9cb098e47038"
+SOCIABUZZ_ORDER_ID = "284c8c26-054a-11f1-9647-062dd6ffe3b6"
+PENDING_PAGE = "<html><body><h4>Menunggu Pembayaran</h4><p>Scan QR untuk membayar</p></body></html>"
+
+
+def run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await aclose_clients()
+    return asyncio.run(main())
+
+
+def test_status_parsing():
+    stub = StubSnapServer().start()
+    try:
+        client = MidtransStatusClient(requests.Session(), base_url=stub.base_url)
+        stub.set_status("tok-pending", "pending", "gopay")
+        stub.set_status("tok-expired", "expire", "shopeepay")
+
+        async def checks():
+            return (await client.get_status("tok-pending"), await client.get_status("tok-expired"),
+                    await client.get_status("tok-unknown"))
+        pending, expired, unknown = run(checks())
+        assert pending == {"status": "pending", "status_code": "201", "message": "Success, transaction is pending",
+                           "payment_type": "gopay"}, pending
+        assert expired["status"] == "expire" and expired["status_code"] == "407", expired
+        # Snap has no charge for the token yet
+        assert unknown is None
+        print("parsing: ok")
+    finally:
+        stub.stop()
+
+
+def test_terminal_results_are_not_requested_again():
+    stub = StubSnapServer().start()
+    try:
+        client = MidtransStatusClient(requests.Session(), base_url=stub.base_url)
+        stub.set_status("tok-paid", "pending")
+
+        async def poll():
+            results = [await client.get_status("tok-paid")]
+            stub.set_status("tok-paid", "settlement")
+            for _ in range(5):
+                results.append(await client.get_status("tok-paid"))
+            return results
+        unchanged_before = response_cache.stats["unchanged"]
+        results = run(poll())
+        assert [r["status"] for r in results] == ["pending"] + ["settlement"] * 5, results
+        assert stub.requests == {"status": 2, "pay": 0}, stub.requests
+        assert client.stats == {"requests": 2, "terminal_hits": 4}, client.stats
+
+        # A pending answer that did not change is served without parsing it again
+        stub.set_status("tok-waiting", "pending")
+        run(client.get_status("tok-waiting"))
+        run(client.get_status("tok-waiting"))
+        assert response_cache.stats["unchanged"] == unchanged_before + 1, response_cache.stats
+        print("terminal caching: ok")
+    finally:
+        stub.stop()
+
+
+def test_check_payment_status_reads_without_charging():
+    stub = StubSnapServer().start()
+    try:
+        api = APIManager(requests.Session())
+        api.midtrans = MidtransStatusClient(api.session, base_url=stub.base_url)
+        stub.set_status(SNAP_TOKEN, "settlement", "bank_transfer")
+        result = run(api.check_payment_status_async(SNAP_TOKEN, "bca", None))
+        assert result == {"status": "settlement", "status_code": "200", "message": "Success, transaction is settlement"}, result
+        assert stub.requests["pay"] == 0, stub.requests
+        print("check_payment_status: ok")
+    finally:
+        stub.stop()
+
+
+def test_unknown_token_falls_back_to_the_page():
+    stub = StubSnapServer().start()
+    try:
+        api = APIManager(requests.Session())
+        api.midtrans = MidtransStatusClient(api.session, base_url=stub.base_url)
+        url = stub.set_page("/payment/x/unknown-token", PENDING_PAGE)
+        # Snap has no charge for the token yet ("404" in the body): the page decides
+        result = run(api.check_payment_status_async(SNAP_TOKEN, "gopay", url))
+        assert result["status"] == "pending", result
+        assert (stub.requests["status"], stub.page_requests) == (1, 1), (stub.requests, stub.page_requests)
+        print("snap 404 fallback: ok")
+    finally:
+        stub.stop()
+
+
+def test_non_snap_ids_skip_midtrans():
+    stub = StubSnapServer().start()
+    try:
+        api = APIManager(requests.Session())
+        api.midtrans = MidtransStatusClient(api.session, base_url=stub.base_url)
+        url = stub.set_page("/payment/x/order", PENDING_PAGE)
+        for payment_id, method in ((SOCIABUZZ_ORDER_ID, "bca"), ("12345081234567890", "bca"),
+                                   ("pay_1770584516_123456789", "gopay"), (None, "ovo")):
+            result = run(api.check_payment_status_async(payment_id, method, url))
+            assert result["status"] == "pending", (payment_id, result)
+        assert stub.requests["status"] == 0, stub.requests
+        assert stub.page_requests == 4, stub.page_requests
+        print("non-snap ids: ok")
+    finally:
+        stub.stop()
+
+
+def test_monitor_checks_snap_payments_while_sociabuzz_is_down():
+    payments = [
+        {"id": "p1", "method": "gopay", "details": {"token": SNAP_TOKEN}},
+        {"id": "p2", "method": "gopay", "details": {"token": SOCIABUZZ_ORDER_ID}},
+        {"id": "p3", "method": "qris", "details": {"token": SNAP_TOKEN}},
+        {"id": "p4", "method": "bca", "details": {}},
+    ]
+    checked = []
+
+    async def check_single_payment(app, payment):
+        checked.append(payment["id"])
+
+    bot = telegram_bot.SocialBuzzBot.__new__(telegram_bot.SocialBuzzBot)
+    bot.db = SimpleNamespace(get_pending_payments=lambda: payments)
+    bot._check_single_payment = check_single_payment
+    saved, telegram_bot.breakers = telegram_bot.breakers, {"sociabuzz": SimpleNamespace(is_open=lambda: True)}
+    try:
+        # One round, then the monitor is cancelled while it sleeps until the next one
+        asyncio.run(asyncio.wait_for(bot.monitor_pending_payments(None), 0.5))
+        assert False, "expected the monitor to keep running"
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        telegram_bot.breakers = saved
+    # Only the Snap method with a Snap token is read from Midtrans, the rest wait for SociaBuzz
+    assert checked == ["p1"], checked
+    print("monitor with SociaBuzz down: ok")
+
+
+if __name__ == "__main__":
+    test_status_parsing()
+    test_terminal_results_are_not_requested_again()
+    test_check_payment_status_reads_without_charging()
+    test_unknown_token_falls_back_to_the_page()
+    test_non_snap_ids_skip_midtrans()
+    test_monitor_checks_snap_payments_while_sociabuzz_is_down()
+    sys.exit(0)
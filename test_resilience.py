@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+from src.core import resilience
+from src.core.resilience import CircuitBreaker, CircuitOpenError, RateLimitTimeout, TokenBucket
+
+# Checks the upstream CircuitBreaker state machine on a fake clock (when it opens, how many
+# half-open probes it lets through and how its backoff grows) and the TokenBucket rate limiter.
+
+
+class FakeClock:
+    """Stands in for the time module of resilience while a test runs."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def __enter__(self):
+        self.saved = resilience.time
+        resilience.time = self
+        return self
+
+    def __exit__(self, *exc):
+        resilience.time = self.saved
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def record(breaker, failed=False, latency=0.1):
+    breaker.after_request(breaker.before_request(), failed, latency)
+
+
+def rejected(breaker):
+    try:
+        breaker.before_request()
+    except CircuitOpenError:
+        return True
+    return False
+
+
+def opened_breaker(**kwargs):
+    breaker = CircuitBreaker("test", min_calls=4, open_seconds=4.0, probes=2, **kwargs)
+    for _ in range(4):
+        record(breaker, failed=True)
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+def test_opens_on_error_rate():
+    handler = Records()
+    resilience.http_log.addHandler(handler)
+    try:
+        with FakeClock():
+            breaker = CircuitBreaker("test", min_calls=4, failure_rate=0.5)
+            record(breaker)
+            record(breaker, failed=True)
+            record(breaker, failed=True)
+            # Under min_calls nothing is decided yet
+            assert breaker.state == CircuitBreaker.CLOSED
+            record(breaker)
+            assert breaker.state == CircuitBreaker.OPEN
+            assert rejected(breaker) and breaker.is_open()
+    finally:
+        resilience.http_log.removeHandler(handler)
+    transition, = handler.records
+    assert transition.levelno == logging.WARNING
+    assert (transition.from_state, transition.to_state) == ("closed", "open"), transition.__dict__
+    print("error rate: ok")
+
+
+def test_opens_on_slow_rate():
+    with FakeClock():
+        breaker = CircuitBreaker("test", min_calls=4, slow_call_seconds=1.0, slow_rate=0.75)
+        for latency in (0.2, 1.5, 2.0, 0.3):
+            record(breaker, latency=latency)
+        # 2 of 4 slow is under the threshold
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker = CircuitBreaker("test", min_calls=4, slow_call_seconds=1.0, slow_rate=0.75)
+        for latency in (1.5, 0.2, 3.0, 1.0):
+            record(breaker, latency=latency)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.stats()["slow_rate"] == 0.75
+    print("slow rate: ok")
+
+
+def test_old_calls_leave_the_window():
+    with FakeClock() as clock:
+        breaker = CircuitBreaker("test", window_seconds=30, min_calls=4)
+        for _ in range(3):
+            record(breaker, failed=True)
+        clock.now += 31
+        # The failures expired, a fourth call is alone in the window
+        record(breaker, failed=True)
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.stats()["window_requests"] == 1
+    print("window: ok")
+
+
+def test_half_open_probe_limit():
+    with FakeClock() as clock:
+        breaker = opened_breaker()
+        clock.now += 4.0
+        assert not breaker.is_open()
+        first, second = breaker.before_request(), breaker.before_request()
+        assert first == second == CircuitBreaker.HALF_OPEN
+        # Only `probes` requests while half-open
+        assert rejected(breaker)
+        breaker.after_request(first, False, 0.1)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        breaker.after_request(second, False, 0.1)
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.stats()["trips"] == 0
+        assert breaker.before_request() == CircuitBreaker.CLOSED
+    print("probe limit: ok")
+
+
+def test_failed_probe_reopens_for_longer():
+    with FakeClock() as clock:
+        breaker = opened_breaker()
+        # Equal jitter: the first opening lasts 2-4s, the next one 4-8s
+        first_open = breaker.stats()["open_for"]
+        assert 2.0 <= first_open <= 4.0, first_open
+        clock.now += 4.0
+        breaker.after_request(breaker.before_request(), True, 0.1)
+        assert breaker.state == CircuitBreaker.OPEN
+        second_open = breaker.stats()["open_for"]
+        assert 4.0 <= second_open <= 8.0, second_open
+        assert breaker.stats()["trips"] == 2
+        # A slow probe counts as a failure too
+        clock.now += 8.0
+        breaker.after_request(breaker.before_request(), False, breaker.slow_call_seconds)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert 8.0 <= breaker.stats()["open_for"] <= 16.0
+    print("probe failure: ok")
+
+
+def test_cancelled_probe_releases_its_slot():
+    with FakeClock() as clock:
+        breaker = opened_breaker()
+        clock.now += 4.0
+        first, second = breaker.before_request(), breaker.before_request()
+        assert rejected(breaker)
+        # A cancelled probe says nothing about the host: its slot is freed, the state kept
+        breaker.after_request(first, None, 0)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        third = breaker.before_request()
+        assert third == CircuitBreaker.HALF_OPEN
+        breaker.after_request(second, False, 0.1)
+        breaker.after_request(third, False, 0.1)
+        assert breaker.state == CircuitBreaker.CLOSED
+    print("cancelled probe: ok")
+
+
+def test_bucket_deadline():
+    with FakeClock() as clock:
+        bucket = TokenBucket("test", rate=2, burst=2)
+        assert bucket.reserve(timeout=0) == 0
+        assert bucket.reserve(timeout=0) == 0
+        # The next permit is 0.5s away: past a 0.2s deadline, within a 1s one
+        try:
+            bucket.reserve(timeout=0.2)
+            assert False, "expected RateLimitTimeout"
+        except RateLimitTimeout:
+            pass
+        assert bucket.reserve(timeout=1) == 0.5
+        # A missed deadline takes no permit, the one after the reservation is 1s away
+        assert bucket.reserve() == 1.0
+        clock.now += 1.0
+        assert bucket.reserve(timeout=0.5) == 0.5
+        stats = bucket.stats()
+        assert (stats["permits"], stats["waited"], stats["timeouts"]) == (5, 3, 1), stats
+    print("bucket deadline: ok")
+
+
+def test_cancelled_wait_refunds_the_permit():
+    async def main():
+        bucket = TokenBucket("test", rate=1, burst=1)
+        await bucket.acquire()
+        waiter = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        # Only the refunded permit is owed: the next one is about 1s away, not 2s
+        return bucket.reserve()
+
+    wait = asyncio.run(main())
+    assert 0.85 < wait <= 1.0, wait
+    print("cancellation refund: ok")
+
+
+def test_shared_bucket_serves_reservations_in_order():
+    # Two threads, each with its own event loop, take permits from one bucket
+    bucket = TokenBucket("test", rate=20, burst=1)
+    granted = []
+    lock = threading.Lock()
+
+    def worker(name):
+        async def main():
+            for _ in range(5):
+                await bucket.acquire()
+                with lock:
+                    granted.append((time.monotonic(), name))
+        asyncio.run(main())
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(name,)) for name in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    times = sorted(at for at, _ in granted)
+    # One permit per 1/rate seconds across both threads, no two handed out together
+    assert len(times) == 10 and times[-1] - start >= 9 / 20 - 0.02, times[-1] - start
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) > 1 / 20 * 0.5, gaps
+    assert {name for _, name in granted} == {"a", "b"}
+    assert bucket.stats()["permits"] == 10
+    print("shared bucket: ok")
+
+
+if __name__ == "__main__":
+    test_opens_on_error_rate()
+    test_opens_on_slow_rate()
+    test_old_calls_leave_the_window()
+    test_half_open_probe_limit()
+    test_failed_probe_reopens_for_longer()
+    test_cancelled_probe_releases_its_slot()
+    test_bucket_deadline()
+    test_cancelled_wait_refunds_the_permit()
+    test_shared_bucket_serves_reservations_in_order()
+    sys.exit(0)
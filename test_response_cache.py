@@ -0,0 +1,143 @@
+import asyncio
+import sys
+import httpx
+from src.core.http_client import ResponseCache
+from src.core.status_classifier import default_classifier
+
+# Checks ResponseCache against a mocked payment page: a 304 returns the cached result, a body
+# starting with the digested prefix is not read past it, and a changed body is scanned again.
+URL = "https://sociabuzz.com/payment/x/order-1"
+PAID = "<html><body><h3>Terima kasih untuk dukungannya!</h3>"
+PENDING = "<html><body><div>Menunggu pembayaran</div>"
+FILLER = "<p>" + "x" * 1000 + "</p>\n"
+
+
+class FakePage:
+    """Serves `body` in chunks of `chunk_size` bytes, with an ETag if given; counts the chunks read."""
+    def __init__(self, body, etag=None, chunk_size=1024, content_length=False):
+        self.body = body
+        self.etag = etag
+        self.chunk_size = chunk_size
+        self.content_length = content_length
+        self.requests = []
+        self.chunks_read = 0
+
+    def handle(self, request):
+        self.requests.append(request)
+        headers = {"ETag": self.etag} if self.etag else {}
+        if self.etag and request.headers.get("If-None-Match") == self.etag:
+            return httpx.Response(304, headers=headers)
+        data = self.body.encode()
+        if self.content_length:
+            headers["Content-Length"] = str(len(data))
+
+        async def chunks():
+            for i in range(0, len(data), self.chunk_size):
+                self.chunks_read += 1
+                yield data[i:i + self.chunk_size]
+        return httpx.Response(200, headers=headers, content=chunks())
+
+
+class CountingScanner:
+    """A StatusStream that counts the chunks it is fed."""
+    def __init__(self):
+        self.stream = default_classifier.stream()
+        self.fed = 0
+
+    def expect(self, length):
+        self.stream.expect(length)
+
+    def feed(self, chunk):
+        self.fed += 1
+        return self.stream.feed(chunk)
+
+    def finish(self):
+        return self.stream.finish()
+
+
+def scan(cache, page, times=1):
+    """Scans URL `times` times; returns [(verdict status, chunks fed to the scanner)]."""
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(page.handle)) as client:
+            results = []
+            for _ in range(times):
+                scanner = CountingScanner()
+                verdict, _ = await cache.scan(client, URL, scanner)
+                results.append((verdict.status, scanner.fed))
+            return results
+    return asyncio.run(main())
+
+
+def test_not_modified_returns_the_cached_result():
+    page = FakePage(PENDING + FILLER, etag='"v1"')
+    cache = ResponseCache()
+    parsed = []
+
+    def parse(response):
+        parsed.append(response.status_code)
+        return {"length": len(response.text)}
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(page.handle)) as client:
+            return [await cache.get(client, URL, parse) for _ in range(2)]
+
+    first, second = asyncio.run(main())
+    assert first is second and parsed == [200], parsed
+    assert page.requests[1].headers["If-None-Match"] == '"v1"'
+    assert cache.stats == {"not_modified": 1, "unchanged": 0, "misses": 1}, cache.stats
+
+    # scan() sends the same validators
+    cache = ResponseCache()
+    (status, _), (cached, fed) = scan(cache, page, times=2)
+    assert (status, cached, fed) == ("pending", "pending", 0)
+    assert cache.stats["not_modified"] == 1, cache.stats
+    print("304: ok")
+
+
+def test_same_prefix_skips_the_rest_of_the_body():
+    # The thank-you decides the page in its first chunk, 30 more follow
+    page = FakePage(PAID + FILLER * 30)
+    cache = ResponseCache()
+    (status, fed), = scan(cache, page)
+    assert (status, fed) == ("settlement", 1)
+    assert not cache._entries[URL].complete
+
+    page.chunks_read = 0
+    (status, fed), = scan(cache, page)
+    # Only the digested prefix was read and nothing was scanned
+    assert (status, fed) == ("settlement", 0)
+    assert page.chunks_read == 1, page.chunks_read
+    assert cache.stats == {"not_modified": 0, "unchanged": 1, "misses": 1}, cache.stats
+    print("digest prefix: ok")
+
+
+def test_changed_body_is_scanned_again():
+    page = FakePage(PENDING + FILLER * 2, chunk_size=256)
+    cache = ResponseCache()
+    assert scan(cache, page) == [("pending", 9)]
+    # Same length, new text: the paid page replaces the pending one
+    page.body = PAID.ljust(len(PENDING)) + FILLER * 2
+    (status, fed), = scan(cache, page)
+    assert status == "settlement" and fed >= 1
+    assert cache.stats == {"not_modified": 0, "unchanged": 0, "misses": 2}, cache.stats
+    # And the new verdict is what the next unchanged body gets
+    assert scan(cache, page) == [("settlement", 0)]
+    assert cache.stats["unchanged"] == 1, cache.stats
+    print("changed body: ok")
+
+
+def test_content_length_lets_a_small_page_be_read_to_the_end():
+    # The thank-you is ~12 KB below the pending marker, past the classifier's lookahead
+    body = PENDING + FILLER * 12 + "<div>Terima kasih untuk dukungannya</div></body></html>"
+    assert scan(ResponseCache(), FakePage(body, content_length=True))[0][0] == "settlement"
+    # Chunked (no Content-Length): the stream stops at the lookahead
+    assert scan(ResponseCache(), FakePage(body))[0][0] == "pending"
+    print("content length: ok")
+
+
+if __name__ == "__main__":
+    test_not_modified_returns_the_cached_result()
+    test_same_prefix_skips_the_rest_of_the_body()
+    test_changed_body_is_scanned_again()
+    test_content_length_lets_a_small_page_be_read_to_the_end()
+    sys.exit(0)
@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+from src.core.status_classifier import PaymentStatusClassifier, default_classifier
+
+# Accuracy regression test: every saved page in status_corpus/ must get its labelled status and
+# marker, whether it is classified whole or streamed in chunks of any size.
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "status_corpus")
+CHUNK_SIZES = [1, 7, 64, 4096]
+
+
+def load_corpus():
+    """Returns [(file name, page text, label)] for every page listed in labels.json."""
+    with open(os.path.join(CORPUS_DIR, "labels.json"), encoding="utf-8") as f:
+        labels = json.load(f)
+    corpus = []
+    for name, label in labels.items():
+        with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+            corpus.append((name, f.read(), label))
+    return corpus
+
+
+def classify_streamed(text, chunk_size):
+    stream = default_classifier.stream()
+    for i in range(0, len(text), chunk_size):
+        verdict = stream.feed(text[i:i + chunk_size])
+        if verdict:
+            return verdict
+    return stream.finish()
+
+
+def check(name, verdict, label, mode):
+    assert (verdict.status, verdict.marker) == (label["status"], label["marker"]), \
+        f"{name} ({mode}): got {verdict.status}/{verdict.marker}, expected {label['status']}/{label['marker']}"
+
+
+def test_corpus_accuracy():
+    corpus = load_corpus()
+    for name, text, label in corpus:
+        check(name, default_classifier.classify(text), label, "whole")
+    print(f"whole page: {len(corpus)}/{len(corpus)} correct")
+
+
+def test_corpus_accuracy_streamed():
+    corpus = load_corpus()
+    for chunk_size in CHUNK_SIZES:
+        for name, text, label in corpus:
+            verdict = classify_streamed(text, chunk_size)
+            check(name, verdict, label, f"{chunk_size}-char chunks")
+            # Evidence points at the marker in the original page
+            if verdict.marker:
+                assert text[verdict.offset:verdict.offset + len(verdict.marker)].lower() == verdict.marker, name
+        print(f"{chunk_size}-char chunks: {len(corpus)}/{len(corpus)} correct")
+
+
+def test_false_positive_evidence():
+    verdict = default_classifier.classify("Jika berhasil, terima kasih untuk dukungannya tampil. Menunggu pembayaran")
+    assert verdict.status == "pending"
+    assert [marker for marker, _, _ in verdict.ignored] == ["terima kasih untuk dukungannya"]
+
+
+def test_pending_lookahead():
+    # The thank-you of this page is a result template 9.5 KB below the pending badge
+    with open(os.path.join(CORPUS_DIR, "sociabuzz_pending_result_template.html"), encoding="utf-8") as f:
+        text = f.read()
+    assert default_classifier.classify(text).status == "pending"
+    # Without a lookahead a thank-you anywhere wins, as in the old whole-page scan
+    anywhere = PaymentStatusClassifier(pending_lookahead=None)
+    stream = anywhere.stream()
+    streamed = next(filter(None, (stream.feed(text[i:i + 64]) for i in range(0, len(text), 64))), None)
+    assert anywhere.classify(text).status == streamed.status == "settlement"
+
+
+def paid_page_with_long_receipt():
+    """sociabuzz_paid_receipt.html with ~10 KB of receipt rows between the payment code and the thank-you."""
+    with open(os.path.join(CORPUS_DIR, "sociabuzz_paid_receipt.html"), encoding="utf-8") as f:
+        text = f.read()
+    at = text.index('<div class="payment-success">')
+    rows = "".join(f'<tr><td>Pesan {i}</td><td>Semangat terus berkarya, ditunggu konten berikutnya!</td></tr>\n'
+                   for i in range(120))
+    return text[:at] + f'<table class="table payment-messages">\n{rows}</table>\n' + text[at:]
+
+
+def test_small_page_read_to_the_end():
+    text = paid_page_with_long_receipt()
+    code, thanks = text.lower().index("kode pembayaran"), text.lower().index("terima kasih untuk dukungannya")
+    assert thanks - code > default_classifier.pending_lookahead
+    # The page length is known and small: read to the end, the thank-you outside the scripts wins
+    assert default_classifier.classify(text).status == "settlement"
+    for chunk_size in CHUNK_SIZES:
+        stream = default_classifier.stream(len(text.encode()))
+        verdict = next(filter(None, (stream.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size))),
+                       None) or stream.finish()
+        assert (verdict.status, verdict.offset) == ("settlement", thanks), (chunk_size, verdict)
+    # Unknown or large length: the stream stops pending_lookahead past the payment code
+    assert classify_streamed(text, 64).status == "pending"
+    assert PaymentStatusClassifier(full_read_bytes=16 * 1024).classify(text).status == "pending"
+
+    # A small page whose only thank-you is far below, inside a script, stays pending
+    with open(os.path.join(CORPUS_DIR, "sociabuzz_pending_result_template.html"), encoding="utf-8") as f:
+        template = f.read()
+    verdict = default_classifier.classify(template)
+    assert verdict.status == "pending" and len(template) < default_classifier.full_read_bytes
+    assert [marker for marker, _, _ in verdict.ignored] == ["terima kasih untuk dukungannya"], verdict.ignored
+
+
+if __name__ == "__main__":
+    test_corpus_accuracy()
+    test_corpus_accuracy_streamed()
+    test_false_positive_evidence()
+    test_pending_lookahead()
+    test_small_page_read_to_the_end()
+    sys.exit(0)
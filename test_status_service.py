@@ -0,0 +1,154 @@
+import asyncio
+import sys
+from src.core.status_service import StatusService
+
+# Checks StatusService with a fake APIManager: concurrent checks share one upstream request,
+# results are reused for the TTL and terminal ones for good, errors reach every waiting
+# caller, and a button press does not inherit the monitor's longer deadline.
+URL = "https://sociabuzz.com/payment/x/order-1"
+
+
+class FakeAPI:
+    """check_payment_status_async answering `results` in turn, each once release() is called."""
+    def __init__(self, *results, gated=False):
+        self.results = list(results)
+        self.calls = []
+        self.gate = asyncio.Event()
+        if not gated:
+            self.gate.set()
+
+    async def check_payment_status_async(self, payment_id, method, payment_url, permit_timeout=10):
+        self.calls.append(permit_timeout)
+        await self.gate.wait()
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def release(self):
+        self.gate.set()
+
+
+def pending():
+    return {"status": "pending", "status_code": "201", "message": "Payment Pending"}
+
+
+def settled():
+    return {"status": "settlement", "status_code": "200", "message": "Payment Successful"}
+
+
+def test_concurrent_checks_share_one_request():
+    async def main():
+        api = FakeAPI(pending(), gated=True)
+        service = StatusService(api, ttl_seconds=60)
+        checks = [asyncio.create_task(service.check("tok-1", "qris", URL)) for _ in range(3)]
+        await asyncio.sleep(0)
+        api.release()
+        return await asyncio.gather(*checks), service.stats
+
+    results, stats = asyncio.run(main())
+    assert results == [pending()] * 3, results
+    assert (stats["checks"], stats["fetches"]) == (3, 1), stats
+    print("single flight: ok")
+
+
+def test_results_reused_for_the_ttl():
+    async def main():
+        api = FakeAPI(pending(), pending())
+        service = StatusService(api, ttl_seconds=0.05)
+        first = await service.check("tok-1", "qris", URL)
+        cached = await service.check("tok-1", "qris", URL)
+        fetches = service.stats["fetches"]
+        await asyncio.sleep(0.1)
+        await service.check("tok-1", "qris", URL)
+        return first, cached, fetches, service.stats["fetches"]
+
+    first, cached, fetches, later_fetches = asyncio.run(main())
+    assert first == cached == pending()
+    assert (fetches, later_fetches) == (1, 2), (fetches, later_fetches)
+    print("ttl cache: ok")
+
+
+def test_terminal_results_are_published():
+    async def main():
+        api = FakeAPI(settled())
+        service = StatusService(api, ttl_seconds=0.01)
+        await service.check("tok-1", "qris", URL)
+        await asyncio.sleep(0.02)
+        # Past the TTL, and found by the token alone
+        return await service.check("tok-1", "qris", None), service.published(payment_url=URL), service.stats
+
+    result, published, stats = asyncio.run(main())
+    assert result == published == settled()
+    assert (stats["fetches"], stats["published_hits"]) == (1, 1), stats
+    print("published: ok")
+
+
+def test_errors_reach_every_waiting_check():
+    async def main():
+        api = FakeAPI(RuntimeError("upstream down"), None, pending(), gated=True)
+        service = StatusService(api, ttl_seconds=60)
+        checks = [asyncio.create_task(service.check("tok-1", "qris", URL)) for _ in range(2)]
+        await asyncio.sleep(0)
+        api.release()
+        outcomes = await asyncio.gather(*checks, return_exceptions=True)
+        # Neither the error nor a failed check (None) is kept
+        failed = await service.check("tok-1", "qris", URL)
+        retried = await service.check("tok-1", "qris", URL)
+        return outcomes, failed, retried, service.stats["fetches"]
+
+    outcomes, failed, retried, fetches = asyncio.run(main())
+    assert all(isinstance(o, RuntimeError) for o in outcomes), outcomes
+    assert (failed, retried, fetches) == (None, pending(), 3), (failed, retried, fetches)
+    print("errors: ok")
+
+
+def test_button_does_not_wait_out_the_monitor_deadline():
+    async def main():
+        api = FakeAPI(pending(), gated=True)
+        service = StatusService(api, ttl_seconds=60)
+        monitor = asyncio.create_task(service.check("tok-1", "qris", URL, permit_timeout=10))
+        await asyncio.sleep(0)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        # wait_for only so that a regression fails instead of hanging
+        button = await asyncio.wait_for(service.check("tok-1", "qris", URL, permit_timeout=0.1), 5)
+        waited = loop.time() - started
+        # The shared check was not cancelled with the button's wait
+        api.release()
+        return button, waited, await monitor, api.calls, service.stats
+
+    button, waited, monitor, calls, stats = asyncio.run(main())
+    assert button is None and waited < 1, (button, waited)
+    assert monitor == pending()
+    assert calls == [10], calls
+    assert stats["deadline_misses"] == 1, stats
+    print("deadline: ok")
+
+
+def test_shorter_flight_is_joined_in_full():
+    async def main():
+        api = FakeAPI(pending(), gated=True)
+        service = StatusService(api, ttl_seconds=60)
+        button = asyncio.create_task(service.check("tok-1", "qris", URL, permit_timeout=0.05))
+        await asyncio.sleep(0)
+        # The monitor has the longer deadline, it just waits for the button's check
+        monitor = asyncio.create_task(service.check("tok-1", "qris", URL, permit_timeout=10))
+        await asyncio.sleep(0.1)
+        api.release()
+        return await button, await monitor, service.stats
+
+    button, monitor, stats = asyncio.run(main())
+    assert button == monitor == pending()
+    assert (stats["fetches"], stats["deadline_misses"]) == (1, 0), stats
+    print("longer deadline joins: ok")
+
+
+if __name__ == "__main__":
+    test_concurrent_checks_share_one_request()
+    test_results_reused_for_the_ttl()
+    test_terminal_results_are_published()
+    test_errors_reach_every_waiting_check()
+    test_button_does_not_wait_out_the_monitor_deadline()
+    test_shorter_flight_is_joined_in_full()
+    sys.exit(0)